@@ -0,0 +1,65 @@
+import unittest
+
+from applicability import ApplicabilityIndex
+from graph import Graph
+from production import P1, P2, P3, P4, P5, P6, P7, P8, P9, P10, P11, P12, P13, P14, P15, P16, P17
+from basic_graph import basic_grid
+
+
+def table_of(index: ApplicabilityIndex) -> dict:
+    return {
+        centre: {type(production): sorted(sorted(mapping.items()) for mapping in mappings)
+                 for production, mappings in index.applicable_at(centre).items()}
+        for centre in index.ready()
+    }
+
+
+class TestApplicabilityIndex(unittest.TestCase):
+    def productions(self):
+        return [production() for production in (P1, P2, P3, P4, P5, P6, P7, P8, P9, P10, P11, P12, P13, P14, P15, P16, P17)]
+
+    def assertAgreesWithRebuilt(self, graph: Graph, index: ApplicabilityIndex):
+        rebuilt = ApplicabilityIndex(graph, self.productions())
+        self.assertEqual(table_of(index), table_of(rebuilt))
+        rebuilt.close()
+
+    def test_marked_hyperedge_is_ready_for_p1(self):
+        graph = basic_grid(2)
+        index = ApplicabilityIndex(graph, [P1()])
+        self.assertEqual(len(index), 0)
+
+        graph.update_hyperedge_flag(9, True)
+        self.assertEqual(list(index.ready()), [9])
+        self.assertEqual(len(index.mappings(9, index.applicable_at(9).popitem()[0])), 1)
+        index.close()
+
+    def test_index_follows_rewriting(self):
+        graph = basic_grid(2)
+        index = ApplicabilityIndex(graph, self.productions())
+        self.assertAgreesWithRebuilt(graph, index)
+
+        for _ in range(6):
+            graph.update_hyperedge_flag(graph.get_hyperedge_nodes()[-1].handle, True)
+            self.assertAgreesWithRebuilt(graph, index)
+            applied = False
+            while not applied:
+                work = index.pop()
+                self.assertIsNotNone(work)
+                _, production, mappings = work
+                applied = production.apply_first_feasible(graph, mappings)
+            self.assertAgreesWithRebuilt(graph, index)
+        index.close()
+
+    def test_pop_removes_the_entry(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        index = ApplicabilityIndex(graph, [P1()])
+        ready = len(index)
+        self.assertEqual(ready, 4)
+        for _ in range(ready):
+            self.assertIsNotNone(index.pop())
+        self.assertIsNone(index.pop())
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
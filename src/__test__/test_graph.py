@@ -0,0 +1,455 @@
+import unittest
+
+from graph import Graph, NodeHandleGenerator, edge_key
+from model import Node, NodeAttrs, EdgeAttrs, Edge
+from production import P1, P2, P9
+from basic_graph import basic_grid
+from driver import Driver, FixedInput
+
+
+class TestGraphMatching(unittest.TestCase):
+    def assertSameMappings(self, graph: Graph, lhs: Graph, monomorphic: bool):
+        if monomorphic:
+            full = graph.generate_subgraphs_monomorphic_with(lhs)
+            anchored = graph.generate_subgraphs_monomorphic_with(lhs, anchored=True)
+        else:
+            full = graph.generate_subgraphs_isomorphic_with(lhs)
+            anchored = graph.generate_subgraphs_isomorphic_with(lhs, anchored=True)
+
+        full = sorted(sorted(mapping.items()) for mapping in full)
+        anchored = sorted(sorted(mapping.items()) for mapping in anchored)
+        self.assertEqual(full, anchored)
+        return anchored
+
+    def test_anchor_is_hyperedge_centre(self):
+        lhs = P1().get_lhs()
+        self.assertEqual(lhs.find_anchor(), 4)
+
+    def test_anchored_matching_generates_same_mappings(self):
+        graph = basic_grid(3, hyperedge_flag=True)
+
+        mappings = self.assertSameMappings(graph, P1().get_lhs(), monomorphic=False)
+        # every element of the grid matches, in each of 8 symmetric ways
+        self.assertEqual(len(mappings), 9 * 8)
+
+        self.assertSameMappings(graph, P2().get_lhs(), monomorphic=False)
+        self.assertSameMappings(graph, P9().get_lhs(), monomorphic=True)
+
+    def test_anchored_matching_generates_nothing_if_no_anchor_matches(self):
+        graph = basic_grid(2, hyperedge_flag=False)
+        self.assertEqual(len(list(graph.generate_subgraphs_isomorphic_with(P1().get_lhs(), anchored=True))), 0)
+
+    def test_production_applies_on_grid(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        self.assertTrue(P1()(graph))
+        self.assertEqual(len(graph.get_hyperedge_nodes()), 4 - 1 + 4)
+
+
+class TestGraphIndexes(unittest.TestCase):
+    def assertIndexesConsistent(self, graph: Graph):
+        for node in graph.get_nodes():
+            self.assertIn(node.handle, graph.nodes_with_label(node.attrs.label))
+            self.assertIn(node.handle, graph.nodes_with_label_and_flag(node.attrs.label, node.attrs.flag))
+        for edge in graph.get_edges():
+            self.assertIn(edge_key(edge.u, edge.v), graph.edges_with_kind(edge.attrs.kind))
+            self.assertIn(edge_key(edge.u, edge.v), graph.edges_with_kind_and_flag(edge.attrs.kind, edge.attrs.flag))
+
+        node_count = sum(len(graph.nodes_with_label(label)) for label in 'vqp')
+        edge_count = sum(len(graph.edges_with_kind(kind)) for kind in 'eqp')
+        self.assertEqual(node_count, len(graph.get_nodes()))
+        self.assertEqual(edge_count, len(graph.get_edges()))
+
+    def test_indexes_after_construction(self):
+        graph = basic_grid(2)
+        self.assertIndexesConsistent(graph)
+        self.assertEqual(len(graph.nodes_with_label_and_flag('q', False)), 4)
+        self.assertEqual(len(graph.nodes_with_label_and_flag('q', True)), 0)
+        self.assertEqual(len(graph.edges_with_kind('q')), 16)
+        self.assertEqual(len(graph.edges_with_kind_and_flag('e', True)), 8)
+
+    def test_indexes_follow_flag_updates(self):
+        graph = basic_grid(2)
+        marked = graph.get_hyperedge_nodes()[0].handle
+        view = graph.nodes_with_label_and_flag('q', True)
+
+        graph.update_hyperedge_flag(marked, True)
+
+        self.assertEqual(list(view), [marked])
+        self.assertEqual(len(graph.edges_with_kind_and_flag('q', True)), 4)
+        self.assertIndexesConsistent(graph)
+
+    def test_indexes_follow_productions(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        for production in (P1(), P2(), P2()):
+            self.assertTrue(production(graph))
+            self.assertIndexesConsistent(graph)
+        self.assertEqual(len(graph.nodes_with_label_and_flag('q', False)), 12)
+
+    def test_removing_node_unindexes_its_edges(self):
+        graph = basic_grid(1)
+        q_handle = graph.get_hyperedge_nodes()[0].handle
+        graph.remove_q_hyperedge(q_handle)
+        self.assertEqual(len(graph.edges_with_kind('q')), 0)
+        self.assertIndexesConsistent(graph)
+
+
+class TestHyperedgeTable(unittest.TestCase):
+    def assertTableConsistent(self, graph: Graph):
+        hyperedge_nodes = graph.get_hyperedge_nodes()
+        self.assertEqual(set(graph.hyperedges()), {node.handle for node in hyperedge_nodes})
+        for node in hyperedge_nodes:
+            hyperedge = graph.hyperedge(node.handle)
+            star_corners = {neigh for neigh, attrs in graph.adjacent_edges(node.handle) if attrs.kind == node.attrs.label}
+            self.assertEqual(set(hyperedge.corners), star_corners)
+            self.assertEqual((hyperedge.kind, hyperedge.flag), (node.attrs.label, node.attrs.flag))
+            for corner in hyperedge.corners:
+                self.assertIn(node.handle, graph.hyperedges_of(corner))
+
+    def test_table_after_construction(self):
+        graph = basic_grid(2)
+        self.assertTableConsistent(graph)
+        self.assertEqual(graph.hyperedge(9).corners, (0, 1, 4, 3))
+        # Centre vertex of the grid is a corner of all four elements
+        self.assertEqual(set(graph.hyperedges_of(4)), {9, 10, 11, 12})
+
+    def test_table_follows_productions(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        for production in (P1(), P2(), P2()):
+            self.assertTrue(production(graph))
+            self.assertTableConsistent(graph)
+        self.assertEqual(len(graph.hyperedges()), 13)
+
+    def test_removing_corner_detaches_it(self):
+        graph = basic_grid(1)
+        graph.remove_node(0)
+        self.assertEqual(graph.hyperedge(4).corners, (1, 3, 2))
+        self.assertEqual(len(graph.hyperedges_of(0)), 0)
+        graph.remove_q_hyperedge(4)
+        self.assertFalse(graph.is_hyperedge(4))
+        self.assertEqual(len(graph.hyperedges_of(1)), 0)
+
+
+class TestEdgeSplitIndex(unittest.TestCase):
+    def test_productions_record_splits(self):
+        graph = basic_grid(2)
+        graph.update_hyperedge_flag(9, True)
+        self.assertTrue(P1()(graph))
+        self.assertEqual(set(graph.split_edges()), {edge_key(0, 1), edge_key(1, 4), edge_key(3, 4), edge_key(0, 3)})
+
+        midpoint = graph.midpoint_of(4, 1)
+        self.assertEqual(graph.get_node_between((1, 4)).handle, midpoint)
+        self.assertTrue(graph[midpoint].flag)
+
+        # Neighbour absorbs the hanging node, the split stays
+        graph.update_hyperedge_flag(10, True)
+        self.assertTrue(P2()(graph))
+        self.assertEqual(graph.midpoint_of(1, 4), midpoint)
+        self.assertFalse(graph[midpoint].flag)
+        self.assertEqual(len(graph.split_edges()), 7)
+
+    def test_split_is_forgotten_with_its_halves(self):
+        graph = basic_grid(1)
+        midpoint = graph.split_edge_with_vnode((0, 1)).handle
+        graph.split_edge_with_vnode((0, midpoint))
+        self.assertIsNone(graph.midpoint_of(0, 1))
+        self.assertEqual(len(graph.split_edges()), 1)
+
+        graph.remove_node(0)
+        self.assertEqual(len(graph.split_edges()), 0)
+
+    def test_node_between_unindexed_split(self):
+        graph = Graph()
+        handles = graph.add_node_collection(Node(NodeAttrs('v', x, 0, False)) for x in range(3))
+        graph.add_edge(Edge(handles[0], handles[1], EdgeAttrs('e', True)))
+        graph.add_edge(Edge(handles[1], handles[2], EdgeAttrs('e', True)))
+        self.assertEqual(graph.get_node_between((handles[0], handles[2])).handle, handles[1])
+
+
+class TestViews(unittest.TestCase):
+    def test_views_match_lists(self):
+        graph = basic_grid(2)
+        real_nodes = graph.nodes_view('v')
+        self.assertEqual([node.handle for node in real_nodes], [node.handle for node in graph.get_real_nodes()])
+        self.assertEqual(len(real_nodes), 9)
+        self.assertEqual(real_nodes[-1].handle, 8)
+        self.assertEqual(real_nodes[3].handle, 3)
+        self.assertEqual([node.handle for node in real_nodes[1:3]], [1, 2])
+        self.assertIn(4, real_nodes)
+        self.assertNotIn(9, real_nodes)
+
+        edges = graph.edges_view('e', flag=True)
+        self.assertEqual(len(edges), 8)
+        self.assertIn((1, 0), edges)
+        self.assertNotIn(Edge(1, 4, EdgeAttrs('e', False)), edges)
+        self.assertEqual(len(graph.edges_view(('q', 'p'))), len(graph.get_hyperedge_edges()))
+
+    def test_views_are_live(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        marked = graph.nodes_view('q', flag=True)
+        self.assertEqual(len(marked), 4)
+        first = marked[0].handle
+        self.assertTrue(P1()(graph))
+        self.assertEqual(len(marked), 3)
+        self.assertNotIn(first, [node.handle for node in graph.get_hyperedge_nodes() if node.attrs.flag])
+        self.assertEqual([marked[i].handle for i in range(len(marked))], [node.handle for node in marked])
+        self.assertEqual(len(graph.nodes_view('q', flag=False)), 4)
+
+    def test_generation_changes_with_mutations_only(self):
+        graph = basic_grid(1)
+        generation = graph.generation
+        graph.get_real_edges()
+        graph.find_edge_attrs(0, 1)
+        self.assertEqual(graph.generation, generation)
+
+        graph.update_hyperedge_flag(4, True)
+        self.assertGreater(graph.generation, generation)
+        generation = graph.generation
+        graph.split_edge_with_vnode((0, 1))
+        self.assertGreater(graph.generation, generation)
+
+
+class TestNodeHandleGenerator(unittest.TestCase):
+    def test_claimed_handles_are_skipped(self):
+        generator = NodeHandleGenerator()
+        self.assertEqual([generator(), generator()], [0, 1])
+        generator.claim(5)
+        self.assertEqual(generator(), 6)
+        self.assertEqual(list(generator.reserve(3)), [7, 8, 9])
+        self.assertEqual(generator(), 10)
+
+    def test_released_handles_are_reused(self):
+        generator = NodeHandleGenerator()
+        generator.reserve(4)
+        generator.release(1)
+        generator.release(2)
+        generator.claim(2)
+        self.assertEqual([generator(), generator()], [1, 4])
+
+    def test_graph_mixing_explicit_and_generated_handles(self):
+        graph = Graph()
+        graph.add_node(Node(NodeAttrs('v', 0, 0, False), 3))
+        handles = [graph.add_node(Node(NodeAttrs('v', 0, 0, False))) for _ in range(2)]
+        self.assertEqual(handles, [4, 5])
+
+        graph.remove_node(4)
+        self.assertEqual(graph.add_node(Node(NodeAttrs('v', 0, 0, False))), 6)
+
+    def test_graph_reusing_handles(self):
+        graph = Graph(reuse_node_handles=True)
+        graph.add_node_collection(Node(NodeAttrs('v', 0, 0, False)) for _ in range(3))
+        graph.remove_node(1)
+        self.assertEqual(graph.add_node(Node(NodeAttrs('v', 0, 0, False))), 1)
+        self.assertEqual(graph.add_node(Node(NodeAttrs('v', 0, 0, False))), 3)
+
+
+
+def graph_state(graph: Graph) -> tuple:
+    nodes = sorted((node.handle, node.attrs.label, node.attrs.x, node.attrs.y, node.attrs.flag) for node in graph.get_nodes())
+    edges = sorted((*edge_key(edge.u, edge.v), edge.attrs.kind, edge.attrs.flag) for edge in graph.get_edges())
+    hyperedges = sorted((handle, graph.hyperedge(handle)) for handle in graph.hyperedges())
+    corners_of = sorted((node[0], sorted(graph.hyperedges_of(node[0]))) for node in nodes)
+    splits = sorted((parent, graph.midpoint_of(*parent)) for parent in graph.split_edges())
+    indexes = [sorted(graph.nodes_with_label_and_flag(label, flag)) for label in 'vqp' for flag in (True, False, None)]
+    indexes += [sorted(graph.edges_with_kind_and_flag(kind, flag)) for kind in 'eqp' for flag in (True, False)]
+    return nodes, edges, hyperedges, corners_of, splits, indexes
+
+
+class FailingP1(P1):
+    def apply_with_mapping(self, graph, mapping):
+        super().apply_with_mapping(graph, mapping)
+        assert False, "failing on purpose"
+
+
+class TestTransactions(unittest.TestCase):
+    def test_rollback_restores_graph(self):
+        graph = basic_grid(3)
+        graph.update_hyperedge_flag(20, True)
+        P1()(graph)
+        before = graph_state(graph)
+
+        graph.begin()
+        graph.update_hyperedge_flag(17, True)
+        self.assertTrue(P2()(graph))
+        graph.move_node(0, -1, -1)
+        graph.remove_node(1)
+        graph.add_edge(Edge(0, 2, EdgeAttrs('e', True)))
+        self.assertNotEqual(graph_state(graph), before)
+        graph.rollback()
+
+        self.assertEqual(graph_state(graph), before)
+        self.assertFalse(graph.in_transaction)
+        # generated handles continue as if nothing happened
+        self.assertEqual(graph.add_node(Node(NodeAttrs('v', 0, 0, False))), max(node[0] for node in before[0]) + 1)
+
+    def test_nested_transactions(self):
+        graph = basic_grid(2)
+        before = graph_state(graph)
+
+        with self.assertRaises(AssertionError):
+            with graph.transaction():
+                graph.update_hyperedge_flag(9, True)
+                with graph.transaction():
+                    graph.update_hyperedge_flag(10, True)
+                graph.begin()
+                graph.update_hyperedge_flag(11, True)
+                graph.rollback()
+                self.assertEqual(list(graph.nodes_with_label_and_flag('q', True)), [9, 10])
+                assert False
+
+        self.assertEqual(graph_state(graph), before)
+
+    def test_commit_keeps_mutations(self):
+        graph = basic_grid(2)
+        with graph.transaction():
+            graph.update_hyperedge_flag(9, True)
+        self.assertTrue(graph.hyperedge(9).flag)
+        self.assertFalse(graph.in_transaction)
+
+    def test_failing_production_leaves_graph_intact(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        matcher = P1().create_matcher(graph)
+        before = graph_state(graph)
+
+        with self.assertRaises(AssertionError):
+            FailingP1()(graph)
+
+        self.assertEqual(graph_state(graph), before)
+        self.assertEqual(len(list(matcher.mappings())), 4)
+        matcher.close()
+
+
+def break_element(graph: Graph, target, centre: int):
+    """ Rhs of P1 for element with given centre, written against either the graph or its `GraphRewrite`. """
+    corners = [graph.node_for_handle(handle) for handle in graph.hyperedge(centre).corners]
+    midpoints = [target.split_edge_with_vnode((node_a.handle, node_b.handle))
+                 for node_a, node_b in zip(corners, corners[1:] + corners[:1])]
+    central_node = Node(NodeAttrs('v', graph[centre].x, graph[centre].y, False))
+    target.add_node(central_node)
+    for node in midpoints:
+        target.add_edge(Edge(node.handle, central_node.handle, EdgeAttrs('e', False)))
+    target.remove_q_hyperedge(centre)
+    for corner, (node_a, node_b) in zip(corners, zip([midpoints[-1]] + midpoints, midpoints)):
+        target.add_q_hyperedge((corner, node_a, node_b, central_node), EdgeAttrs('q', False))
+
+
+class TestGraphRewrite(unittest.TestCase):
+    def test_rewrite_gives_same_graph_as_direct_mutations(self):
+        expected = basic_grid(3)
+        break_element(expected, expected, 20)
+
+        graph = basic_grid(3)
+        journal = graph.create_journal()
+        with graph.rewrite() as rewrite:
+            break_element(graph, rewrite, 20)
+        self.assertEqual(graph_state(graph), graph_state(expected))
+        self.assertIn(20, journal.removed_nodes)
+        self.assertEqual(len(journal.added_nodes), 9)
+
+    def test_mutations_are_applied_on_commit(self):
+        graph = basic_grid(2)
+        before = graph_state(graph)
+        rewrite = graph.rewrite()
+        handle = rewrite.add_node(Node(NodeAttrs('v', 2, 2, False)))
+        rewrite.add_edge(Edge(handle, 8, EdgeAttrs('e', True)))
+        rewrite.update_hyperedge_flag(9, True)
+        self.assertEqual(graph_state(graph), before)
+
+        rewrite.commit()
+        self.assertIn(handle, graph)
+        self.assertIsNotNone(graph.find_edge_attrs(8, handle))
+        self.assertTrue(graph.hyperedge(9).flag)
+        self.assertNotEqual(graph.add_node(Node(NodeAttrs('v', 3, 3, False))), handle)
+
+    def test_hyperedge_handle_can_be_reused_in_one_rewrite(self):
+        graph = basic_grid(2)
+        corners = [graph.node_for_handle(handle) for handle in graph.hyperedge(9).corners]
+        with graph.rewrite() as rewrite:
+            rewrite.remove_q_hyperedge(9)
+            rewrite.add_q_hyperedge(corners, EdgeAttrs('q', True), 9)
+        self.assertTrue(graph.hyperedge(9).flag)
+        self.assertEqual(graph.hyperedge(9).corners, tuple(corner.handle for corner in corners))
+
+    def test_graph_must_not_be_mutated_while_building(self):
+        graph = basic_grid(2)
+        rewrite = graph.rewrite()
+        rewrite.add_node(Node(NodeAttrs('v', 2, 2, False)))
+        graph.add_node(Node(NodeAttrs('v', 3, 3, False)))
+        with self.assertRaises(AssertionError):
+            rewrite.commit()
+
+    def test_rewrite_is_undone_by_rollback(self):
+        graph = basic_grid(3)
+        before = graph_state(graph)
+        graph.begin()
+        with graph.rewrite() as rewrite:
+            break_element(graph, rewrite, 20)
+        graph.rollback()
+        self.assertEqual(graph_state(graph), before)
+
+
+
+class TestSnapshots(unittest.TestCase):
+    def test_branches_can_be_switched(self):
+        graph = basic_grid(3)
+        base = graph_state(graph)
+        snapshot = graph.snapshot()
+
+        graph.update_hyperedge_flag(20, True)
+        P1()(graph)
+        state_a = graph_state(graph)
+        delta_a = graph.revert(snapshot)
+        self.assertEqual(graph_state(graph), base)
+
+        graph.update_hyperedge_flag(16, True)
+        P1()(graph)
+        graph.update_hyperedge_flag(17, True)
+        P2()(graph)
+        state_b = graph_state(graph)
+        delta_b = graph.revert(snapshot)
+        self.assertEqual(graph_state(graph), base)
+
+        graph.replay(delta_a)
+        self.assertEqual(graph_state(graph), state_a)
+        graph.revert(snapshot)
+        graph.replay(delta_b)
+        self.assertEqual(graph_state(graph), state_b)
+
+        graph.release(snapshot)
+        self.assertFalse(graph.in_transaction)
+        self.assertEqual(graph_state(graph), state_b)
+
+    def test_delta_is_proportional_to_touched_elements(self):
+        graph = basic_grid(30)
+        snapshot = graph.snapshot()
+        graph.update_hyperedge_flag(list(graph.hyperedges())[100], True)
+        P1()(graph)
+        delta = graph.revert(snapshot)
+        graph.release(snapshot)
+        self.assertLess(len(delta), 200)
+
+    def test_delta_replays_only_on_its_base_state(self):
+        graph = basic_grid(2)
+        snapshot = graph.snapshot()
+        graph.update_hyperedge_flag(9, True)
+        delta = graph.revert(snapshot)
+        graph.update_hyperedge_flag(10, True)
+        with self.assertRaises(AssertionError):
+            graph.replay(delta)
+        graph.release(snapshot)
+
+    def test_driver_forks_derivation(self):
+        graph = basic_grid(2)
+        base = graph_state(graph)
+        results = Driver().fork(graph, [
+            [FixedInput(9), P1()],
+            [FixedInput(9), P1(), FixedInput(10), P2()],
+        ], evaluate=lambda graph: len(graph.hyperedges()))
+
+        self.assertEqual([count for count, _ in results], [7, 10])
+        self.assertEqual(graph_state(graph), base)
+        graph.replay(results[1][1])
+        self.assertEqual(len(graph.hyperedges()), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
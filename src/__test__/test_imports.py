@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+# Modules batch workers import; none of them may pull in the plotting stack
+CORE_MODULES = ('graph', 'model', 'production', 'driver', 'matching', 'applicability', 'refinement', 'basic_graph')
+PLOTTING_PACKAGES = ('matplotlib', 'PIL', 'pyparsing')
+# Generous upper bound of the cold import of the core, in seconds; plotting stack alone used to take ~0.5s
+IMPORT_TIME_BUDGET = 1.0
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_in_fresh_interpreter(code: str, *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *options, '-c', code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+
+
+def cumulative_import_time(module: str, stderr: str) -> float:
+    """ Returns cumulative import time (in seconds) of given module from `python -X importtime` output, if it was
+    imported directly by the main module (nested imports are indented & already counted by their importers).
+    """
+    for line in stderr.splitlines():
+        fields = line.removeprefix('import time:').split('|')
+        if len(fields) == 3 and fields[2] == f' {module}':
+            return int(fields[1]) / 1e6
+    return 0.0
+
+
+class TestHeadlessCore(unittest.TestCase):
+    def test_core_does_not_import_plotting_stack(self):
+        result = run_in_fresh_interpreter(
+            f"import sys\nimport {', '.join(CORE_MODULES)}\n"
+            f"print(sorted({{name.split('.')[0] for name in sys.modules}} & set({PLOTTING_PACKAGES!r})))"
+        )
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_drawing_delegate_is_still_importable_from_driver(self):
+        result = run_in_fresh_interpreter("from driver import DrawingDriverDelegate; print(DrawingDriverDelegate.__module__)")
+        self.assertEqual(result.stdout.strip(), 'visualisation')
+
+    def test_import_time_benchmark(self):
+        # Best of a few runs, so that a cold disk cache does not fail the benchmark
+        timings = []
+        for _ in range(3):
+            stderr = run_in_fresh_interpreter(f"import {', '.join(CORE_MODULES)}", '-X', 'importtime').stderr
+            timings.append(sum(cumulative_import_time(module, stderr) for module in CORE_MODULES))
+        self.assertLess(min(timings), IMPORT_TIME_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import unittest
+
+from graph import Graph
+from matching import IncrementalMatcher, CompiledPattern
+from production import Production, P1, P2, P3, P4, P5, P6, P7, P8, P9, P10, P11, P12, P13, P14, P15, P16, P17
+from basic_graph import basic_grid
+from driver import Driver, FixedInput, ApplyAll, ApplyAt
+
+
+def canonical(mappings) -> list:
+    return sorted(sorted(mapping.items()) for mapping in mappings)
+
+
+class TestIncrementalMatcher(unittest.TestCase):
+    def assertUpToDate(self, graph: Graph, matcher: IncrementalMatcher, production: Production):
+        self.assertEqual(canonical(matcher.mappings()), canonical(production.generate_mappings(graph)))
+
+    def test_matches_follow_mutations(self):
+        graph = basic_grid(3)
+        productions = (P1(), P2(), P3(), P7(), P8())
+        matchers = [production.create_matcher(graph) for production in productions]
+
+        marked = graph.get_hyperedge_nodes()[4].handle
+        graph.update_hyperedge_flag(marked, True)
+        for matcher, production in zip(matchers, productions):
+            self.assertUpToDate(graph, matcher, production)
+
+        self.assertTrue(P1()(graph))
+        for matcher, production in zip(matchers, productions):
+            self.assertUpToDate(graph, matcher, production)
+
+        for matcher in matchers:
+            matcher.close()
+
+    def test_closed_matcher_stops_tracking(self):
+        graph = basic_grid(1)
+        matcher = P7().create_matcher(graph)
+        matcher.close()
+        self.assertEqual(len(graph._journals), 0)
+
+    def test_incremental_driver_gives_same_result(self):
+        sequence = lambda: [FixedInput(9), P1(), FixedInput(10), P2(), FixedInput(11), P2()]
+        results = []
+        for incremental in (False, True):
+            graph = basic_grid(2)
+            Driver(incremental=incremental).execute_production_sequence(graph, sequence())
+            results.append(sorted((node.attrs.label, node.attrs.x, node.attrs.y, node.attrs.flag) for node in graph.get_nodes()))
+
+        self.assertEqual(results[0], results[1])
+
+    def test_incremental_driver_applies_on_all_matches(self):
+        for incremental in (False, True):
+            graph = basic_grid(4, hyperedge_flag=True)
+            Driver(incremental=incremental).execute_production_sequence(graph, [ApplyAll(P1())])
+            self.assertEqual(len(graph.nodes_with_label_and_flag('q', True)), 12)
+
+    def test_driver_applies_at_given_element(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        Driver().execute_production_sequence(graph, [ApplyAt(P1(), FixedInput(11))])
+        self.assertEqual(list(graph.nodes_with_label_and_flag('q', True)), [9, 10, 12])
+
+
+ALL_PRODUCTIONS = (P1, P2, P3, P4, P5, P6, P7, P8, P9, P10, P11, P12, P13, P14, P15, P16, P17)
+
+
+class TestSearchPlan(unittest.TestCase):
+    def hosts(self) -> list[Graph]:
+        hosts = [production().create_lhs() for production in ALL_PRODUCTIONS]
+
+        grid = basic_grid(3)
+        grid.update_hyperedge_flag(grid.get_hyperedge_nodes()[4].handle, True)
+        hosts.append(basic_grid(3))
+        hosts.append(grid)
+        return hosts
+
+    def test_plans_generate_one_mapping_per_subgraph(self):
+        hosts = self.hosts()
+        for production in ALL_PRODUCTIONS:
+            prod = production()
+            compiled = CompiledPattern(prod.get_lhs(), prod.requires_monomorphism())
+            self.assertTrue(compiled.is_compiled())
+            for host in hosts:
+                if prod.requires_monomorphism():
+                    expected = list(host.generate_subgraphs_monomorphic_with(prod.get_lhs()))
+                else:
+                    expected = list(host.generate_subgraphs_isomorphic_with(prod.get_lhs()))
+                mappings = list(compiled.generate_mappings(host))
+
+                # every match found by VF2 is a symmetric image of exactly one of the generated mappings
+                symmetric = canonical(
+                    {host_handle: automorphism[lhs_handle] for host_handle, lhs_handle in mapping.items()}
+                    for mapping in mappings for automorphism in compiled.automorphisms
+                )
+                self.assertEqual(symmetric, canonical(expected), f'{prod}')
+                self.assertEqual(len(mappings) * len(compiled.automorphisms), len(expected), f'{prod}')
+
+    def test_plans_without_deduplication_generate_same_mappings_as_vf2(self):
+        host = self.hosts()[-1]
+        for production in (P1, P7, P9):
+            prod = production()
+            compiled = CompiledPattern(prod.get_lhs(), prod.requires_monomorphism(), deduplicate=False)
+            if prod.requires_monomorphism():
+                expected = host.generate_subgraphs_monomorphic_with(prod.get_lhs())
+            else:
+                expected = host.generate_subgraphs_isomorphic_with(prod.get_lhs())
+            self.assertEqual(canonical(compiled.generate_mappings(host)), canonical(expected), f'{prod}')
+
+    def test_deduplication_can_be_turned_off_per_production(self):
+        class AllMappingsP1(P1):
+            deduplicate_matches = False
+
+        host = P1().create_lhs()
+        self.assertEqual(len(list(P1().generate_mappings(host))), 1)
+        self.assertEqual(len(list(AllMappingsP1().generate_mappings(host))), 8)
+
+    def test_automorphisms(self):
+        self.assertEqual(len(CompiledPattern(P1().get_lhs()).automorphisms), 8)
+        self.assertEqual(len(CompiledPattern(P9().get_lhs(), monomorphic=True).automorphisms), 10)
+
+    def test_productions_apply_on_own_lhs_with_both_matchers(self):
+        for production in (P1, P9, P16):
+            for use_search_plan in (True, False):
+                prod = production()
+                prod.use_search_plan = use_search_plan
+                self.assertTrue(prod(production().create_lhs()))
+
+
+class TestSharedLhs(unittest.TestCase):
+    def test_lhs_is_built_once_per_class(self):
+        self.assertIs(P1().get_lhs(), P1().get_lhs())
+        self.assertIs(P1().get_compiled_lhs(), P1().get_compiled_lhs())
+        self.assertIsNot(P1().get_lhs(), P2().get_lhs())
+
+    def test_shared_lhs_is_frozen(self):
+        lhs = P1().get_lhs()
+        self.assertTrue(lhs.is_frozen)
+        with self.assertRaises(RuntimeError):
+            lhs.update_node_flag(lhs.find_anchor(), False)
+        with self.assertRaises(RuntimeError):
+            lhs.remove_node(0)
+
+    def test_label_counts_reject_graphs_without_enough_nodes(self):
+        compiled = P1().get_compiled_lhs()
+        self.assertEqual(compiled.label_counts, {'v': 4, 'q': 1})
+        self.assertEqual(compiled.degree_signature[0], 4)
+        self.assertFalse(compiled.could_match(basic_grid(2, hyperedge_flag=False)))
+        self.assertTrue(compiled.could_match(basic_grid(2, hyperedge_flag=True)))
+
+
+class LeftColumnP1(P1):
+    """ P1 restricted to elements of the left column, with lhs node 0 -> 1 pointing right """
+    def node_predicates(self):
+        return {4: lambda graph, host: graph[host].x < 1}
+
+    def edge_predicates(self):
+        return {(0, 1): lambda graph, u, v: graph[u].x < graph[v].x and graph[u].y == graph[v].y}
+
+
+class RejectingP1(P1):
+    calls = 0
+
+    def is_partial_mapping_feasible(self, graph, partial):
+        RejectingP1.calls += 1
+        return False
+
+
+class TestMatchConstraints(unittest.TestCase):
+    def test_constraints_are_checked_during_search(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        prod = LeftColumnP1()
+        mappings = list(prod.generate_mappings(graph))
+
+        # two elements, each matched in two orientations (reflected along horizontal axis)
+        self.assertEqual(len(mappings), 4)
+        self.assertEqual({mapping_centre for mapping in mappings for mapping_centre, handle in mapping.items() if handle == 4}, {9, 11})
+
+        prod.use_search_plan = False
+        self.assertEqual(canonical(prod.generate_mappings(graph)), canonical(mappings))
+
+    def test_constraints_apply_to_anchored_and_incremental_matching(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        prod = LeftColumnP1()
+        self.assertFalse(prod.apply_at(graph, 10))
+
+        matcher = prod.create_matcher(graph)
+        self.assertEqual(len(list(matcher.mappings())), 4)
+        self.assertTrue(prod.apply_at(graph, 9))
+        # the element above got a hanging node, so it does not match anymore
+        self.assertEqual(list(matcher.mappings()), [])
+        matcher.close()
+
+    def test_partial_mapping_hook_prunes_at_the_anchor(self):
+        graph = basic_grid(3, hyperedge_flag=True)
+        RejectingP1.calls = 0
+        self.assertEqual(list(RejectingP1().generate_mappings(graph)), [])
+        self.assertEqual(RejectingP1.calls, 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
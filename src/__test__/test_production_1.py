@@ -5,6 +5,7 @@ from copy import deepcopy
 from graph import Graph
 from model import Node, NodeAttrs, EdgeAttrs, Edge
 from production import P1
+from basic_graph import basic_grid
 
 
 class TestProduction1(unittest.TestCase):
@@ -110,6 +111,42 @@ class TestProduction1(unittest.TestCase):
         mapping_gen = graph.generate_subgraphs_isomorphic_with(p1.get_lhs())
         self.assertFalse(any(p1.is_mapping_feasible(graph, mapping) for mapping in mapping_gen))
 
+    def test_production_can_be_applied_on_all_independent_matches(self):
+        graph = basic_grid(4, hyperedge_flag=True)
+
+        count = P1().apply_all(graph)
+
+        # elements sharing a corner can not be refined in the same step
+        self.assertEqual(count, 4)
+        self.assertEqual(len(graph.get_hyperedge_nodes()), 16 - count + 4 * count)
+        self.assertEqual(len(graph.nodes_with_label_and_flag('q', True)), 16 - count)
+
+    def test_production_applied_on_all_matches_fails_without_marked_element(self):
+        graph = basic_grid(2, hyperedge_flag=False)
+        self.assertEqual(P1().apply_all(graph), 0)
+
+    def test_production_is_applied_at_given_element(self):
+        for use_search_plan in (True, False):
+            graph = basic_grid(2, hyperedge_flag=True)
+            p1 = P1()
+            p1.use_search_plan = use_search_plan
+
+            self.assertTrue(p1.apply_at(graph, 12))
+
+            self.assertFalse(graph.is_hyperedge(12))
+            self.assertEqual(sorted((graph[centre].x, graph[centre].y) for centre in graph.hyperedges()),
+                             [(0.5, 0.5), (0.5, 1.5), (1.25, 1.25), (1.25, 1.75), (1.5, 0.5), (1.75, 1.25), (1.75, 1.75)])
+
+    def test_production_is_not_applied_where_lhs_does_not_match(self):
+        graph = basic_grid(2, hyperedge_flag=True)
+        graph.update_hyperedge_flag(10, False)
+        p1 = P1()
+
+        self.assertFalse(p1.apply_at(graph, 10))  # element not marked
+        self.assertFalse(p1.apply_at(graph, 0))  # not a hyperedge
+        self.assertFalse(p1.apply_at(graph, 1000))  # no such node
+        self.assertEqual(len(graph.hyperedges()), 4)
+
 
 if __name__ == '__main__':
     unittest.main()
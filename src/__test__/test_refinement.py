@@ -0,0 +1,64 @@
+import unittest
+
+import networkx as nx
+
+from graph import Graph
+from refinement import RefinementEngine
+from production import P1, P2, P3, P8, P9, P16
+from driver import Driver, FixedInput, Refine
+from basic_graph import basic_grid
+from example import derivation_1
+
+
+def geometric_graph(graph: Graph) -> nx.Graph:
+    result = nx.Graph()
+    for node in graph.get_nodes():
+        attrs = node.attrs
+        result.add_node(node.handle, key=(attrs.label, round(attrs.x, 6), round(attrs.y, 6), attrs.flag))
+    for edge in graph.get_edges():
+        result.add_edge(edge.u, edge.v, key=(edge.attrs.kind, edge.attrs.flag))
+    return result
+
+
+class TestRefinementEngine(unittest.TestCase):
+    def assertSameMesh(self, graph_1: Graph, graph_2: Graph):
+        self.assertTrue(nx.is_isomorphic(geometric_graph(graph_1), geometric_graph(graph_2),
+                                         node_match=lambda a, b: a['key'] == b['key'],
+                                         edge_match=lambda a, b: a['key'] == b['key']))
+
+    def hand_refined(self) -> Graph:
+        graph = derivation_1.create_graph()
+        Driver().execute_production_sequence(graph, [
+            P16(), P9(), FixedInput(23), P8(), P8(), P2(), P3(), P1(),
+        ])
+        return graph
+
+    def test_closure_gives_same_mesh_as_hand_written_sequence(self):
+        expected = self.hand_refined()
+
+        graph = derivation_1.create_graph()
+        Driver().execute_production_sequence(graph, [P16(), P9()])
+        engine = RefinementEngine(graph)
+        self.assertEqual(engine.refine([23]), 5)
+        engine.close()
+
+        self.assertSameMesh(expected, graph)
+
+    def test_all_marked_elements_get_broken(self):
+        graph = basic_grid(6)
+        marks = list(graph.hyperedges())[::3]
+        engine = RefinementEngine(graph)
+        self.assertEqual(engine.refine(marks), len(marks))
+        engine.close()
+
+        self.assertEqual(len(graph.hyperedges()), 36 + 3 * len(marks))
+        self.assertFalse(any(graph.hyperedge(centre).flag for centre in graph.hyperedges()))
+
+    def test_refine_step_of_driver(self):
+        graph = derivation_1.create_graph()
+        Driver().execute_production_sequence(graph, [P16(), P9(), Refine(FixedInput(23))])
+        self.assertSameMesh(self.hand_refined(), graph)
+
+
+if __name__ == '__main__':
+    unittest.main()
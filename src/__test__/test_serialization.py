@@ -0,0 +1,118 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from graph import Graph
+from model import Node, NodeAttrs
+from storage import NetworkxStorage, ArrayStorage, LABEL_CODES, KIND_CODES, FLAG_CODES
+from serialization import write_container, read_container, FORMAT_VERSION
+from production import P1, P2
+from driver import Driver, FixedInput
+from basic_graph import basic_grid
+from __test__.test_storage import storage_contents
+
+
+def graph_state(graph: Graph, edge_handles: bool = True) -> tuple:
+    """ Everything that is saved, with indexes compared as sets, as their order is not preserved """
+    nodes = {(label, flag): set(graph.nodes_with_label_and_flag(label, flag)) for label in LABEL_CODES for flag in FLAG_CODES}
+    edges = {(kind, flag): set(graph.edges_with_kind_and_flag(kind, flag)) for kind in KIND_CODES for flag in FLAG_CODES}
+    return (storage_contents(graph.storage, edge_handles), dict(graph._hyperedges), graph._hyperedges_of_node,
+            graph._edge_splits, graph._split_parents, graph._node_handle_factory.state(), nodes, edges,
+            {label: set(graph.nodes_with_label(label)) for label in LABEL_CODES},
+            {kind: set(graph.edges_with_kind(kind)) for kind in KIND_CODES})
+
+
+class TestGraphSerialization(unittest.TestCase):
+    def derived_graph(self) -> Graph:
+        graph = basic_grid(2, storage=ArrayStorage())
+        Driver().execute_production_sequence(graph, [FixedInput(9), P1()])
+        graph.reserve_node_handles(3)
+        return graph
+
+    def test_round_trip(self):
+        graph = self.derived_graph()
+        self.assertGreater(len(graph.split_edges()), 0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, 'graph.bin')
+            graph.save(path)
+            loaded = Graph.load(path)
+            self.assertIsInstance(loaded.storage, ArrayStorage)
+            self.assertEqual(graph_state(loaded), graph_state(graph))
+
+    def test_loaded_graph_is_saved_before_building_hyperedge_table(self):
+        graph = self.derived_graph()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, 'graph.bin')
+            graph.save(path)
+            # Overwrites the very file the graph has been loaded from
+            Graph.load(path).save(path)
+            self.assertEqual(graph_state(Graph.load(path)), graph_state(graph))
+
+    def test_only_array_storage_can_be_saved(self):
+        with self.assertRaises(AssertionError):
+            basic_grid(1, storage=NetworkxStorage()).save(io.BytesIO())
+
+    def test_loaded_graph_derives_the_same_mesh(self):
+        graph = self.derived_graph()
+        stream = io.BytesIO()
+        graph.save(stream)
+        stream.seek(0)
+        loaded = Graph.load(stream)
+
+        for derived in (graph, loaded):
+            Driver().execute_production_sequence(derived, [FixedInput(10), P2()])
+        # Edge handles are drawn from one global counter, so the new edges of both graphs get different ones
+        self.assertEqual(graph_state(loaded, edge_handles=False), graph_state(graph, edge_handles=False))
+
+    def test_released_handles_are_reused_after_loading(self):
+        graph = Graph(ArrayStorage(), reuse_node_handles=True)
+        handles = [graph.add_node(Node(NodeAttrs('v', i, 0, False))) for i in range(4)]
+        graph.remove_node(handles[1])
+        stream = io.BytesIO()
+        graph.save(stream)
+        stream.seek(0)
+        loaded = Graph.load(stream)
+
+        self.assertEqual(graph_state(loaded), graph_state(graph))
+        self.assertEqual(loaded.add_node(Node(NodeAttrs('v', 1, 1, False))), handles[1])
+
+    def test_empty_graph(self):
+        stream = io.BytesIO()
+        Graph(ArrayStorage()).save(stream)
+        stream.seek(0)
+        self.assertEqual(graph_state(Graph.load(stream)), graph_state(Graph(ArrayStorage())))
+
+
+class TestContainer(unittest.TestCase):
+    def test_arrays_are_memory_mapped_read_only(self):
+        arrays = {'a': np.arange(10, dtype=np.int8), 'b': np.linspace(0, 1, 6).reshape(2, 3), 'c': np.zeros(0, dtype=np.int64)}
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, 'container.bin')
+            write_container(path, iter(arrays.items()), {'answer': 42})
+            container = read_container(path)
+
+            self.assertEqual((container.version, container.meta), (FORMAT_VERSION, {'answer': 42}))
+            self.assertEqual(container.arrays.keys(), arrays.keys())
+            for name, array in arrays.items():
+                np.testing.assert_array_equal(container.arrays[name], array)
+                self.assertEqual(container.arrays[name].dtype, array.dtype)
+                self.assertFalse(container.arrays[name].flags.writeable)
+            self.assertIsInstance(container.arrays['b'].base, np.memmap)
+            del container
+
+    def test_rejects_foreign_and_newer_files(self):
+        stream = io.BytesIO()
+        write_container(stream, [], {})
+        data = stream.getvalue()
+
+        with self.assertRaises(ValueError):
+            read_container(io.BytesIO(b'not a graph' * 10))
+        with self.assertRaises(ValueError):
+            read_container(io.BytesIO(data[:6] + (FORMAT_VERSION + 1).to_bytes(2, 'little') + data[8:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
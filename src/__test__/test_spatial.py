@@ -0,0 +1,74 @@
+import random
+import unittest
+
+from spatial import QuadTree
+from production import P1
+from driver import Driver, PointInput, FixedInput
+from basic_graph import basic_grid
+from graph import HYPEREDGE_LABELS
+
+
+class TestQuadTree(unittest.TestCase):
+    def test_queries_agree_with_linear_scan(self):
+        rng = random.Random(3)
+        tree = QuadTree(bucket_size=4)
+        points = {}
+        for handle in range(500):
+            points[handle] = (rng.uniform(-10, 10), rng.uniform(-5, 20))
+            tree.insert(handle, *points[handle])
+        for handle in range(0, 500, 3):
+            tree.remove(handle)
+            del points[handle]
+        for handle in range(1, 500, 5):
+            if handle in points:
+                points[handle] = (rng.uniform(-30, 30), rng.uniform(-30, 30))
+                tree.move(handle, *points[handle])
+
+        box = (-3, 0, 4, 7.5)
+        expected = {h for h, (x, y) in points.items() if box[0] <= x <= box[2] and box[1] <= y <= box[3]}
+        self.assertEqual(set(tree.in_bbox(*box)), expected)
+
+        nearest = [handle for _, handle in tree.nearest(1, 2)]
+        by_distance = sorted(points, key=lambda h: (points[h][0] - 1) ** 2 + (points[h][1] - 2) ** 2)
+        self.assertEqual(len(nearest), len(points))
+        self.assertEqual(nearest[:10], by_distance[:10])
+
+    def test_coincident_points(self):
+        tree = QuadTree(bucket_size=2, max_depth=8)
+        for handle in range(20):
+            tree.insert(handle, 0.25, 0.25)
+        self.assertEqual(set(tree.in_bbox(0, 0, 0.5, 0.5)), set(range(20)))
+
+
+class TestGraphSpatialQueries(unittest.TestCase):
+    def test_bbox_and_nearest(self):
+        graph = basic_grid(4)
+        self.assertEqual(len(graph.nodes_in_bbox(0, 0, 1, 1, labels='v')), 4)
+        centres = graph.nodes_in_bbox(0, 0, 2, 2, labels=HYPEREDGE_LABELS)
+        self.assertEqual(len(centres), 4)
+        self.assertEqual([graph[h].label for h in graph.nearest_nodes(1.4, 1.4, k=1)], ['q'])
+        self.assertEqual(graph.nearest_nodes(1.1, 0.9, k=2, labels='v')[0], 6)
+
+    def test_hyperedge_at(self):
+        graph = basic_grid(3)
+        for handle in graph.hyperedges():
+            attrs = graph[handle]
+            self.assertEqual(graph.hyperedge_at(attrs.x + 0.3, attrs.y - 0.2), handle)
+        self.assertIsNone(graph.hyperedge_at(3.5, 1))
+
+    def test_index_follows_productions_and_moves(self):
+        graph = basic_grid(2)
+        self.assertIsNotNone(graph.hyperedge_at(0.5, 0.5))
+        Driver().execute_production_sequence(graph, [PointInput(0.4, 0.6), P1()])
+        # The element was broken into four, the point lies in the upper-left one
+        located = graph.hyperedge_at(0.2, 0.8)
+        self.assertEqual((graph[located].x, graph[located].y), (0.25, 0.75))
+        self.assertEqual(len(graph.nodes_in_bbox(0, 0, 1, 1, labels='v')), 9)
+
+        graph.move_node(8, 5, 5)
+        self.assertEqual(graph.nearest_nodes(4.9, 4.9, labels='v'), [8])
+        self.assertNotIn(8, graph.nodes_in_bbox(0, 0, 2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import random
+import tracemalloc
+import unittest
+
+from graph import Graph
+from model import Node, NodeAttrs, Edge, EdgeAttrs
+from storage import GraphStorage, NetworkxStorage, ArrayStorage
+from production import P1, P2
+from driver import Driver, FixedInput
+from basic_graph import basic_grid
+
+
+def storage_contents(storage: GraphStorage, edge_handles: bool = True) -> tuple:
+    nodes = sorted((handle, attrs.label, attrs.x, attrs.y, attrs.flag) for handle, attrs in storage.nodes_with_attrs())
+    edges = sorted((min(u, v), max(u, v), attrs.kind, attrs.flag, attrs.handle if edge_handles else None)
+                   for u, v, attrs in storage.edges())
+    return nodes, edges
+
+
+class TestArrayStorage(unittest.TestCase):
+    def test_random_mutations_agree_with_networkx(self):
+        rng = random.Random(7)
+        storages = (NetworkxStorage(), ArrayStorage(node_capacity=4, edge_capacity=4))
+        present: list[int] = []
+        for step in range(3000):
+            action = rng.random()
+            if action < 0.3 or len(present) < 2:
+                handle = rng.randrange(400)
+                if handle in present:
+                    continue
+                attrs = NodeAttrs(rng.choice('vqp'), rng.random(), rng.random(), rng.choice((True, False, None)))
+                for storage in storages:
+                    storage.add_node(handle, NodeAttrs(attrs.label, attrs.x, attrs.y, attrs.flag))
+                present.append(handle)
+            elif action < 0.4:
+                handle = present.pop(rng.randrange(len(present)))
+                for storage in storages:
+                    storage.remove_node(handle)
+            elif action < 0.8:
+                u, v = rng.sample(present, 2)
+                attrs = EdgeAttrs(rng.choice('eqp'), rng.choice((True, False)))
+                for storage in storages:
+                    storage.add_edge(u, v, EdgeAttrs(attrs.kind, attrs.flag, attrs.handle))
+            else:
+                u, v = rng.sample(present, 2)
+                if storages[0].has_edge(u, v):
+                    for storage in storages:
+                        storage.remove_edge(u, v)
+
+        reference, array_storage = storages
+        self.assertEqual(storage_contents(reference), storage_contents(array_storage))
+        self.assertEqual(reference.number_of_nodes(), array_storage.number_of_nodes())
+        self.assertEqual(reference.number_of_edges(), array_storage.number_of_edges())
+        for handle in present:
+            self.assertEqual(sorted(reference.neighbours(handle)), sorted(array_storage.neighbours(handle)))
+
+    def test_bulk_inserts_agree_with_networkx(self):
+        nodes = [(handle, NodeAttrs('v', handle, -handle, handle % 2 == 0)) for handle in (3, 150, 7, 40)]
+        edges = [(3, 150, EdgeAttrs('e', True)), (7, 150, EdgeAttrs('q', False)), (40, 3, EdgeAttrs('p', True))]
+        storages = (NetworkxStorage(), ArrayStorage(node_capacity=4, edge_capacity=2))
+        for storage in storages:
+            storage.add_nodes(nodes)
+            storage.add_edges(edges)
+
+        reference, array_storage = storages
+        self.assertEqual(storage_contents(reference), storage_contents(array_storage))
+        self.assertEqual(sorted(array_storage.neighbours(3)), [40, 150])
+
+    def test_attrs_write_through(self):
+        graph = Graph(storage=ArrayStorage())
+        u = graph.add_node(Node(NodeAttrs('v', 0, 0, False)))
+        v = graph.add_node(Node(NodeAttrs('v', 1, 0, False)))
+        graph.add_edge(Edge(u, v, EdgeAttrs('e', False)))
+
+        graph.update_node_flag(u, True)
+        self.assertTrue(graph[u].flag)
+        self.assertEqual(list(graph.nodes_with_label_and_flag('v', True)), [u])
+
+        edge_attrs = graph.edge_attrs((u, v))
+        edge_attrs.flag = True
+        self.assertTrue(graph.edge_attrs((v, u)).flag)
+
+    def test_attrs_of_removed_elements_are_kept(self):
+        graph = Graph(storage=ArrayStorage())
+        u = graph.add_node(Node(NodeAttrs('v', 0, 0, False)))
+        v = graph.add_node(Node(NodeAttrs('v', 2, 0, True)))
+        graph.add_edge(Edge(u, v, EdgeAttrs('e', True)))
+
+        node_attrs = graph[v]
+        edge_attrs = graph.edge_attrs((u, v))
+        graph.remove_node(v)
+        # Both the handle & the edge row get reused
+        w = graph.add_node(Node(NodeAttrs('q', 5, 5, None), v))
+        graph.add_edge(Edge(u, w, EdgeAttrs('q', False)))
+
+        self.assertEqual((node_attrs.label, node_attrs.x, node_attrs.flag), ('v', 2, True))
+        self.assertEqual((edge_attrs.kind, edge_attrs.flag), ('e', True))
+        self.assertEqual(graph[w].label, 'q')
+
+    def test_productions_give_same_graph(self):
+        results = []
+        for storage in (NetworkxStorage(), ArrayStorage()):
+            graph = basic_grid(2)
+            copied = Graph(storage=storage)
+            copied.add_node_collection(Node(NodeAttrs(node.attrs.label, node.attrs.x, node.attrs.y, node.attrs.flag), node.handle)
+                                       for node in graph.get_nodes())
+            copied.add_edge_collection(Edge(edge.u, edge.v, EdgeAttrs(edge.attrs.kind, edge.attrs.flag))
+                                       for edge in graph.get_edges())
+
+            Driver().execute_production_sequence(copied, [FixedInput(9), P1(), FixedInput(10), P2()])
+            # Edge handles are generated globally, so they differ between the runs
+            results.append(storage_contents(copied.storage, edge_handles=False))
+
+        self.assertEqual(results[0], results[1])
+
+    def test_memory_per_element(self):
+        def bytes_per_element(storage: GraphStorage) -> float:
+            tracemalloc.start()
+            try:
+                graph = basic_grid(40, storage=storage)
+                size, _ = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            return size / (graph.storage.number_of_nodes() + graph.storage.number_of_edges())
+
+        # All of the graph is counted: storage, indexes, hyperedge table etc.
+        array_size, networkx_size = bytes_per_element(ArrayStorage()), bytes_per_element(NetworkxStorage())
+        self.assertLess(array_size, 200)
+        self.assertLess(array_size, networkx_size / 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
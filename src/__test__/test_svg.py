@@ -0,0 +1,60 @@
+import io
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from svg import svg_frame, write_svg, SvgDriverDelegate
+from visualisation import DrawingDriverDelegate
+from production import P1, P2
+from driver import Driver, FixedInput
+from basic_graph import basic_grid
+from __test__.test_imports import run_in_fresh_interpreter, PLOTTING_PACKAGES
+
+
+SVG = '{http://www.w3.org/2000/svg}'
+SEQUENCE = [FixedInput(9), P1(), FixedInput(10), P2()]
+
+
+class TestSvgWriter(unittest.TestCase):
+    def test_frame_is_valid_svg_with_all_elements(self):
+        graph = basic_grid(2)
+        graph.update_hyperedge_flag(9, True)
+        P1()(graph)
+
+        stream = io.StringIO()
+        write_svg(graph, stream, title='P1 <applied>', node_labels=True)
+        root = ET.fromstring(stream.getvalue())
+
+        self.assertEqual(root.find(f'{SVG}title').text, 'P1 <applied>')
+        solid, dotted = root.findall(f'{SVG}g')[:2]
+        self.assertEqual(len(solid), len(graph.edges_with_kind('e')))
+        self.assertEqual(len(dotted), len(graph.edges_with_kind('q')) + len(graph.edges_with_kind('p')))
+        self.assertIn('stroke-dasharray', dotted.attrib)
+        self.assertEqual(len(root.findall(f'.//{SVG}use')), graph.storage.number_of_nodes())
+        self.assertEqual(len(root.findall(f'.//{SVG}text')), graph.storage.number_of_nodes())
+
+    def test_coordinates_fit_the_canvas(self):
+        root = ET.fromstring(''.join(svg_frame(basic_grid(3), size=300, margin=10)))
+        self.assertEqual((root.get('width'), root.get('height')), ('320', '320'))
+        points = [(float(use.get('x')), float(use.get('y'))) for use in root.iter(f'{SVG}use')]
+        self.assertEqual(min(points), (10.0, 10.0))
+        self.assertEqual(max(points), (310.0, 310.0))
+
+    def test_delegate_saves_same_frames_as_drawing_delegate(self):
+        with tempfile.TemporaryDirectory() as png_dir, tempfile.TemporaryDirectory() as svg_dir:
+            Driver(DrawingDriverDelegate(Path(png_dir))).execute_production_sequence(basic_grid(2), SEQUENCE)
+            Driver(SvgDriverDelegate(Path(svg_dir))).execute_production_sequence(basic_grid(2), SEQUENCE)
+            self.assertEqual(sorted(os.listdir(svg_dir)),
+                             sorted(name.replace('.png', '.svg') for name in os.listdir(png_dir)))
+
+    def test_does_not_import_plotting_stack(self):
+        result = run_in_fresh_interpreter(
+            f"import sys\nimport svg\nprint(sorted({{name.split('.')[0] for name in sys.modules}} & set({PLOTTING_PACKAGES!r})))"
+        )
+        self.assertEqual(result.stdout.strip(), '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from visualisation import DrawingData, DrawingDriverDelegate, AsyncDrawingDriverDelegate, MeshData, draw_mesh
+from production import P1, P2
+from driver import Driver, FixedInput
+from basic_graph import basic_grid
+
+
+SEQUENCE = [FixedInput(9), P1(), FixedInput(10), P2()]
+
+
+class TestAsyncDrawingDriverDelegate(unittest.TestCase):
+    def test_saves_same_frames_as_synchronous_delegate(self):
+        with tempfile.TemporaryDirectory() as sync_dir, tempfile.TemporaryDirectory() as async_dir:
+            Driver(DrawingDriverDelegate(Path(sync_dir))).execute_production_sequence(basic_grid(2), SEQUENCE)
+
+            with AsyncDrawingDriverDelegate(Path(async_dir), max_pending=2) as delegate:
+                Driver(delegate).execute_production_sequence(basic_grid(2), SEQUENCE)
+                # Frames are flushed at the end of the execution
+                self.assertEqual(delegate.pending, 0)
+            self.assertIsNone(delegate._executor)
+
+            self.assertEqual(sorted(os.listdir(async_dir)), sorted(os.listdir(sync_dir)))
+            self.assertEqual(len(os.listdir(async_dir)), 6)
+
+    def test_pending_frames_are_bounded(self):
+        graph = basic_grid(2)
+        with tempfile.TemporaryDirectory() as savedir, ThreadPoolExecutor(max_workers=1) as executor:
+            with AsyncDrawingDriverDelegate(Path(savedir), max_pending=2, executor=executor) as delegate:
+                for _ in range(5):
+                    delegate.on_production_success(P1(), graph)
+                    self.assertLessEqual(delegate.pending, 2)
+            self.assertEqual(len(os.listdir(savedir)), 5)
+
+    def test_drawing_data_is_detached_from_graph(self):
+        graph = basic_grid(2)
+        data = DrawingData.of(graph)
+        nodes, edges = list(data.nodes), list(data.edges)
+        graph.update_hyperedge_flag(9, True)
+        P1()(graph)
+        self.assertEqual((data.nodes, data.edges), (nodes, edges))
+        self.assertEqual(len(nodes), graph.storage.number_of_nodes() - 8)
+
+
+
+def polygon_areas(polygons: np.ndarray) -> np.ndarray:
+    x, y = polygons[..., 0], polygons[..., 1]
+    return 0.5 * (x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y).sum(axis=1)
+
+
+class TestMeshRenderer(unittest.TestCase):
+    def refined_grid(self):
+        graph = basic_grid(3)
+        Driver().execute_production_sequence(graph, [FixedInput(20), P1()])
+        graph.update_hyperedge_flag(16, True)
+        return graph
+
+    def test_mesh_data_covers_all_elements_and_edges(self):
+        graph = self.refined_grid()
+        mesh = MeshData.of(graph)
+
+        self.assertEqual(mesh.segments.shape, (len(graph.edges_with_kind('e')), 2, 2))
+        self.assertEqual(int(mesh.segment_flags.sum()), len(graph.edges_with_kind_and_flag('e', True)))
+        polygons, = mesh.polygons
+        self.assertEqual(polygons.shape, (len(graph.hyperedges()), 4, 2))
+        self.assertEqual(int(mesh.polygon_flags[0].sum()), 1)
+        # Corners are ordered around the element, so that the polygons neither overlap nor intersect themselves
+        areas = polygon_areas(polygons)
+        self.assertTrue(np.all(areas > 0))
+        self.assertAlmostEqual(areas.sum(), 9)
+
+    def test_decimation(self):
+        mesh = MeshData.of(basic_grid(6), max_edges=10, max_elements=5)
+        self.assertLessEqual(len(mesh.segments), 10)
+        self.assertLessEqual(len(mesh.polygons[0]), 5)
+        self.assertGreater(len(mesh.polygons[0]), 0)
+
+    def test_draws_few_artists(self):
+        ax = Figure().subplots()
+        draw_mesh(MeshData.of(self.refined_grid()), ax)
+        self.assertEqual(len(ax.collections), 1)
+        self.assertEqual(len(ax.lines), 2)
+        self.assertEqual(len(ax.texts), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+from typing import Iterable, Optional, KeysView
+from graph import Graph, HYPEREDGE_LABELS
+from model import NodeHandle, GraphMapping
+from production import Production
+
+
+class ApplicabilityIndex:
+    """ Maintains table hyperedge (centre handle) -> productions whose lhs currently matches in the graph with that
+    hyperedge as the lhs anchor (see `Graph.find_anchor`), together with the matching mappings.
+
+    The table is kept up to date incrementally from a mutation journal, in the same manner as `IncrementalMatcher`
+    does it: after the graph is mutated only hyperedges within k hops from touched nodes are re-matched, k being
+    the eccentricity of the anchor in the lhs of given production. Queries bring the table up to date implicitly.
+
+    Mappings are the structural matches of the lhs, one per match up to symmetry of the anchor; feasibility is still
+    decided by the production, e.g. pass them to `Production.apply_first_feasible`.
+    """
+    def __init__(self, graph: Graph, productions: Iterable[Production]) -> None:
+        """ :param productions: productions to track; lhs anchor of each of them must be a hyperedge centre """
+        self._graph = graph
+        # Productions grouped by the radius of the ball that has to be re-matched around touched nodes
+        self._productions_by_radius: dict[int, list[Production]] = {}
+        for production in productions:
+            compiled = production.get_compiled_lhs()
+            if not compiled.is_compiled() or compiled.pattern[compiled.anchor].label not in HYPEREDGE_LABELS:
+                raise ValueError(f"Lhs of {production} is not anchored at a hyperedge")
+            self._productions_by_radius.setdefault(compiled.radius, []).append(production)
+
+        # Only hyperedges with at least one applicable production are present
+        self._table: dict[NodeHandle, dict[Production, list[GraphMapping]]] = {}
+        self._journal = graph.create_journal()
+
+        for centre in graph.hyperedges():
+            for productions_group in self._productions_by_radius.values():
+                for production in productions_group:
+                    self.__rematch(centre, production)
+
+    def close(self):
+        """ Stop tracking mutations of the graph. """
+        if self._journal is not None:
+            self._graph.detach_journal(self._journal)
+            self._journal = None
+
+    def update(self):
+        """ Bring the table up to date with the graph. Called implicitly by all queries. """
+        assert self._journal is not None, "Attempt to update closed index"
+        if self._journal.is_empty():
+            return
+
+        dirty = self._journal.dirty_nodes()
+        self._journal.checkpoint()
+
+        for handle in dirty:
+            if handle not in self._graph:
+                self._table.pop(handle, None)
+
+        present = [handle for handle in dirty if handle in self._graph]
+        for radius, productions in self._productions_by_radius.items():
+            ball = self._graph.neighbourhood_of(present, radius)
+            for centre in sorted(ball):
+                if not self._graph.is_hyperedge(centre):
+                    continue
+                for production in productions:
+                    self.__rematch(centre, production)
+
+    def ready(self) -> KeysView[NodeHandle]:
+        """ Returns live, read-only view of centres of hyperedges with at least one applicable production. """
+        self.update()
+        return self._table.keys()
+
+    def applicable_at(self, centre: NodeHandle) -> dict[Production, list[GraphMapping]]:
+        """ Returns productions applicable at given hyperedge together with their mappings. """
+        self.update()
+        return dict(self._table.get(centre, {}))
+
+    def mappings(self, centre: NodeHandle, production: Production) -> list[GraphMapping]:
+        """ Returns mappings of the lhs of given production anchored at given hyperedge. """
+        self.update()
+        return self._table.get(centre, {}).get(production, [])
+
+    def pop(self) -> Optional[tuple[NodeHandle, Production, list[GraphMapping]]]:
+        """ Remove a (hyperedge, production, mappings) entry from the table & return it; None if there is none. O(1).
+
+        The entry is not reported again unless the graph around the hyperedge gets mutated, so that the work
+        that turns out infeasible is not picked over and over.
+        """
+        self.update()
+        if not self._table:
+            return None
+        centre, applicable = self._table.popitem()
+        production, mappings = applicable.popitem()
+        if applicable:
+            self._table[centre] = applicable
+        return centre, production, mappings
+
+    def __len__(self) -> int:
+        """ Returns number of (hyperedge, production) entries in the table. """
+        self.update()
+        return sum(len(applicable) for applicable in self._table.values())
+
+    def __rematch(self, centre: NodeHandle, production: Production):
+        compiled = production.get_compiled_lhs()
+        mappings = list(compiled.generate_mappings_at(self._graph, centre, compiled.anchor, canonical_anchor=True))
+        applicable = self._table.get(centre)
+        if mappings:
+            if applicable is None:
+                applicable = self._table[centre] = {}
+            applicable[production] = mappings
+        elif applicable is not None:
+            applicable.pop(production, None)
+            if not applicable:
+                del self._table[centre]
@@ -1,11 +1,13 @@
+from typing import Optional
 from graph import Graph
 from model import NodeAttrs, EdgeAttrs, NodeHandle, Edge, Node
+from storage import GraphStorage
 import itertools as it
 
 def basic_square(for_lhs=False, hanging=True):
     """
     for_lhs is mostly necessary when basic_* functions are invoked from
-    __create_lhs - then handles are enumerated from 0, which is very
+    create_lhs - then handles are enumerated from 0, which is very
     handy during processing of monomorphisms.
     TODO: delete `hanging' argument after P7 is introduced and change it
     to false
@@ -79,3 +81,26 @@ def basic_pentagon(for_lhs=False, select_central=False):
         graph.add_edge(edge)
 
     return graph
+
+def basic_grid(n: int, hyperedge_flag: bool = False, storage: Optional[GraphStorage] = None) -> Graph:
+    """
+    n x n grid of unit Q-elements, with boundary edges marked as such.
+    Handy when more than a single element is needed, e.g. in benchmarks.
+    """
+    graph = Graph(storage)
+    nodes = [[Node(NodeAttrs('v', x, y, False)) for x in range(n + 1)] for y in range(n + 1)]
+    graph.add_node_collection(it.chain.from_iterable(nodes))
+
+    for y in range(n + 1):
+        for x in range(n + 1):
+            if x < n:
+                graph.add_edge(Edge(nodes[y][x].handle, nodes[y][x + 1].handle, EdgeAttrs('e', y in (0, n))))
+            if y < n:
+                graph.add_edge(Edge(nodes[y][x].handle, nodes[y + 1][x].handle, EdgeAttrs('e', x in (0, n))))
+
+    for y in range(n):
+        for x in range(n):
+            corners = (nodes[y][x], nodes[y][x + 1], nodes[y + 1][x + 1], nodes[y + 1][x])
+            graph.add_q_hyperedge(corners, EdgeAttrs('q', hyperedge_flag))
+
+    return graph
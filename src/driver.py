@@ -1,9 +1,9 @@
-from typing import Iterable, Callable, Optional
+from typing import Iterable, Callable, Optional, Any
 from production import Production
-from graph import Graph
+from graph import Graph, GraphDelta
 from model import NodeHandle
-from pathlib import Path
-import matplotlib.pyplot as plt
+from matching import IncrementalMatcher
+from refinement import RefinementEngine
 
 
 class InputProvider:
@@ -12,6 +12,10 @@ class InputProvider:
     def __call__(self):
         raise NotImplementedError("__call__ must be implemented")
 
+    def provide(self, graph: Graph) -> NodeHandle:
+        """ Called by the `Driver`; override it if the input depends on the graph. """
+        return self()
+
 
 class FixedInput(InputProvider):
     """ Use this class to provide driver with fixed node handle to mark for breaking.
@@ -24,6 +28,22 @@ class FixedInput(InputProvider):
         return self.handle
 
 
+class PointInput(InputProvider):
+    """ Use this class to provide driver with the hyperedge whose element contains given point, see `Graph.hyperedge_at`.
+    """
+    def __init__(self, x: float, y: float) -> None:
+        self.x = x
+        self.y = y
+
+    def __call__(self):
+        raise RuntimeError("PointInput needs the graph to locate the element, use provide")
+
+    def provide(self, graph: Graph) -> NodeHandle:
+        handle = graph.hyperedge_at(self.x, self.y)
+        assert handle is not None, f"There is no element containing point ({self.x}, {self.y})"
+        return handle
+
+
 class UserInput(InputProvider):
     """ Use this class to let user decide what node should be marked for breaking.
     """
@@ -31,6 +51,42 @@ class UserInput(InputProvider):
         return int(input("NodeHandle> "))
 
 
+class ApplyAll:
+    """ Use this class in production sequence to apply the production on a maximal set of node-disjoint matches in
+    one pass, see `Production.apply_all`. Matches overlapping the selected ones are left for the next pass, so repeat
+    the step (as many times as needed) to rewrite all of them. The step fails if the production could not be applied at all.
+    """
+    def __init__(self, production: Production) -> None:
+        self.production = production
+
+    def __str__(self) -> str:
+        return f'{self.production}*'
+
+
+class ApplyAt:
+    """ Use this class in production sequence to apply the production at the hyperedge given by the input provider,
+    see `Production.apply_at`. The step fails if the production can not be applied there.
+    """
+    def __init__(self, production: Production, target: InputProvider) -> None:
+        self.production = production
+        self.target = target
+
+    def __str__(self) -> str:
+        return f'{self.production}@'
+
+
+class Refine:
+    """ Use this class in production sequence to mark hyperedges given by the input providers for breaking & then
+    apply propagation & breaking productions until the mesh is conforming again, see `refinement.RefinementEngine`.
+    Delegate is notified about every single application. The step fails if nothing could be applied.
+    """
+    def __init__(self, *inputs: InputProvider) -> None:
+        self.inputs = inputs
+
+    def __str__(self) -> str:
+        return f'Refine({len(self.inputs)})'
+
+
 class DriverDelegate:
     def on_production_success(self, prod: Production, graph: Graph):
         pass
@@ -48,80 +104,138 @@ class DriverDelegate:
         pass
 
 
-class DrawingDriverDelegate(DriverDelegate):
-    def __init__(self, savedir: Optional[Path], newstyleplot: bool = True) -> None:
-        self.savedir = savedir
-        self.newstyle = newstyleplot
+class FrameDriverDelegate(DriverDelegate):
+    """ Base of delegates capturing a picture ('frame') of the graph before the execution, after every production
+    & manual input and after the execution. Subclasses render the frames by overriding `_draw_frame`.
+    """
+    def __init__(self) -> None:
         self.counter = 0
 
     def on_execution_start(self, graph: Graph, callables: Iterable[Production | InputProvider]):
-        fig, plot = plt.subplots(nrows=1, ncols=1)
-        graph.display(newstyle=self.newstyle, ax=plot)
-        plot.set(title='Graph before applying production sequence')
-        if self.savedir is not None:
-            savefile = self.savedir.joinpath('graph_before.png')
-            fig.tight_layout()
-            fig.savefig(savefile)
-            plt.close(fig)
-
+        self._draw_frame(graph, 'Graph before applying production sequence', 'graph_before')
 
     def on_production_success(self, prod: Production, graph: Graph):
-        print(f'Successfully applied {prod}')
-        fig, plot = plt.subplots(nrows=1, ncols=1)
-        graph.display(newstyle=self.newstyle, ax=plot)
-        plot.set(title=f'Graph after {prod}')
-
-        if self.savedir is not None:
-            savefile = self.savedir.joinpath(f'{self.counter}_graph_after_prod_{prod}.png')
-            self.counter += 1
-            fig.tight_layout()
-            plt.savefig(savefile)
-            plt.close(fig)
-
+        self._draw_frame(graph, f'Graph after {prod}', f'{self.counter}_graph_after_prod_{prod}')
+        self.counter += 1
 
     def on_execution_end(self, graph: Graph, callables: Iterable[Production | InputProvider]):
-        fig, plot = plt.subplots(nrows=1, ncols=1)
-        graph.display(newstyle=self.newstyle, ax=plot)
-        plot.set(title='Graph after applying production sequence')
-        if self.savedir is not None:
-            savefile = self.savedir.joinpath('graph_after.png')
-            fig.tight_layout()
-            fig.savefig(savefile)
-            plt.close(fig)
+        self._draw_frame(graph, 'Graph after applying production sequence', 'graph_after')
 
     def on_manual_input(self, graph: Graph, user_input: NodeHandle):
-        fig, plot = plt.subplots(nrows=1, ncols=1)
-        graph.display(newstyle=self.newstyle, ax=plot)
-        plot.set(title=f'Graph after user manually marked {user_input} to break')
-        if self.savedir is not None:
-            savefile = self.savedir.joinpath(f'{self.counter}_graph_after_mi.png')
-            self.counter += 1
-            fig.tight_layout()
-            fig.savefig(savefile)
-            plt.close(fig)
+        self._draw_frame(graph, f'Graph after user manually marked {user_input} to break', f'{self.counter}_graph_after_mi')
+        self.counter += 1
 
+    def _draw_frame(self, graph: Graph, title: str, name: str):
+        """ :param name: name of the frame, unique within the execution, to derive file name from """
+        raise NotImplementedError("This method must be overrided in subclasses")
 
 
 class Driver:
-    def __init__(self, delegate = DriverDelegate()) -> None:
+    def __init__(self, delegate = DriverDelegate(), incremental: bool = True) -> None:
+        """
+        :param delegate: receives notifications about the progress of the execution
+        :param incremental: if True, matches of each production lhs are maintained incrementally during the execution
+                            (see `matching.IncrementalMatcher`), instead of being searched for from scratch on every step
+        """
         self.delegate = delegate
+        self.incremental = incremental
+
+    def execute_production_sequence(self, graph: Graph, callables: Iterable[Production | ApplyAll | ApplyAt | Refine | InputProvider]):
+        matchers: dict[type, IncrementalMatcher] = {}
 
-    def execute_production_sequence(self, graph: Graph, callables: Iterable[Production | InputProvider]):
         self.delegate.on_execution_start(graph, callables)
-        for func in callables:
-            if isinstance(func, Production):
-                if func(graph):
-                    self.delegate.on_production_success(func, graph)
+        try:
+            for func in callables:
+                if isinstance(func, Production):
+                    if self.__apply_production(func, graph, matchers):
+                        self.delegate.on_production_success(func, graph)
+                    else:
+                        self.delegate.on_production_failure(func, graph)
+                        assert False, f"Production {func} failed"
+
+                elif isinstance(func, ApplyAll):
+                    if self.__apply_production_on_all(func.production, graph, matchers) > 0:
+                        self.delegate.on_production_success(func.production, graph)
+                    else:
+                        self.delegate.on_production_failure(func.production, graph)
+                        assert False, f"Production {func} failed"
+
+                elif isinstance(func, ApplyAt):
+                    if func.production.apply_at(graph, func.target.provide(graph)):
+                        self.delegate.on_production_success(func.production, graph)
+                    else:
+                        self.delegate.on_production_failure(func.production, graph)
+                        assert False, f"Production {func} failed"
+
+                elif isinstance(func, Refine):
+                    engine = RefinementEngine(graph)
+                    try:
+                        marks = [provider.provide(graph) for provider in func.inputs]
+                        applications = engine.refine(marks, on_applied=self.delegate.on_production_success)
+                    finally:
+                        engine.close()
+                    assert applications > 0, f"{func} failed"
+
+                elif isinstance(func, InputProvider):
+                    user_input = func.provide(graph)
+                    graph.update_hyperedge_flag(user_input, True)
+                    self.delegate.on_manual_input(graph, user_input)
                 else:
-                    self.delegate.on_production_failure(func, graph)
-                    assert False, f"Production {func} failed"
-
-            elif isinstance(func, InputProvider):
-                user_input = func()
-                graph.update_hyperedge_flag(user_input, True)
-                self.delegate.on_manual_input(graph, user_input)
-            else:
-                raise RuntimeError("HEHE")
+                    raise RuntimeError("HEHE")
+        finally:
+            for matcher in matchers.values():
+                matcher.close()
 
         self.delegate.on_execution_end(graph, callables)
 
+    def fork(self, graph: Graph, branches: Iterable[Iterable[Production | ApplyAll | ApplyAt | Refine | InputProvider]],
+             evaluate: Optional[Callable[[Graph], Any]] = None) -> list[tuple[Any, GraphDelta]]:
+        """ Execute each of the production sequences from the current state of the graph, reverting the graph to
+        that state after every one of them (see `Graph.snapshot`), so that the branches do not need copies of the graph.
+
+        :param evaluate: called on the graph at the end of every branch
+        :return: (result of `evaluate`, delta of the branch) for every branch; the graph is left in its initial state,
+                 pass delta of the chosen branch to `Graph.replay` to continue from there
+        """
+        snapshot = graph.snapshot()
+        results = []
+        try:
+            for branch in branches:
+                self.execute_production_sequence(graph, branch)
+                result = evaluate(graph) if evaluate is not None else None
+                results.append((result, graph.revert(snapshot)))
+        except BaseException:
+            graph.revert(snapshot)
+            raise
+        finally:
+            graph.release(snapshot)
+        return results
+
+    def __apply_production(self, prod: Production, graph: Graph, matchers: dict[type, IncrementalMatcher]) -> bool:
+        if not self.incremental:
+            return prod(graph)
+
+        prod.reset()
+        return prod.apply_first_feasible(graph, self.__get_matcher(prod, graph, matchers).mappings())
+
+    def __apply_production_on_all(self, prod: Production, graph: Graph, matchers: dict[type, IncrementalMatcher]) -> int:
+        if not self.incremental:
+            return prod.apply_all(graph)
+        return prod.apply_all(graph, self.__get_matcher(prod, graph, matchers).mappings())
+
+    def __get_matcher(self, prod: Production, graph: Graph, matchers: dict[type, IncrementalMatcher]) -> IncrementalMatcher:
+        # Lhs does not depend on production instance, so the matcher can be shared by all instances of given production
+        matcher = matchers.get(type(prod))
+        if matcher is None:
+            matcher = prod.create_matcher(graph)
+            matchers[type(prod)] = matcher
+        return matcher
+
+
+def __getattr__(name: str):
+    # Kept for backward compatibility: the drawing delegate has moved to `visualisation`, which is imported on
+    # first access only, so that the driver does not need the plotting stack
+    if name == 'DrawingDriverDelegate':
+        from visualisation import DrawingDriverDelegate
+        return DrawingDriverDelegate
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
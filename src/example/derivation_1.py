@@ -4,7 +4,8 @@ from production import (
     P9, P8, P16, P7, P2, P1, P3
 )
 from model import Node, NodeAttrs, Edge, EdgeAttrs
-from driver import Driver, FixedInput, DrawingDriverDelegate
+from driver import Driver, FixedInput
+from visualisation import DrawingDriverDelegate
 from pathlib import Path
 import itertools as it
 import matplotlib.pyplot as plt
@@ -1,19 +1,55 @@
 import itertools as it
+import math
 import networkx as nx
+import numpy as np
 from model import (
     EdgeHandle, Node, NodeHandle,
     NodeAttrs, Edge,
     EdgeAttrs, GraphMapping,
-    EdgeEndpoints
+    EdgeEndpoints, Hyperedge
 )
-from typing import Optional, Iterable, Any, Callable
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Iterable, Iterator, Any, Callable, KeysView, AbstractSet, NamedTuple, BinaryIO
+from journal import MutationJournal
+from storage import GraphStorage, ArrayStorage, create_default_storage, NodeColumns, EdgeColumns, KIND_CODES, FLAG_CODES, flag_code
+from spatial import QuadTree
+from views import NodeView, EdgeView, ANY_FLAG
+import serialization
 import util
 
 
-def node_equality(nx_node_attrs_1, nx_node_attrs_2) -> bool:
-    attrs_1: NodeAttrs = nx_node_attrs_1['payload']
-    attrs_2: NodeAttrs = nx_node_attrs_2['payload']
+# Labels of the 'fake' nodes placed in the centre of Q & P hyperedges
+HYPEREDGE_LABELS = ('q', 'p')
+
+# Marks undo log entries of table slots that were empty
+_MISSING = object()
+
+# Identifiers of graph states, see `Graph.snapshot`; a state gets new one on every mutation, unlike the generation
+# it is restored together with the state, so equal identifiers mean equal contents
+_state_ids = it.count()
+
+
+class GraphSnapshot(NamedTuple):
+    """ State of a graph to revert to, see `Graph.snapshot`. """
+    depth: int
+    state_id: int
 
+
+class GraphDelta(NamedTuple):
+    """ Mutations of a branch of derivation, that took the graph from a snapshot to some other state; see `Graph.revert`.
+    Keeps only the touched nodes & edges.
+    """
+    base_state_id: int
+    entries: list[tuple]
+    generator_state: tuple[int, dict[NodeHandle, None]]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def node_attrs_match(attrs_1: NodeAttrs, attrs_2: NodeAttrs) -> bool:
+    """ Labels must be equal; flags are compared only if both of them are specified. """
     label_match = attrs_1.label == attrs_2.label
 
     if attrs_1.flag is not None and attrs_2.flag is not None:
@@ -22,6 +58,18 @@ def node_equality(nx_node_attrs_1, nx_node_attrs_2) -> bool:
         return label_match
 
 
+def node_equality(nx_node_attrs_1, nx_node_attrs_2) -> bool:
+    attrs_1: NodeAttrs = nx_node_attrs_1['payload']
+    attrs_2: NodeAttrs = nx_node_attrs_2['payload']
+
+    return node_attrs_match(attrs_1, attrs_2)
+
+
+
+def edge_key(handle_1: NodeHandle, handle_2: NodeHandle) -> EdgeEndpoints:
+    """ Edges are undirected, thus we key them by sorted endpoints """
+    return EdgeEndpoints(handle_1, handle_2) if handle_1 <= handle_2 else EdgeEndpoints(handle_2, handle_1)
+
 
 def edge_equality(nx_edge_attrs_1, nx_edge_attrs_2) -> bool:
     attrs_1: EdgeAttrs = nx_edge_attrs_1['payload']
@@ -33,32 +81,104 @@ def edge_equality(nx_edge_attrs_1, nx_edge_attrs_2) -> bool:
 
 
 class NodeHandleGenerator:
+    """ Allocates node handles in O(1): the most recently released handle if there is any, otherwise the next one
+    past the high-water mark. Handles occupied explicitly (not through the generator) must be `claim`ed.
+    """
     def __init__(self, initial_value: int = 0) -> None:
-        self._counter = it.count(start=initial_value)
-
-    def skip(self, n: int) -> None:
-        assert n > 0
-        current = self._counter.__next__()
-        self._counter = it.count(start=current + n - 1)
+        self._high_water_mark = initial_value
+        # Used as an ordered set, so that claiming arbitrary released handle is O(1) as well
+        self._released: dict[NodeHandle, None] = {}
+
+    def claim(self, handle: NodeHandle) -> None:
+        """ Mark given handle as occupied, so that it is never generated until released. """
+        if handle >= self._high_water_mark:
+            self._high_water_mark = handle + 1
+        else:
+            self._released.pop(handle, None)
+
+    def release(self, handle: NodeHandle) -> None:
+        """ Mark given handle as free for reuse. """
+        if handle < self._high_water_mark:
+            self._released[handle] = None
+
+    def reserve(self, n: int) -> range:
+        """ Allocate `n` consecutive handles at once, past the high-water mark. """
+        assert n >= 0
+        handles = range(self._high_water_mark, self._high_water_mark + n)
+        self._high_water_mark += n
+        return handles
+
+    def peek(self, offset: int = 0) -> NodeHandle:
+        """ Returns handle at given position of the range the next `reserve` is going to allocate. """
+        return self._high_water_mark + offset
+
+    def state(self) -> tuple[int, dict[NodeHandle, None]]:
+        """ Returns snapshot of the generator, to be passed to `restore`. O(number of released handles). """
+        return self._high_water_mark, dict(self._released)
+
+    def restore(self, state: tuple[int, dict[NodeHandle, None]]) -> None:
+        self._high_water_mark, released = state
+        self._released = dict(released)
 
     def __call__(self) -> NodeHandle:
-        return self._counter.__next__()
+        if self._released:
+            return self._released.popitem()[0]
+        handle = self._high_water_mark
+        self._high_water_mark += 1
+        return handle
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        return self._counter.__next__()
+        return self()
 
 
 class Graph:
-    def __init__(self) -> None:
-        self._graph = nx.Graph()
+    def __init__(self, storage: Optional[GraphStorage] = None, reuse_node_handles: bool = False) -> None:
+        """ :param storage: structure to keep the nodes & edges in; if not specified the default one is created,
+                        see `storage.create_default_storage`
+        :param reuse_node_handles: whether handles of removed nodes should be reused for automatically generated ones;
+                                   off by default, as production sequences refer to hyperedges by their handles
+        """
+        self._storage = storage if storage is not None else create_default_storage()
         self._node_handle_factory = NodeHandleGenerator(initial_value=0)
+        self._reuse_node_handles = reuse_node_handles
+
+        # Secondary index of nodes by label & flag and of edges by kind & flag; provided by the storage, as some
+        # storages can answer the queries from their own data
+        self._attr_index = self._storage.create_attr_index()
+
+        # Hyperedge table (keyed by handle of the centre node) & reverse index node -> hyperedges it is a corner of,
+        # so that hyperedges can be looked up without traversing their star edges; see `_hyperedges`
+        self.__hyperedge_table: dict[NodeHandle, Hyperedge] = {}
+        self.__hyperedges_by_node: dict[NodeHandle, dict[NodeHandle, None]] = {}
+        # Hyperedge chunks of a loaded graph (see `load`), not unpacked into the tables yet
+        self.__hyperedge_chunks: Optional[dict[str, np.ndarray]] = None
+
+        # Edges split by a node in their middle: parent edge key -> midpoint handle, and the other way round
+        self._edge_splits: dict[EdgeEndpoints, NodeHandle] = {}
+        self._split_parents: dict[NodeHandle, EdgeEndpoints] = {}
+
+        # Spatial index of all nodes; built on the first spatial query & maintained incrementally since then
+        self._spatial_index: Optional[QuadTree] = None
+        # Upper bound of distance between hyperedge centre & its corners, used to terminate point location
+        self._hyperedge_radius_bound = 0.0
+
+        self._journals: list[MutationJournal] = []
+        # Bumped on every mutation, see `generation`
+        self._generation = 0
+        self._state_id = next(_state_ids)
+        self._frozen = False
+
+        # Undo log of the open transactions (see `begin`), None if there is none; every open transaction is
+        # represented by the log length, state of the handle generator & state id at its beginning
+        self._undo_log: Optional[list[tuple]] = None
+        self._transactions: list[tuple[int, tuple, int]] = []
 
 
     def __contains__(self, node: NodeHandle) -> bool:
-        return self._graph.has_node(node)
+        return self._storage.has_node(node)
 
 
     def add_node(self, node: Node) -> NodeHandle:
@@ -66,11 +186,13 @@ class Graph:
         If the node.handle == None the we generate graph-wide-unique handle here. It it is not None and
         node with that handle already exists in the graph this method raises AssertionError.
         """
+        self.__check_mutable()
         if node.handle is None:
             node.handle = self._find_graph_unique_node_handle()
 
-        assert not self._graph.has_node(node.handle), f"Attempt to add node with handle {node.handle} which already exists"
-        self._graph.add_node(node.handle, payload=node.attrs)
+        assert not self._storage.has_node(node.handle), f"Attempt to add node with handle {node.handle} which already exists"
+        self._node_handle_factory.claim(node.handle)
+        self.__insert_node(node.handle, node.attrs)
         return node.handle
 
 
@@ -79,7 +201,17 @@ class Graph:
 
 
     def remove_node(self, handle: NodeHandle):
-        self._graph.remove_node(handle)
+        self.__check_mutable()
+        if handle in self._hyperedges:
+            self.__unregister_hyperedge(handle)
+        for hyperedge_handle in list(self._hyperedges_of_node.get(handle, ())):
+            self.__detach_hyperedge_corner(hyperedge_handle, handle)
+        for neigh_handle, _ in list(self._storage.adjacent_edges(handle)):
+            self.__forget_split_through(handle, neigh_handle)
+            self.__delete_edge(handle, neigh_handle)
+        self.__delete_node(handle)
+        if self._reuse_node_handles:
+            self._node_handle_factory.release(handle)
 
 
     def remove_node_collection(self, node_collection: Iterable[NodeHandle]):
@@ -88,7 +220,11 @@ class Graph:
 
 
     def add_edge(self, edge: Edge):
-        self._graph.add_edge(u_of_edge=edge.u, v_of_edge=edge.v, payload=edge.attrs)
+        self.__check_mutable()
+        if edge_key(edge.u, edge.v) in self._edge_splits and not self._storage.has_edge(edge.u, edge.v):
+            # The edge is whole again
+            self.__forget_split(edge_key(edge.u, edge.v))
+        self.__set_edge(edge.u, edge.v, edge.attrs)
 
 
     def add_edge_collection(self, edge_collection: Iterable[Edge]):
@@ -97,12 +233,18 @@ class Graph:
 
 
     def remove_edge(self, handle_1: NodeHandle, handle_2: NodeHandle):
-        self._graph.remove_edge(handle_1, handle_2)
+        self.__check_mutable()
+        for hyperedge_handle, corner in ((handle_1, handle_2), (handle_2, handle_1)):
+            hyperedge = self._hyperedges.get(hyperedge_handle)
+            if hyperedge is not None and corner in hyperedge.corners:
+                self.__detach_hyperedge_corner(hyperedge_handle, corner)
+        self.__forget_split_through(handle_1, handle_2)
+        self.__delete_edge(handle_1, handle_2)
 
 
     def remove_edge_with_endpoints(self, edge: EdgeEndpoints):
         # Leaving method `remove_edge` to avoid refactorings & keeping backward compat
-        self._graph.remove_edge(edge[0], edge[1])
+        self.remove_edge(edge[0], edge[1])
 
 
     def remove_edge_collection(self, edge_collection: Iterable[Edge]):
@@ -110,16 +252,87 @@ class Graph:
             self.remove_edge(edge.u, edge.v)
 
 
-    def generate_subgraphs_isomorphic_with(self, other: 'Graph') -> Iterable[GraphMapping]:
-        gm = nx.isomorphism.GraphMatcher(self._graph, other.nx_graph, node_match=node_equality, edge_match=edge_equality)
+    def generate_subgraphs_isomorphic_with(self, other: 'Graph', anchored: bool = False) -> Iterable[GraphMapping]:
+        """ Generate mappings (self node -> other node) of node-induced subgraphs of this graph isomorphic with `other`.
+
+        :param other: pattern graph, usually lhs of a production
+        :param anchored: if True, the search is seeded only from nodes matching the pattern anchor (see `find_anchor`)
+                         instead of running the matcher over the whole graph; the set of generated mappings is the same
+        """
+        if anchored:
+            return self._generate_anchored_subgraphs(other, monomorphic=False)
+        gm = nx.isomorphism.GraphMatcher(self.nx_graph, other.nx_graph, node_match=node_equality, edge_match=edge_equality)
         return gm.subgraph_isomorphisms_iter()
 
 
-    def generate_subgraphs_monomorphic_with(self, other: 'Graph') -> Iterable[GraphMapping]:
-        gm = nx.isomorphism.GraphMatcher(self._graph, other.nx_graph, node_match=node_equality, edge_match=edge_equality)
+    def generate_subgraphs_monomorphic_with(self, other: 'Graph', anchored: bool = False) -> Iterable[GraphMapping]:
+        """ Same as `generate_subgraphs_isomorphic_with`, but generates subgraph monomorphisms. """
+        if anchored:
+            return self._generate_anchored_subgraphs(other, monomorphic=True)
+        gm = nx.isomorphism.GraphMatcher(self.nx_graph, other.nx_graph, node_match=node_equality, edge_match=edge_equality)
         return gm.subgraph_monomorphisms_iter()
 
 
+    def find_anchor(self) -> Optional[NodeHandle]:
+        """ Select node the anchored matching is seeded from, when this graph is used as a pattern.
+
+        Hyperedge centres are preferred, first these with specified flag (marked ones go first, as these are the rarest in
+        a mesh), then these with smallest eccentricity, so that the neighbourhood searched around every candidate is small.
+
+        :return: handle of the anchor or None if the graph has no hyperedge centre or is not connected
+        """
+        nx_graph = self.nx_graph
+        if nx_graph.number_of_nodes() == 0 or not nx.is_connected(nx_graph):
+            return None
+
+        candidates = [handle for handle in nx_graph.nodes if self[handle].label in HYPEREDGE_LABELS]
+        if len(candidates) == 0:
+            return None
+
+        def selectivity(handle: NodeHandle):
+            flag = self[handle].flag
+            return (flag is None, flag is not True, nx.eccentricity(nx_graph, handle))
+
+        return min(candidates, key=selectivity)
+
+
+    def _generate_anchored_subgraphs(self, other: 'Graph', monomorphic: bool) -> Iterator[GraphMapping]:
+        anchor = other.find_anchor()
+        if anchor is None:
+            gm = nx.isomorphism.GraphMatcher(self.nx_graph, other.nx_graph, node_match=node_equality, edge_match=edge_equality)
+            yield from (gm.subgraph_monomorphisms_iter() if monomorphic else gm.subgraph_isomorphisms_iter())
+            return
+
+        radius = nx.eccentricity(other.nx_graph, anchor)
+
+        candidates = list(self.nodes_matching(other[anchor]))
+        for candidate in candidates:
+            yield from self.generate_subgraphs_anchored_at(other, candidate, anchor, radius, monomorphic)
+
+
+    def generate_subgraphs_anchored_at(self, other: 'Graph', host: NodeHandle, anchor: NodeHandle,
+                                       radius: Optional[int] = None, monomorphic: bool = False) -> Iterator[GraphMapping]:
+        """ Generate mappings (self node -> other node) of subgraphs of this graph matching `other`, that send `host` to `anchor`.
+
+        :param other: pattern graph, usually lhs of a production
+        :param host: handle of node of this graph
+        :param anchor: handle of node of the pattern graph
+        :param radius: eccentricity of `anchor` in `other`; computed if not specified
+        :param monomorphic: whether to generate subgraph monomorphisms instead of (node-induced) subgraph isomorphisms
+        """
+        if not node_attrs_match(self[host], other[anchor]):
+            return
+        if radius is None:
+            radius = nx.eccentricity(other.nx_graph, anchor)
+
+        # Every node of the match lies within this distance from the node the anchor is mapped to
+        ball = self.neighbourhood_of((host,), radius)
+        gm = nx.isomorphism.GraphMatcher(self._storage.to_networkx(ball), other.nx_graph, node_match=node_equality, edge_match=edge_equality)
+        mapping_gen = gm.subgraph_monomorphisms_iter() if monomorphic else gm.subgraph_isomorphisms_iter()
+        # Mappings sending the anchor elsewhere are generated from other candidates
+        yield from (mapping for mapping in mapping_gen if mapping.get(host) == anchor)
+
+
     def node_for_handle(self, handle: NodeHandle) -> Node:
         return Node(handle=handle, attrs=self[handle])
 
@@ -127,7 +340,7 @@ class Graph:
     def __getitem__(self, node: NodeHandle) -> NodeAttrs:
         # Actually we want to throw in case there is no such node
         try:
-            return self._graph.nodes[node]['payload']
+            return self._storage.node_attrs(node)
         except KeyError as err:
             print(f"Attempt to get node with handle {node} that does not exist in graph")
             raise err
@@ -138,7 +351,24 @@ class Graph:
 
 
     def edge_attrs(self, edge: EdgeEndpoints) -> EdgeAttrs:
-        return self._graph[edge[0]][edge[1]]['payload']
+        attrs = self._storage.find_edge_attrs(edge[0], edge[1])
+        if attrs is None:
+            raise KeyError(edge)
+        return attrs
+
+
+    def find_edge_attrs(self, handle_1: NodeHandle, handle_2: NodeHandle) -> Optional[EdgeAttrs]:
+        """ Returns attrs of the edge between given nodes or None if they are not adjacent. """
+        return self._storage.find_edge_attrs(handle_1, handle_2)
+
+
+    def adjacent_edges(self, handle: NodeHandle) -> Iterator[tuple[NodeHandle, EdgeAttrs]]:
+        """ Generate (neighbour handle, attrs of the edge leading to it) pairs for given node. """
+        return self._storage.adjacent_edges(handle)
+
+
+    def degree(self, handle: NodeHandle) -> int:
+        return self._storage.degree(handle)
 
 
     def edge_for_handles(self, handle_1: NodeHandle, handle_2: NodeHandle) -> Edge:
@@ -152,71 +382,11 @@ class Graph:
 
 
     def display(self, newstyle=False, **kwargs):
-        if newstyle == True:
-            self.__display_newstyle(**kwargs)
-            return
-
-        positions = {
-            node: (self[node].x, self[node].y) for node in self._graph.nodes
-        }
-        edge_labels = {
-            (u, v): f'{self.edge_attrs((u, v))}' for u, v in self._graph.edges
-        }
-        node_labels = {
-            u: self.node_attrs(u).__str__(u) for u in self._graph.nodes
-        }
-
-        nx.draw_networkx(self.nx_graph, pos=positions, labels=node_labels, **kwargs)
-        nx.draw_networkx_edge_labels(self.nx_graph, pos=positions, edge_labels=edge_labels, **kwargs)
-
-
-    def __display_newstyle(self, **kwargs):
-        positions = {
-            node: (self[node].x, self[node].y) for node in self._graph.nodes
-        }
-        edge_labels = {
-            (u, v): f'{self.edge_attrs((u, v))}' for u, v in self._graph.edges
-        }
-        node_labels = {
-            u: str(u) for u in self._graph.nodes
-        }
-
-        for node_type in 'vqp':
-            shape = 'o'
-            if node_type == 'q':
-                shape = '^'
-            elif node_type == 'p':
-                shape = 'v'
-
-            for flag_value in (True, False, None):
-                color = '#66bb6a' if flag_value == True else '#bdbdbd'
-                nodes_to_draw = list(filter(self.__filter_node(node_type, flag_value), self._graph.nodes))
-                nx.draw_networkx_nodes(self.nx_graph, pos=positions, node_color=color, node_shape=shape, nodelist=nodes_to_draw, label=node_type)
-
-        nx.draw_networkx_labels(self.nx_graph, pos=positions)
-
-        e_edges = list(filter(self.__filter_edge('e'), self._graph.edges))
-        nx.draw_networkx_edges(self.nx_graph, pos=positions, edgelist=e_edges)
-
-        other_edges = list(filter(self.__filter_edge('pq'), self._graph.edges))
-        nx.draw_networkx_edges(self.nx_graph, pos=positions, edgelist=other_edges, style=':')
-
-
-
-    def __filter_node(self, node_type: str, flag_value: Optional[bool]) -> bool:
-        def __actual_filter(handle: NodeHandle) -> bool:
-            attrs = self[handle]
-            return attrs.label == node_type and attrs.flag == flag_value
-
-        return __actual_filter
-
-
-    def __filter_edge(self, edge_types: Iterable):
-        def __actual_filter(endpoints: EdgeEndpoints) -> bool:
-            attrs = self.edge_attrs(endpoints)
-            return attrs.kind in edge_types
-
-        return __actual_filter
+        """ Draw the graph with networkx & matplotlib, see `visualisation.display_graph`. Plotting stack is imported
+        on the first call only, so that the graph does not need it otherwise.
+        """
+        from visualisation import display_graph
+        display_graph(self, newstyle=newstyle, **kwargs)
 
 
     def add_q_hyperedge(self, nodes: tuple[Node, Node, Node, Node], edge_attrs: EdgeAttrs, q_node_handle: NodeHandle = None) -> NodeHandle:
@@ -234,6 +404,7 @@ class Graph:
         q_node = Node(node_attrs, q_node_handle)
         q_node_handle = self.add_node(q_node)
         self.add_edge_collection(Edge(node.handle, q_node.handle, edge_attrs) for node in nodes)
+        self.__register_hyperedge(q_node_handle, Hyperedge('q', tuple(node.handle for node in nodes), edge_attrs.flag))
         return q_node_handle
 
 
@@ -262,6 +433,7 @@ class Graph:
         p_node = Node(node_attrs, handle=p_node_handle)
         p_node_handle = self.add_node(p_node)
         self.add_edge_collection(Edge(node.handle, p_node.handle, edge_attrs) for node in nodes)
+        self.__register_hyperedge(p_node_handle, Hyperedge('p', tuple(node.handle for node in nodes), edge_attrs.flag))
         return p_node_handle
 
 
@@ -284,11 +456,79 @@ class Graph:
         node_attrs = self.node_attrs(handle)
         assert node_attrs.label in ('p', 'q'), f"Attempt to modify flag value of not-hyperedge edge (type: {node_attrs.label})"
 
-        edges_out_view = self._graph[handle]
+        self.update_node_flag(handle, flag)
 
-        node_attrs.flag = flag
-        for neigh_handle in edges_out_view.keys():
-            self._graph[handle][neigh_handle]['payload'].flag = flag
+        if handle in self._hyperedges:
+            neighbours = self._hyperedges[handle].corners
+        else:
+            neighbours = tuple(self._storage.neighbours(handle))
+        self.__set_edge_flags(handle, neighbours, [flag] * len(neighbours))
+
+
+    def update_node_flag(self, handle: NodeHandle, flag: Optional[bool]):
+        """ Updates flag value of given node. Use this method instead of modifying `NodeAttrs` of node
+        present in the graph directly, otherwise graph indexes become stale.
+        """
+        self.__check_mutable()
+        self.__set_node_flag(handle, flag)
+        if handle in self._hyperedges:
+            self.__set_slot(self._hyperedges, handle, self._hyperedges[handle]._replace(flag=flag))
+
+
+    def move_node(self, handle: NodeHandle, x: float, y: float):
+        """ Updates coordinates of given node. Use this method instead of modifying `NodeAttrs` of node
+        present in the graph directly, otherwise the spatial index becomes stale.
+        """
+        self.__check_mutable()
+        self.__move_node(handle, x, y)
+        if handle in self._hyperedges:
+            self.__bound_hyperedge_radius(handle)
+        for hyperedge_handle in self._hyperedges_of_node.get(handle, ()):
+            self.__bound_hyperedge_radius(hyperedge_handle)
+
+
+    def nodes_in_bbox(self, x_min: float, y_min: float, x_max: float, y_max: float,
+                      labels: Iterable[str] = ('v', *HYPEREDGE_LABELS)) -> list[NodeHandle]:
+        """ Returns handles of nodes with one of given labels lying in given (closed) box.
+        Pass `labels=HYPEREDGE_LABELS` to get the hyperedges whose centres lie in the box.
+        """
+        labels = set(labels)
+        return [handle for handle in self.__spatial().in_bbox(x_min, y_min, x_max, y_max) if self[handle].label in labels]
+
+
+    def nearest_nodes(self, x: float, y: float, k: int = 1, labels: Iterable[str] = ('v', *HYPEREDGE_LABELS)) -> list[NodeHandle]:
+        """ Returns handles of (at most) `k` nodes with one of given labels nearest to point (x, y), nearest first. """
+        labels = set(labels)
+        nearest = self.__spatial().nearest(x, y, predicate=lambda handle: self[handle].label in labels)
+        return [handle for _, handle in it.islice(nearest, k)]
+
+
+    def hyperedge_at(self, x: float, y: float) -> Optional[NodeHandle]:
+        """ Returns handle of (the centre node of) the hyperedge, whose element contains point (x, y), or None if
+        the point lies outside of the mesh. Points on the border of elements belong to any of them.
+        """
+        bound = self._hyperedge_radius_bound ** 2
+        candidates = self.__spatial().nearest(x, y, predicate=lambda handle: handle in self._hyperedges)
+        for distance, handle in candidates:
+            # Element containing the point can not have its centre further away than its corners
+            if distance > bound:
+                return None
+            if self.__element_contains(handle, x, y):
+                return handle
+        return None
+
+
+    def create_journal(self) -> MutationJournal:
+        """ Create journal that records all subsequent mutations of this graph. Remember to `detach_journal` it
+        once it is no longer needed, as every attached journal makes mutations a bit more expensive.
+        """
+        journal = MutationJournal()
+        self._journals.append(journal)
+        return journal
+
+
+    def detach_journal(self, journal: MutationJournal):
+        self._journals.remove(journal)
 
 
     def split_edge_with_vnode(self, edge: EdgeEndpoints, node_flag: bool = None, node_handle: NodeHandle = None) -> Node:
@@ -314,50 +554,371 @@ class Graph:
         self.add_edge(Edge(edge[0], h_node.handle, EdgeAttrs(kind='e', flag=edge_attrs.flag)))
         self.add_edge(Edge(h_node.handle, edge[1], EdgeAttrs(kind='e', flag=edge_attrs.flag)))
 
+        parent = edge_key(edge[0], edge[1])
+        self.__set_slot(self._edge_splits, parent, h_node.handle)
+        self.__set_slot(self._split_parents, h_node.handle, parent)
+
         return h_node
 
     def get_node_between(self, nodes: tuple[NodeHandle, NodeHandle]) -> Node:
         """ Returns node that is between two given nodes.
             Fails if there is no such node or there are more than one.
+
+        O(1) for edges split with `split_edge_with_vnode`; for others all common neighbours of the nodes are examined.
+        """
+        midpoint = self._edge_splits.get(edge_key(nodes[0], nodes[1]))
+        if midpoint is not None:
+            return self.node_for_handle(midpoint)
+
+        between = [
+            neigh_handle for neigh_handle, edge_attrs in self.adjacent_edges(nodes[0])
+            if edge_attrs.kind == 'e' and (attrs := self.find_edge_attrs(neigh_handle, nodes[1])) is not None and attrs.kind == 'e'
+        ]
+        assert len(between) == 1, f"Expected single node between {nodes}, found {between}"
+        return self.node_for_handle(between[0])
+
+    def midpoint_of(self, handle_1: NodeHandle, handle_2: NodeHandle) -> Optional[NodeHandle]:
+        """ Returns handle of the node splitting edge between given nodes (see `split_edge_with_vnode`) or None if
+        the edge has not been split, or one of its halves is gone since then. O(1).
         """
-        path = nx.shortest_path(self._graph, nodes[0], nodes[1])
-        assert(len(path)) == 3
-        return self.node_for_handle(path[1])
+        return self._edge_splits.get(edge_key(handle_1, handle_2))
+
+    def split_edges(self) -> KeysView[EdgeEndpoints]:
+        """ Returns live, read-only set-like view of keys (see `edge_key`) of edges currently split in halves. O(1). """
+        return self._edge_splits.keys()
+
+    def neighbourhood_of(self, handles: Iterable[NodeHandle], radius: int) -> set[NodeHandle]:
+        """ Returns handles of all nodes within `radius` hops from any of given nodes (including these nodes). """
+        visited = set(handles)
+        frontier = list(visited)
+        for _ in range(radius):
+            next_frontier = []
+            for handle in frontier:
+                for neigh_handle in self._storage.neighbours(handle):
+                    if neigh_handle not in visited:
+                        visited.add(neigh_handle)
+                        next_frontier.append(neigh_handle)
+            frontier = next_frontier
+        return visited
 
     def get_nodes(self) -> list[Node]:
         """ Returns list of all nodes in the graph."""
-        return list(map(lambda node: Node(node[1], node[0]), self._graph.nodes(data='payload')))
+        return list(map(lambda node: Node(node[1], node[0]), self._storage.nodes_with_attrs()))
 
     def get_edges(self) -> list[Edge]:
         """ Returns list of all edges in the graph."""
-        return list(map(lambda edge: Edge(edge[0], edge[1], edge[2]), self._graph.edges(data='payload')))
+        return list(map(lambda edge: Edge(edge[0], edge[1], edge[2]), self._storage.edges()))
 
     def get_real_nodes(self) -> list[Node]:
-        """ Returns list of all real nodes (without hyperedges) in the graph."""
-        return list(filter(lambda node: node.attrs.label == 'v', self.get_nodes()))
+        """ Returns list of all real nodes (without hyperedges) in the graph. See `nodes_view` for the lazy variant."""
+        return list(self.nodes_view('v'))
 
     def get_hyperedge_nodes(self) -> list[Node]:
         """ Returns list of all 'fake' hyperedge nodes in the graph."""
-        return list(filter(lambda node: node.attrs.label in ('p', 'q'), self.get_nodes()))
+        return list(self.nodes_view(HYPEREDGE_LABELS))
 
     def get_real_edges(self) -> list[Edge]:
-        """ Returns list of all real edges (without hyperedges) in the graph."""
-        return list(filter(lambda edge: edge.attrs.kind == 'e', self.get_edges()))
+        """ Returns list of all real edges (without hyperedges) in the graph. See `edges_view` for the lazy variant."""
+        return list(self.edges_view('e'))
 
     def get_hyperedge_edges(self) -> list[Edge]:
         """ Returns list of all 'fake' hyperedge edges in the graph."""
-        return list(filter(lambda edge: edge.attrs.kind in ('p', 'q'), self.get_edges()))
+        return list(self.edges_view(HYPEREDGE_LABELS))
+
+    def nodes_view(self, labels: Iterable[str] = ('v', *HYPEREDGE_LABELS), flag: Optional[bool] = ANY_FLAG) -> NodeView:
+        """ Returns live, read-only sequence of nodes with given labels (and flag, if specified), backed by the graph
+        indexes. Unlike `get_real_nodes` & co. it allocates nothing upfront; `Node` objects are created on access only.
+        Use `generation` to tell whether results derived from the view are still valid.
+        """
+        return NodeView(self, tuple(labels), flag)
+
+    def edges_view(self, kinds: Iterable[str] = ('e', *HYPEREDGE_LABELS), flag: Optional[bool] = ANY_FLAG) -> EdgeView:
+        """ Same as `nodes_view`, but for edges of given kinds. """
+        return EdgeView(self, tuple(kinds), flag)
+
+    def rewrite(self) -> 'GraphRewrite':
+        """ Start a batch of mutations, applied at once by `GraphRewrite.commit` (or on leaving the `with` block). """
+        self.__check_mutable()
+        return GraphRewrite(self)
+
+    def _apply_rewrite(self, rewrite: 'GraphRewrite'):
+        """ Commit given batch, see `GraphRewrite`. """
+        self.__check_mutable()
+        handles = self._node_handle_factory.reserve(rewrite._generated)
+        assert handles.start == rewrite._first_handle, "The graph has been mutated while the rewrite was being built"
+
+        for handle, flag in rewrite._node_flags.items():
+            self.update_node_flag(handle, flag)
+        for handle, flag in rewrite._hyperedge_flags.items():
+            self.update_hyperedge_flag(handle, flag)
+        for handle in rewrite._removed_nodes:
+            self.remove_node(handle)
+        for handle_1, handle_2 in rewrite._removed_edges:
+            self.remove_edge(handle_1, handle_2)
+
+        assert len({handle for handle, _ in rewrite._nodes}) == len(rewrite._nodes), "Attempt to add the same node twice"
+        for handle, _ in rewrite._nodes:
+            assert not self._storage.has_node(handle), f"Attempt to add node with handle {handle} which already exists"
+            if handle not in handles:
+                self._node_handle_factory.claim(handle)
+        self.__insert_nodes(rewrite._nodes)
+
+        fresh = []
+        for edge in rewrite._edges:
+            if self._storage.has_edge(edge.u, edge.v) or edge_key(edge.u, edge.v) in self._edge_splits:
+                self.add_edge(edge)
+            else:
+                fresh.append((edge.u, edge.v, edge.attrs))
+        self.__insert_edges(fresh)
+
+        for parent, midpoint in rewrite._splits:
+            self.__set_slot(self._edge_splits, parent, midpoint)
+            self.__set_slot(self._split_parents, midpoint, parent)
+        for handle, hyperedge in rewrite._hyperedges:
+            self.__register_hyperedge(handle, hyperedge)
+
+    def begin(self):
+        """ Open a transaction: all subsequent mutations are recorded in an undo log until the transaction is
+        committed or rolled back. Transactions can be nested.
+        """
+        if self._undo_log is None:
+            self._undo_log = []
+        self._transactions.append((len(self._undo_log), self._node_handle_factory.state(), self._state_id))
+
+    def commit(self):
+        """ Close the innermost transaction keeping its mutations; these are still undone if an enclosing
+        transaction is rolled back.
+        """
+        assert len(self._transactions) > 0, "There is no open transaction"
+        self._transactions.pop()
+        if len(self._transactions) == 0:
+            self._undo_log = None
+
+    def rollback(self):
+        """ Close the innermost transaction undoing all of its mutations, in O(number of the mutations). Journals
+        record the undoing as any other mutation. Iteration order of the graph indexes might differ afterwards.
+        """
+        assert len(self._transactions) > 0, "There is no open transaction"
+        length, generator_state, state_id = self._transactions.pop()
+        undo_log, self._undo_log = self._undo_log, None
+        while len(undo_log) > length:
+            self.__undo(undo_log.pop())
+        self._node_handle_factory.restore(generator_state)
+        self._state_id = state_id
+        if len(self._transactions) > 0:
+            self._undo_log = undo_log
+
+    @contextmanager
+    def transaction(self):
+        """ Context manager running its body in a transaction, that is rolled back if the body raises. """
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+    @property
+    def in_transaction(self) -> bool:
+        return len(self._transactions) > 0
+
+    def snapshot(self) -> GraphSnapshot:
+        """ Take O(1) snapshot of the graph, to explore alternative derivations from it: run one, `revert` to the
+        snapshot getting the mutations of the branch as a delta, run another one & so on; then `replay` the delta of
+        the chosen branch. Only the current state is materialized, branches cost memory proportional to the number
+        of nodes & edges they touch.
+
+        Snapshot opens a transaction (see `begin`) that lasts until it is `release`d, so snapshots (and
+        transactions) must be released in the reverse order they were taken in.
+        """
+        self.begin()
+        return GraphSnapshot(len(self._transactions), self._state_id)
+
+    def revert(self, snapshot: GraphSnapshot) -> GraphDelta:
+        """ Undo all mutations done since given snapshot (including these in transactions opened since then, that
+        get closed), in O(number of the mutations). The snapshot stays valid.
+
+        :return: the undone mutations, which can be re-applied with `replay`
+        """
+        assert snapshot.depth <= len(self._transactions), "Attempt to revert to released snapshot"
+        length, generator_state, state_id = self._transactions[snapshot.depth - 1]
+        assert state_id == snapshot.state_id, "Attempt to revert to released snapshot"
+        branch_generator_state = self._node_handle_factory.state()
+
+        # Undoing mutations records the mutations reverting them, i.e. the redo log of the branch
+        undo_log, self._undo_log = self._undo_log, []
+        while len(undo_log) > length:
+            self.__undo(undo_log.pop())
+        redo_log, self._undo_log = self._undo_log, undo_log
+
+        del self._transactions[snapshot.depth:]
+        self._node_handle_factory.restore(generator_state)
+        self._state_id = state_id
+        return GraphDelta(state_id, redo_log, branch_generator_state)
+
+    def replay(self, delta: GraphDelta):
+        """ Re-apply mutations of a branch (see `revert`) on the state it started from, in O(number of the mutations).
+        The delta can be replayed again after reverting it.
+        """
+        assert self._state_id == delta.base_state_id, "Delta can be replayed only on the state it has been recorded from"
+        self.__check_mutable()
+        for entry in reversed(delta.entries):
+            self.__undo(entry)
+        self._node_handle_factory.restore(delta.generator_state)
+
+    def release(self, snapshot: GraphSnapshot):
+        """ Forget given snapshot (& the snapshots taken after it), keeping the current state of the graph. """
+        assert snapshot.depth <= len(self._transactions), "Attempt to release released snapshot"
+        while len(self._transactions) >= snapshot.depth:
+            self.commit()
+
+    def freeze(self):
+        """ Make the graph read-only, so that it can be safely shared, e.g. as lhs of all instances of a production.
+        Every subsequent attempt to mutate it raises RuntimeError. Note that attrs of its nodes & edges are not protected.
+        """
+        self._frozen = True
+
+    @property
+    def is_frozen(self) -> bool:
+        return self._frozen
+
+    @property
+    def generation(self) -> int:
+        """ Counter bumped on every mutation of the graph; results derived from the graph can be cached until it changes. """
+        return self._generation
+
+    def nodes_with_label(self, label: str) -> AbstractSet[NodeHandle]:
+        """ Returns live, read-only set-like view of handles of nodes with given label, in insertion order. O(1). """
+        return self._attr_index.nodes_with_label(label)
+
+    def nodes_with_label_and_flag(self, label: str, flag: Optional[bool]) -> AbstractSet[NodeHandle]:
+        """ Returns live, read-only set-like view of handles of nodes with given label & flag. O(1). """
+        return self._attr_index.nodes_with_label_and_flag(label, flag)
+
+    def count_nodes_matching(self, attrs: NodeAttrs) -> int:
+        """ Returns number of nodes that match given (pattern) attrs, in the sense of `node_attrs_match`. O(1). """
+        if attrs.flag is None:
+            return len(self.nodes_with_label(attrs.label))
+        return len(self.nodes_with_label_and_flag(attrs.label, attrs.flag)) + len(self.nodes_with_label_and_flag(attrs.label, None))
+
+    def nodes_matching(self, attrs: NodeAttrs) -> Iterable[NodeHandle]:
+        """ Returns handles of nodes that match given (pattern) attrs, in the sense of `node_attrs_match`. """
+        if attrs.flag is None:
+            return self.nodes_with_label(attrs.label)
+        return it.chain(self.nodes_with_label_and_flag(attrs.label, attrs.flag), self.nodes_with_label_and_flag(attrs.label, None))
+
+    def edges_with_kind(self, kind: str) -> AbstractSet[EdgeEndpoints]:
+        """ Returns live, read-only set-like view of endpoints (see `edge_key`) of edges of given kind. O(1). """
+        return self._attr_index.edges_with_kind(kind)
+
+    def edges_with_kind_and_flag(self, kind: str, flag: bool) -> AbstractSet[EdgeEndpoints]:
+        """ Returns live, read-only set-like view of endpoints (see `edge_key`) of edges of given kind & flag. O(1). """
+        return self._attr_index.edges_with_kind_and_flag(kind, flag)
+
+    def hyperedge(self, handle: NodeHandle) -> Hyperedge:
+        """ Returns entry of the hyperedge table for the hyperedge with given centre node. Raises KeyError if there is no such hyperedge.
+        Corners are kept in the order they were passed to `add_q_hyperedge` / `add_p_hyperedge`. O(1).
+        """
+        return self._hyperedges[handle]
+
+    def is_hyperedge(self, handle: NodeHandle) -> bool:
+        return handle in self._hyperedges
+
+    def hyperedges(self) -> KeysView[NodeHandle]:
+        """ Returns live, read-only set-like view of handles (centre nodes) of all hyperedges, in insertion order. O(1). """
+        return self._hyperedges.keys()
+
+    def hyperedges_of(self, handle: NodeHandle) -> KeysView[NodeHandle]:
+        """ Returns live, read-only set-like view of handles of hyperedges given node is a corner of. O(1). """
+        return self._hyperedges_of_node.get(handle, {}).keys()
 
     def has_edge(self, edge: EdgeEndpoints) -> bool:
-        return self._graph.has_edge(edge.u, edge.v)
+        return self._storage.has_edge(edge.u, edge.v)
 
     def dump_edge(self, fname):
-        nx.write_edgelist(self._graph, fname)
+        nx.write_edgelist(self.nx_graph, fname)
+
+
+    def save(self, file: Path | str | BinaryIO):
+        """ Save the whole state of the graph (nodes, edges, hyperedge table, edge splits & state of the handle
+        generator) into binary file, which can be loaded with `Graph.load`, see `serialization` for the format.
+        The data is streamed into the file column by column. Open transactions, snapshots & journals are not saved.
+
+        Only graphs kept in `ArrayStorage` can be saved, as it hands out its columns as whole arrays: saving a mesh
+        of million nodes takes ~0.6s.
+        """
+        assert isinstance(self._storage, ArrayStorage), "Only graphs kept in ArrayStorage can be saved"
+        high_water_mark, released = self._node_handle_factory.state()
+        meta = {
+            'reuse_node_handles': self._reuse_node_handles,
+            'high_water_mark': high_water_mark,
+            'hyperedge_radius_bound': self._hyperedge_radius_bound,
+        }
+        with util.gc_paused():
+            serialization.write_container(file, self.__state_chunks(released), meta)
+
+
+    @staticmethod
+    def load(file: Path | str | BinaryIO, mmap: bool = True) -> 'Graph':
+        """ Load graph saved with `save` into `ArrayStorage`. Handles, attrs & everything else are the same as in
+        the saved graph, only the order of nodes & edges in the label & kind indexes might differ.
+
+        Nodes & edges are copied into the storage in bulk, which answers the label & kind queries straight from its
+        arrays, and the hyperedge table is built from the loaded columns only once it is first needed. Loading a mesh
+        of million nodes thus takes ~0.5s; the hyperedge table adds ~1.2s, whenever it gets built.
+
+        :param mmap: whether to memory-map the file rather than read it, see `serialization.read_container`
+        """
+        container = serialization.read_container(file, mmap)
+        arrays, meta = container.arrays, container.meta
+        storage = ArrayStorage()
+
+        with util.gc_paused():
+            storage.add_node_columns(NodeColumns(*(arrays[f'node_{field}'] for field in NodeColumns._fields)))
+            storage.add_edge_columns(EdgeColumns(*(arrays[f'edge_{field}'] for field in EdgeColumns._fields)))
+
+            graph = Graph(storage, reuse_node_handles=meta['reuse_node_handles'])
+            # Copied, so that the graph does not keep the file mapped (which would break once the file is overwritten)
+            graph.__hyperedge_chunks = {name: np.array(array) for name, array in arrays.items() if name.startswith('hyperedge_')}
+            graph._hyperedge_radius_bound = meta['hyperedge_radius_bound']
+
+            parents = list(map(EdgeEndpoints._make, zip(arrays['split_u'].tolist(), arrays['split_v'].tolist())))
+            midpoints = arrays['split_midpoint'].tolist()
+            graph._edge_splits = dict(zip(parents, midpoints))
+            graph._split_parents = dict(zip(midpoints, parents))
+
+        graph._node_handle_factory.restore((meta['high_water_mark'], dict.fromkeys(arrays['released_handles'].tolist())))
+        return graph
+
+
+    @property
+    def _hyperedges(self) -> dict[NodeHandle, Hyperedge]:
+        """ Hyperedge table; graph that has been loaded builds it on the first access, see `load`. """
+        if self.__hyperedge_chunks is not None:
+            self.__unpack_hyperedges()
+        return self.__hyperedge_table
+
+
+    @property
+    def _hyperedges_of_node(self) -> dict[NodeHandle, dict[NodeHandle, None]]:
+        """ Reverse index of the hyperedge table, see `_hyperedges`. """
+        if self.__hyperedge_chunks is not None:
+            self.__unpack_hyperedges()
+        return self.__hyperedges_by_node
 
 
     @property
     def nx_graph(self) -> nx.Graph:
-        return self._graph
+        """ Graph as `nx.Graph` with 'payload' node & edge attribute. Depending on the storage it is either live
+        graph the storage keeps the data in or a copy built on every access.
+        """
+        return self._storage.to_networkx()
+
+
+    @property
+    def storage(self) -> GraphStorage:
+        return self._storage
 
 
     @property
@@ -365,17 +926,419 @@ class Graph:
         return self._node_handle_factory
 
 
-    def _find_graph_unique_node_handle(self):
-        # We first start by selecting firt **potentially** feasible
-        handle = self._node_handle_factory()
-        if not self._graph.has_node(handle):
-            return handle
+    def __state_chunks(self, released_handles: Iterable[NodeHandle]) -> Iterator[tuple[str, np.ndarray]]:
+        """ Generate named arrays with the state of the graph, see `save`; each is built only when it is needed. """
+        yield from zip((f'node_{field}' for field in NodeColumns._fields), self._storage.node_columns())
+        yield from zip((f'edge_{field}' for field in EdgeColumns._fields), self._storage.edge_columns())
+
+        if self.__hyperedge_chunks is not None:
+            # Loaded graph, whose hyperedge table has not been needed so far
+            yield from self.__hyperedge_chunks.items()
+        else:
+            yield from self.__hyperedge_table_chunks()
+
+        yield 'split_u', np.fromiter((parent.u for parent in self._edge_splits), dtype=np.int64, count=len(self._edge_splits))
+        yield 'split_v', np.fromiter((parent.v for parent in self._edge_splits), dtype=np.int64, count=len(self._edge_splits))
+        yield 'split_midpoint', np.fromiter(self._edge_splits.values(), dtype=np.int64, count=len(self._edge_splits))
+        yield 'released_handles', np.fromiter(released_handles, dtype=np.int64)
+
+
+    def __hyperedge_table_chunks(self) -> Iterator[tuple[str, np.ndarray]]:
+        hyperedges = self.__hyperedge_table
+        yield 'hyperedge_centre', np.fromiter(hyperedges.keys(), dtype=np.int64, count=len(hyperedges))
+        yield 'hyperedge_kind', np.fromiter((KIND_CODES.index(hyperedge.kind) for hyperedge in hyperedges.values()), dtype=np.int8, count=len(hyperedges))
+        yield 'hyperedge_flag', np.fromiter((flag_code(hyperedge.flag) for hyperedge in hyperedges.values()), dtype=np.int8, count=len(hyperedges))
+        corner_counts = np.fromiter((len(hyperedge.corners) for hyperedge in hyperedges.values()), dtype=np.int64, count=len(hyperedges))
+        yield 'hyperedge_corner_offset', np.concatenate(([0], np.cumsum(corner_counts)))
+        yield 'hyperedge_corners', np.fromiter(it.chain.from_iterable(hyperedge.corners for hyperedge in hyperedges.values()),
+                                               dtype=np.int64, count=int(corner_counts.sum()))
+
+
+    def __unpack_hyperedges(self):
+        chunks, self.__hyperedge_chunks = self.__hyperedge_chunks, None
+        corner_offsets, corners = chunks['hyperedge_corner_offset'].tolist(), chunks['hyperedge_corners'].tolist()
+        with util.gc_paused():
+            for centre, kind, flag, start, end in zip(chunks['hyperedge_centre'].tolist(), chunks['hyperedge_kind'].tolist(),
+                                                      chunks['hyperedge_flag'].tolist(), corner_offsets, corner_offsets[1:]):
+                hyperedge = Hyperedge(KIND_CODES[kind], tuple(corners[start:end]), FLAG_CODES[flag])
+                self.__hyperedge_table[centre] = hyperedge
+                for corner in hyperedge.corners:
+                    self.__hyperedges_by_node.setdefault(corner, {})[centre] = None
+
+
+    def __register_hyperedge(self, handle: NodeHandle, hyperedge: Hyperedge):
+        self.__set_slot(self._hyperedges, handle, hyperedge)
+        for corner in hyperedge.corners:
+            hyperedges = self._hyperedges_of_node.get(corner)
+            if hyperedges is None:
+                hyperedges = {}
+                self.__set_slot(self._hyperedges_of_node, corner, hyperedges)
+            self.__set_slot(hyperedges, handle, None)
+        self.__bound_hyperedge_radius(handle)
+
+
+    def __bound_hyperedge_radius(self, handle: NodeHandle):
+        centre = self[handle]
+        for corner in self._hyperedges[handle].corners:
+            corner_attrs = self[corner]
+            radius = math.hypot(corner_attrs.x - centre.x, corner_attrs.y - centre.y)
+            self._hyperedge_radius_bound = max(self._hyperedge_radius_bound, radius)
+
+
+    def __element_contains(self, handle: NodeHandle, x: float, y: float) -> bool:
+        # Elements are convex, so sorting corners around the centre gives their boundary
+        centre = self[handle]
+        corners = [self[corner] for corner in self._hyperedges[handle].corners]
+        if len(corners) < 3:
+            return False
+        corners.sort(key=lambda attrs: math.atan2(attrs.y - centre.y, attrs.x - centre.x))
+        eps = 1e-12
+        for attrs_a, attrs_b in zip(corners, corners[1:] + corners[:1]):
+            cross = (attrs_b.x - attrs_a.x) * (y - attrs_a.y) - (attrs_b.y - attrs_a.y) * (x - attrs_a.x)
+            if cross < -eps:
+                return False
+        return True
+
+
+    def __check_mutable(self):
+        if self._frozen:
+            raise RuntimeError("Attempt to mutate frozen graph")
+
+
+    def __forget_split(self, parent: EdgeEndpoints):
+        midpoint = self.__pop_slot(self._edge_splits, parent)
+        self.__pop_slot(self._split_parents, midpoint)
+
+
+    def __forget_split_through(self, handle_1: NodeHandle, handle_2: NodeHandle):
+        """ Edge between given nodes is going away; if it is a half of split edge, the split is no longer valid. """
+        for midpoint, end in ((handle_1, handle_2), (handle_2, handle_1)):
+            parent = self._split_parents.get(midpoint)
+            if parent is not None and end in parent:
+                self.__forget_split(parent)
+
+
+    def __spatial(self) -> QuadTree:
+        if self._spatial_index is None:
+            self._spatial_index = QuadTree()
+            for handle, attrs in self._storage.nodes_with_attrs():
+                self._spatial_index.insert(handle, attrs.x, attrs.y)
+        return self._spatial_index
+
+
+    def __unregister_hyperedge(self, handle: NodeHandle):
+        hyperedge = self.__pop_slot(self._hyperedges, handle)
+        for corner in hyperedge.corners:
+            self.__unlink_corner(handle, corner)
+
+
+    def __detach_hyperedge_corner(self, handle: NodeHandle, corner: NodeHandle):
+        """ Corner is no longer connected with the hyperedge (its star edge is gone). """
+        hyperedge = self._hyperedges[handle]
+        self.__set_slot(self._hyperedges, handle, hyperedge._replace(corners=tuple(c for c in hyperedge.corners if c != corner)))
+        self.__unlink_corner(handle, corner)
+
+
+    def __unlink_corner(self, handle: NodeHandle, corner: NodeHandle):
+        hyperedges = self._hyperedges_of_node[corner]
+        self.__pop_slot(hyperedges, handle)
+        if len(hyperedges) == 0:
+            self.__pop_slot(self._hyperedges_of_node, corner)
+
+
+    # Primitive mutations: these keep the storage, label/kind indexes, spatial index & journals in sync & record
+    # themselves in the undo log; the remaining tables are recorded slot by slot, see `__set_slot`
+
+    def __insert_node(self, handle: NodeHandle, attrs: NodeAttrs):
+        self.__touch()
+        self._storage.add_node(handle, attrs)
+        self._attr_index.node_added(handle, attrs)
+        if self._spatial_index is not None:
+            self._spatial_index.insert(handle, attrs.x, attrs.y)
+        if self._undo_log is not None:
+            self._undo_log.append(('node_added', handle))
+        for journal in self._journals:
+            journal.node_added(handle)
+
+
+    def __insert_nodes(self, nodes: list[tuple[NodeHandle, NodeAttrs]]):
+        """ Bulk variant of `__insert_node`, hitting the storage once. """
+        self.__touch()
+        self._storage.add_nodes(nodes)
+        for handle, attrs in nodes:
+            self._attr_index.node_added(handle, attrs)
+            if self._spatial_index is not None:
+                self._spatial_index.insert(handle, attrs.x, attrs.y)
+            if self._undo_log is not None:
+                self._undo_log.append(('node_added', handle))
+            for journal in self._journals:
+                journal.node_added(handle)
+
+
+    def __delete_node(self, handle: NodeHandle):
+        """ The node must not have any incident edges. """
+        attrs = self[handle]
+        self.__touch()
+        self._attr_index.node_removed(handle, attrs)
+        if self._spatial_index is not None:
+            self._spatial_index.remove(handle)
+        self._storage.remove_node(handle)
+        if self._undo_log is not None:
+            self._undo_log.append(('node_removed', handle, attrs))
+        for journal in self._journals:
+            journal.node_removed(handle)
+
+
+    def __set_edge(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        """ Add the edge or replace attrs of existing one. """
+        old_attrs = self._storage.find_edge_attrs(handle_1, handle_2)
+        self.__touch()
+        if old_attrs is not None:
+            self._attr_index.edge_removed(handle_1, handle_2, old_attrs)
+            if self._undo_log is not None:
+                # Storage might override the payload of the old attrs object, so its values are recorded as well
+                self._undo_log.append(('edge_replaced', handle_1, handle_2, old_attrs, (old_attrs.kind, old_attrs.flag, old_attrs.handle)))
+        elif self._undo_log is not None:
+            self._undo_log.append(('edge_added', handle_1, handle_2))
+        self._storage.add_edge(handle_1, handle_2, attrs)
+        self._attr_index.edge_added(handle_1, handle_2, attrs)
+        for journal in self._journals:
+            if old_attrs is not None:
+                journal.edge_updated(edge_key(handle_1, handle_2))
+            else:
+                journal.edge_added(edge_key(handle_1, handle_2))
+
+
+    def __insert_edges(self, edges: list[tuple[NodeHandle, NodeHandle, EdgeAttrs]]):
+        """ Add edges, none of which is present yet, hitting the storage once. """
+        self.__touch()
+        self._storage.add_edges(edges)
+        for handle_1, handle_2, attrs in edges:
+            self._attr_index.edge_added(handle_1, handle_2, attrs)
+            if self._undo_log is not None:
+                self._undo_log.append(('edge_added', handle_1, handle_2))
+            for journal in self._journals:
+                journal.edge_added(edge_key(handle_1, handle_2))
+
+
+    def __delete_edge(self, handle_1: NodeHandle, handle_2: NodeHandle):
+        attrs = self.edge_attrs((handle_1, handle_2))
+        self.__touch()
+        self._attr_index.edge_removed(handle_1, handle_2, attrs)
+        self._storage.remove_edge(handle_1, handle_2)
+        if self._undo_log is not None:
+            self._undo_log.append(('edge_removed', handle_1, handle_2, attrs))
+        for journal in self._journals:
+            journal.edge_removed(edge_key(handle_1, handle_2))
+
 
-        # So we have a conflict. Let's find smallest unique handle
-        biggest_occupied = max(self._graph.nodes.keys())
+    def __set_node_flag(self, handle: NodeHandle, flag: Optional[bool]):
+        node_attrs = self.node_attrs(handle)
+        self.__touch()
+        if self._undo_log is not None:
+            self._undo_log.append(('node_flag', handle, node_attrs.flag))
+        self._attr_index.node_removed(handle, node_attrs)
+        node_attrs.flag = flag
+        self._attr_index.node_added(handle, node_attrs)
+        for journal in self._journals:
+            journal.node_updated(handle)
+
+
+    def __set_edge_flags(self, handle: NodeHandle, neighbours: tuple[NodeHandle, ...], flags: list[bool]):
+        """ Set flags of edges between given node & its neighbours. """
+        self.__touch()
+        # All edges of a hyperedge usually share the same attrs object, so we unindex all of them before the update
+        edges = [(neigh_handle, self.edge_attrs((handle, neigh_handle))) for neigh_handle in neighbours]
+        if self._undo_log is not None:
+            self._undo_log.append(('edge_flags', handle, neighbours, [edge_attrs.flag for _, edge_attrs in edges]))
+        for neigh_handle, edge_attrs in edges:
+            self._attr_index.edge_removed(handle, neigh_handle, edge_attrs)
+        for (neigh_handle, edge_attrs), flag in zip(edges, flags):
+            edge_attrs.flag = flag
+        for neigh_handle, edge_attrs in edges:
+            self._attr_index.edge_added(handle, neigh_handle, edge_attrs)
+            for journal in self._journals:
+                journal.edge_updated(edge_key(handle, neigh_handle))
+
+
+    def __move_node(self, handle: NodeHandle, x: float, y: float):
+        node_attrs = self.node_attrs(handle)
+        self.__touch()
+        if self._undo_log is not None:
+            self._undo_log.append(('node_moved', handle, node_attrs.x, node_attrs.y))
+        node_attrs.x = x
+        node_attrs.y = y
+        if self._spatial_index is not None:
+            self._spatial_index.move(handle, x, y)
+        for journal in self._journals:
+            journal.node_updated(handle)
+
+
+    def __touch(self):
+        self._generation += 1
+        self._state_id = next(_state_ids)
+
+
+    def __set_slot(self, table: dict, key, value):
+        if self._undo_log is not None:
+            self._undo_log.append(('slot', table, key, table.get(key, _MISSING)))
+        table[key] = value
+
+
+    def __pop_slot(self, table: dict, key):
+        value = table.pop(key)
+        if self._undo_log is not None:
+            self._undo_log.append(('slot', table, key, value))
+        return value
+
+
+    def __undo(self, entry: tuple):
+        action = entry[0]
+        if action == 'slot':
+            _, table, key, value = entry
+            if value is _MISSING:
+                self.__pop_slot(table, key)
+            else:
+                self.__set_slot(table, key, value)
+        elif action == 'node_added':
+            self.__delete_node(entry[1])
+        elif action == 'node_removed':
+            self.__insert_node(entry[1], entry[2])
+        elif action == 'edge_added':
+            self.__delete_edge(entry[1], entry[2])
+        elif action == 'edge_replaced':
+            _, handle_1, handle_2, attrs, (kind, flag, handle) = entry
+            if attrs is self._storage.find_edge_attrs(handle_1, handle_2):
+                # The storage reused the old attrs object for the new payload
+                attrs = EdgeAttrs(kind, flag, handle)
+            self.__set_edge(handle_1, handle_2, attrs)
+        elif action == 'edge_removed':
+            self.__set_edge(entry[1], entry[2], entry[3])
+        elif action == 'node_flag':
+            self.__set_node_flag(entry[1], entry[2])
+        elif action == 'edge_flags':
+            self.__set_edge_flags(entry[1], entry[2], entry[3])
+        elif action == 'node_moved':
+            self.__move_node(entry[1], entry[2], entry[3])
+        else:
+            assert False, f"Unknown undo log entry {action}"
+
+
+    def reserve_node_handles(self, n: int) -> range:
+        """ Allocate `n` consecutive handles for nodes that are about to be added, e.g. by rhs of a production. O(1). """
+        return self._node_handle_factory.reserve(n)
 
-        self._node_handle_factory.skip(biggest_occupied - handle + 1)
 
+    def _find_graph_unique_node_handle(self):
+        # Every occupied handle is claimed, so the generated one is free, unless it has been handed out
+        # by the `node_handle_factory` to someone who then added the node with it explicitly
         handle = self._node_handle_factory()
+        while self._storage.has_node(handle):
+            handle = self._node_handle_factory()
         return handle
 
+
+class GraphRewrite:
+    """ Batch of mutations of a graph, e.g. the rhs of a production, collected first & then committed in one pass.
+    Create it with `Graph.rewrite`; the methods mirror the mutating methods of `Graph`.
+
+    The graph must not be mutated until the batch is committed, but it can be read, e.g. to look up attrs of the
+    elements being rewritten: the mutations are not visible before the commit. Handles of new nodes are known at once
+    & allocated in bulk on commit; unlike `Graph.add_node`, released handles are not reused here.
+
+    Mutations are committed grouped by type, in this order: flag updates, removals, node insertions, edge insertions.
+    This is what the productions need, e.g. a hyperedge can be removed & its handle given to a new node in one batch.
+    """
+    def __init__(self, graph: Graph) -> None:
+        self._graph = graph
+        self._first_handle = graph.node_handle_factory.peek()
+        self._generated = 0
+        self._node_flags: dict[NodeHandle, Optional[bool]] = {}
+        self._hyperedge_flags: dict[NodeHandle, bool] = {}
+        self._removed_nodes: list[NodeHandle] = []
+        self._removed_edges: list[EdgeEndpoints] = []
+        self._nodes: list[tuple[NodeHandle, NodeAttrs]] = []
+        self._edges: list[Edge] = []
+        self._splits: list[tuple[EdgeEndpoints, NodeHandle]] = []
+        self._hyperedges: list[tuple[NodeHandle, Hyperedge]] = []
+
+    def __enter__(self) -> 'GraphRewrite':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def commit(self):
+        self._graph._apply_rewrite(self)
+
+    def add_node(self, node: Node) -> NodeHandle:
+        """ If `node.handle` is None, the handle is generated (and set) right away. """
+        if node.handle is None:
+            node.handle = self._first_handle + self._generated
+            self._generated += 1
+        self._nodes.append((node.handle, node.attrs))
+        return node.handle
+
+    def add_edge(self, edge: Edge):
+        self._edges.append(edge)
+
+    def remove_edge(self, handle_1: NodeHandle, handle_2: NodeHandle):
+        self._removed_edges.append(EdgeEndpoints(handle_1, handle_2))
+
+    def update_node_flag(self, handle: NodeHandle, flag: Optional[bool]):
+        assert handle in self._graph, f"Attempt to update flag of nonexistent node {handle}"
+        self._node_flags[handle] = flag
+
+    def update_hyperedge_flag(self, handle: NodeHandle, flag: bool):
+        assert handle in self._graph, f"Attempt to update flag of nonexistent hyperedge {handle}"
+        self._hyperedge_flags[handle] = flag
+
+    def split_edge_with_vnode(self, edge: EdgeEndpoints, node_flag: bool = None, node_handle: NodeHandle = None) -> Node:
+        """ See `Graph.split_edge_with_vnode`; the edge must be present in the graph. """
+        attrs_u = self._graph.node_attrs(edge[0])
+        attrs_v = self._graph.node_attrs(edge[1])
+        x, y = util.avg_point_from_node_attrs((attrs_u, attrs_v))
+        edge_attrs = self._graph.edge_attrs(edge)
+
+        hanging = node_flag if node_flag is not None else not edge_attrs.flag
+        h_node = Node(NodeAttrs('v', x, y, flag=hanging), handle=node_handle)
+
+        self.remove_edge(edge[0], edge[1])
+        self.add_node(h_node)
+        self.add_edge(Edge(edge[0], h_node.handle, EdgeAttrs(kind='e', flag=edge_attrs.flag)))
+        self.add_edge(Edge(h_node.handle, edge[1], EdgeAttrs(kind='e', flag=edge_attrs.flag)))
+        self._splits.append((edge_key(edge[0], edge[1]), h_node.handle))
+        return h_node
+
+    def add_q_hyperedge(self, nodes: tuple[Node, Node, Node, Node], edge_attrs: EdgeAttrs, q_node_handle: NodeHandle = None) -> NodeHandle:
+        """ See `Graph.add_q_hyperedge`. """
+        assert len(nodes) == 4
+        assert edge_attrs.kind == 'q'
+        return self.__add_hyperedge(nodes, edge_attrs, q_node_handle, util.avg_point_from_nodes(nodes))
+
+    def add_p_hyperedge(self, nodes: tuple[Node, Node, Node, Node, Node], edge_attrs: EdgeAttrs, p_node_handle: NodeHandle = None, p_node_coords: tuple[float, float] = None) -> NodeHandle:
+        """ See `Graph.add_p_hyperedge`. """
+        assert len(nodes) == 5
+        assert edge_attrs.kind == 'p'
+        coords = p_node_coords if p_node_coords is not None else util.avg_point_from_nodes(nodes)
+        return self.__add_hyperedge(nodes, edge_attrs, p_node_handle, coords)
+
+    def remove_q_hyperedge(self, q_node_handle: NodeHandle):
+        q_node_attrs = self._graph.node_attrs(q_node_handle)
+        assert q_node_attrs.label == 'q', f"Attempt to remove q hyperedge with handle for node with attrs {q_node_attrs}, label={q_node_attrs.label}"
+        self._removed_nodes.append(q_node_handle)
+
+    def remove_p_hyperedge(self, p_node_handle: NodeHandle):
+        p_node_attrs = self._graph.node_attrs(p_node_handle)
+        assert p_node_attrs.label == 'p', f"Attempt to remove P hyperedge with handle for node with attrs {p_node_attrs}, label={p_node_attrs.label}"
+        self._removed_nodes.append(p_node_handle)
+
+    def __add_hyperedge(self, nodes: Iterable[Node], edge_attrs: EdgeAttrs, handle: Optional[NodeHandle],
+                        coords: tuple[float, float]) -> NodeHandle:
+        x, y = coords
+        handle = self.add_node(Node(NodeAttrs(edge_attrs.kind, x, y, edge_attrs.flag), handle))
+        for node in nodes:
+            self.add_edge(Edge(node.handle, handle, edge_attrs))
+        self._hyperedges.append((handle, Hyperedge(edge_attrs.kind, tuple(node.handle for node in nodes), edge_attrs.flag)))
+        return handle
@@ -0,0 +1,65 @@
+from model import NodeHandle, EdgeEndpoints
+
+
+class MutationJournal:
+    """ Records which nodes & edges of a graph were added, removed or re-flagged since the last checkpoint.
+
+    Create it with `Graph.create_journal`; the graph then records every mutation into it until
+    `Graph.detach_journal` is called. Edges are identified by their keys, see `graph.edge_key`.
+    """
+    def __init__(self) -> None:
+        self.added_nodes: set[NodeHandle] = set()
+        self.removed_nodes: set[NodeHandle] = set()
+        self.updated_nodes: set[NodeHandle] = set()
+        self.added_edges: set[EdgeEndpoints] = set()
+        self.removed_edges: set[EdgeEndpoints] = set()
+        self.updated_edges: set[EdgeEndpoints] = set()
+
+    def checkpoint(self):
+        """ Forget all mutations recorded so far. """
+        for records in (self.added_nodes, self.removed_nodes, self.updated_nodes,
+                        self.added_edges, self.removed_edges, self.updated_edges):
+            records.clear()
+
+    def is_empty(self) -> bool:
+        return not (self.added_nodes or self.removed_nodes or self.updated_nodes or
+                    self.added_edges or self.removed_edges or self.updated_edges)
+
+    def dirty_nodes(self) -> set[NodeHandle]:
+        """ Returns handles of all nodes touched since the last checkpoint, including endpoints of touched edges.
+        Some of them might not be present in the graph anymore.
+        """
+        dirty = self.added_nodes | self.removed_nodes | self.updated_nodes
+        for edges in (self.added_edges, self.removed_edges, self.updated_edges):
+            for edge in edges:
+                dirty.update(edge)
+        return dirty
+
+    def node_added(self, handle: NodeHandle):
+        self.added_nodes.add(handle)
+
+    def node_removed(self, handle: NodeHandle):
+        if handle in self.added_nodes:
+            # The node has never been seen by the consumer of this journal
+            self.added_nodes.discard(handle)
+        else:
+            self.removed_nodes.add(handle)
+        self.updated_nodes.discard(handle)
+
+    def node_updated(self, handle: NodeHandle):
+        if handle not in self.added_nodes:
+            self.updated_nodes.add(handle)
+
+    def edge_added(self, edge: EdgeEndpoints):
+        self.added_edges.add(edge)
+
+    def edge_removed(self, edge: EdgeEndpoints):
+        if edge in self.added_edges:
+            self.added_edges.discard(edge)
+        else:
+            self.removed_edges.add(edge)
+        self.updated_edges.discard(edge)
+
+    def edge_updated(self, edge: EdgeEndpoints):
+        if edge not in self.added_edges:
+            self.updated_edges.add(edge)
@@ -0,0 +1,450 @@
+import networkx as nx
+from collections import Counter
+from typing import Iterator, Iterable, Optional, NamedTuple, Callable, Mapping
+from model import NodeHandle, NodeAttrs, GraphMapping
+from graph import Graph, node_attrs_match, HYPEREDGE_LABELS
+
+
+# Predicates of `MatchConstraints`; they get the searched graph & handles of host nodes
+NodePredicate = Callable[[Graph, NodeHandle], bool]
+EdgePredicate = Callable[[Graph, NodeHandle, NodeHandle], bool]
+PartialMappingPredicate = Callable[[Graph, Mapping[NodeHandle, NodeHandle]], bool]
+
+
+class MatchConstraints:
+    """ Semantic constraints on mappings of a pattern beyond labels, flags & edge kinds (e.g. on coordinates or
+    orientation). Search plan checks each of them as soon as the nodes it refers to are bound, pruning whole
+    subtrees of the search instead of filtering complete mappings.
+
+    Predicates should depend only on attributes of the matched nodes & edges, as incremental matching re-checks
+    mappings only when some of their elements get mutated.
+
+    :param node_predicates: pattern node -> predicate of the host node it is mapped to
+    :param edge_predicates: (u, v) edge of the pattern -> predicate of the hosts of u & v (in that order)
+    :param partial_mapping_predicate: predicate of mapping (pattern node -> host node) of the nodes bound so far;
+                                      called every time a node gets bound, so it must accept incomplete mappings
+    """
+    def __init__(self, node_predicates: Optional[dict[NodeHandle, NodePredicate]] = None,
+                 edge_predicates: Optional[dict[tuple[NodeHandle, NodeHandle], EdgePredicate]] = None,
+                 partial_mapping_predicate: Optional[PartialMappingPredicate] = None) -> None:
+        self.node_predicates: dict[NodeHandle, NodePredicate] = node_predicates or {}
+        self.edge_predicates: dict[tuple[NodeHandle, NodeHandle], EdgePredicate] = edge_predicates or {}
+        self.partial_mapping_predicate: Optional[PartialMappingPredicate] = partial_mapping_predicate
+
+    def is_empty(self) -> bool:
+        return not self.node_predicates and not self.edge_predicates and self.partial_mapping_predicate is None
+
+    def is_satisfied_by(self, graph: Graph, mapping: GraphMapping) -> bool:
+        """ Check all of the constraints on complete mapping (graph node -> pattern node), e.g. generated by VF2. """
+        host_of = {pattern_handle: host for host, pattern_handle in mapping.items()}
+        for handle, predicate in self.node_predicates.items():
+            if not predicate(graph, host_of[handle]):
+                return False
+        for (u, v), predicate in self.edge_predicates.items():
+            if not predicate(graph, host_of[u], host_of[v]):
+                return False
+        return self.partial_mapping_predicate is None or self.partial_mapping_predicate(graph, host_of)
+
+    def filter(self, graph: Graph, mappings: Iterable[GraphMapping]) -> Iterator[GraphMapping]:
+        return (mapping for mapping in mappings if self.is_satisfied_by(graph, mapping))
+
+
+class SearchStep(NamedTuple):
+    """ Binding of single pattern node, see `SearchPlan`. Pattern nodes are referred to by their position in the plan. """
+    attrs: NodeAttrs
+    # Already bound pattern node adjacent to this one; candidates are taken from neighbours of its host node
+    parent: int
+    parent_edge_kind: str
+    # Other already bound pattern nodes adjacent to this one, with kinds of the connecting edges
+    checked_edges: tuple[tuple[int, str], ...]
+    # Already bound pattern nodes NOT adjacent to this one; used only when matching node-induced subgraphs
+    non_adjacent: tuple[int, ...]
+    # Symmetry breaking (see `symmetry_breaking_conditions`): host of this node must be greater / less than hosts of
+    # these already bound nodes
+    greater_than: tuple[int, ...] = ()
+    less_than: tuple[int, ...] = ()
+    # Host of this node must be greater than host of the anchor; checked only if the symmetry of the anchor is broken
+    greater_than_anchor: bool = False
+    # Degree of the pattern node; host node must have at least that many neighbours
+    degree: int = 0
+
+
+def find_automorphisms(pattern: Graph) -> list[dict[NodeHandle, NodeHandle]]:
+    """ Returns all automorphisms of the pattern graph, preserving labels, flags & edge kinds.
+
+    Unlike during matching, unspecified flag is equal only to unspecified flag here, so that composing a match with
+    an automorphism always yields a valid match again.
+    """
+    def node_match(nx_node_attrs_1, nx_node_attrs_2) -> bool:
+        attrs_1: NodeAttrs = nx_node_attrs_1['payload']
+        attrs_2: NodeAttrs = nx_node_attrs_2['payload']
+        return attrs_1.label == attrs_2.label and attrs_1.flag == attrs_2.flag
+
+    def edge_match(nx_edge_attrs_1, nx_edge_attrs_2) -> bool:
+        return nx_edge_attrs_1['payload'].kind == nx_edge_attrs_2['payload'].kind
+
+    gm = nx.isomorphism.GraphMatcher(pattern.nx_graph, pattern.nx_graph, node_match=node_match, edge_match=edge_match)
+    return list(gm.isomorphisms_iter())
+
+
+def symmetry_breaking_conditions(automorphisms: list[dict[NodeHandle, NodeHandle]], anchor: NodeHandle
+                                 ) -> tuple[list[tuple[NodeHandle, NodeHandle]], list[tuple[NodeHandle, NodeHandle]]]:
+    """ Compute conditions of form host(a) < host(b) that are satisfied by exactly one of the matches that differ
+    only by an automorphism of the pattern (Grochow & Kellis scheme). Symmetry of the anchor is broken first,
+    so that the remaining conditions alone select single match among these sending the anchor to the same host.
+
+    :return: pair of lists of (a, b) pattern node pairs: conditions involving the anchor & the remaining ones
+    """
+    anchor_orbit = {automorphism[anchor] for automorphism in automorphisms}
+    anchor_conditions = [(anchor, image) for image in sorted(anchor_orbit) if image != anchor]
+
+    group = [automorphism for automorphism in automorphisms if automorphism[anchor] == anchor]
+    conditions = []
+    while len(group) > 1:
+        orbits = {handle: {automorphism[handle] for automorphism in group} for handle in group[0]}
+        handle = max(sorted(orbits), key=lambda handle: len(orbits[handle]))
+        conditions.extend((handle, image) for image in sorted(orbits[handle]) if image != handle)
+        group = [automorphism for automorphism in group if automorphism[handle] == handle]
+
+    return anchor_conditions, conditions
+
+
+class SearchPlan:
+    """ Ordered search plan matching pattern graph starting from given pattern node (the anchor).
+
+    The pattern nodes are bound one by one, each one reached through an edge from already bound node. Next node is
+    the one with most edges to already bound nodes (so that the search is pruned as early as possible), ties are broken
+    in favour of nodes with specified flag & higher degree. Labels, flags & edge kinds are checked before going deeper.
+
+    If automorphisms of the pattern are given, only one match is generated out of every group of matches that differ
+    only by an automorphism, i.e. one per matched subgraph.
+
+    If constraints are given, they are checked right after the nodes they refer to are bound.
+    """
+    def __init__(self, pattern: Graph, anchor: NodeHandle, monomorphic: bool,
+                 automorphisms: Optional[list[dict[NodeHandle, NodeHandle]]] = None,
+                 constraints: Optional[MatchConstraints] = None) -> None:
+        self.anchor: NodeHandle = anchor
+        self.anchor_attrs: NodeAttrs = pattern[anchor]
+        self.anchor_degree: int = pattern.degree(anchor)
+        self.monomorphic: bool = monomorphic
+        self.order: list[NodeHandle] = [anchor]
+        self.steps: list[SearchStep] = []
+        # Constraints by position in the plan; edge predicates as (position of the other endpoint, predicate, whether
+        # the node at this position is the first argument), each one attached to the later bound of its endpoints
+        self.node_predicates: list[Optional[NodePredicate]] = []
+        self.edge_predicates: list[list[tuple[int, EdgePredicate, bool]]] = []
+        self.partial_mapping_predicate: Optional[PartialMappingPredicate] = None
+
+        position = {anchor: 0}
+        adjacency = {handle: dict(pattern.adjacent_edges(handle)) for handle in pattern.nx_graph.nodes}
+
+        def priority(handle: NodeHandle):
+            bound_neighbours = sum(1 for neigh in adjacency[handle] if neigh in position)
+            return (bound_neighbours, pattern[handle].flag is not None, len(adjacency[handle]), -handle)
+
+        while True:
+            frontier = {neigh for handle in self.order for neigh in adjacency[handle] if neigh not in position}
+            if len(frontier) == 0:
+                break
+            handle = max(frontier, key=priority)
+            bound = [(position[neigh], edge_attrs.kind) for neigh, edge_attrs in adjacency[handle].items() if neigh in position]
+            bound.sort()
+            parent, parent_edge_kind = bound[0]
+            non_adjacent = tuple(i for i, other in enumerate(self.order) if other not in adjacency[handle])
+            self.steps.append(SearchStep(pattern[handle], parent, parent_edge_kind, tuple(bound[1:]), non_adjacent,
+                                         degree=len(adjacency[handle])))
+            position[handle] = len(self.order)
+            self.order.append(handle)
+
+        assert len(self.order) == pattern.nx_graph.number_of_nodes(), "Search plan can be compiled only for connected pattern"
+
+        if automorphisms is not None:
+            self.__add_symmetry_breaking(automorphisms, position)
+        if constraints is not None:
+            self.__add_constraints(constraints, position)
+
+    def __add_constraints(self, constraints: MatchConstraints, position: dict[NodeHandle, int]):
+        self.node_predicates = [constraints.node_predicates.get(handle) for handle in self.order]
+        self.edge_predicates = [[] for _ in self.order]
+        for (u, v), predicate in constraints.edge_predicates.items():
+            if position[u] > position[v]:
+                self.edge_predicates[position[u]].append((position[v], predicate, True))
+            else:
+                self.edge_predicates[position[v]].append((position[u], predicate, False))
+        self.partial_mapping_predicate = constraints.partial_mapping_predicate
+
+    def __add_symmetry_breaking(self, automorphisms: list[dict[NodeHandle, NodeHandle]], position: dict[NodeHandle, int]):
+        anchor_conditions, conditions = symmetry_breaking_conditions(automorphisms, self.anchor)
+
+        # Each condition is checked when the later of its nodes is bound; step i binds node at position i + 1
+        greater_than = [[] for _ in self.steps]
+        less_than = [[] for _ in self.steps]
+        for smaller, greater in conditions:
+            smaller, greater = position[smaller], position[greater]
+            if smaller < greater:
+                greater_than[greater - 1].append(smaller)
+            else:
+                less_than[smaller - 1].append(greater)
+        greater_than_anchor = {position[greater] - 1 for _, greater in anchor_conditions}
+
+        self.steps = [
+            step._replace(greater_than=tuple(greater_than[i]), less_than=tuple(less_than[i]), greater_than_anchor=i in greater_than_anchor)
+            for i, step in enumerate(self.steps)
+        ]
+
+    def match_at(self, graph: Graph, host: NodeHandle, canonical_anchor: bool = False) -> Iterator[GraphMapping]:
+        """ Generate mappings (graph node -> pattern node) of the pattern that send `host` to the anchor.
+
+        :param canonical_anchor: if True, subgraph is matched only if `host` is the smallest of the nodes the anchor
+                                 can be sent to by symmetric matches; thanks to that each subgraph is matched once
+                                 when `match_at` is called for all hosts
+        """
+        if host not in graph or not node_attrs_match(graph[host], self.anchor_attrs) or graph.degree(host) < self.anchor_degree:
+            return
+        hosts = [host] + [None] * len(self.steps)
+        partial = {} if self.partial_mapping_predicate is not None else None
+        if not self.__constraints_hold(graph, 0, hosts, host, partial):
+            return
+        yield from self.__extend(graph, 0, hosts, {host}, canonical_anchor, partial)
+
+    def __extend(self, graph: Graph, depth: int, hosts: list[NodeHandle], used: set[NodeHandle], canonical_anchor: bool,
+                 partial: Optional[dict[NodeHandle, NodeHandle]]) -> Iterator[GraphMapping]:
+        if depth == len(self.steps):
+            yield {host: pattern_handle for host, pattern_handle in zip(hosts, self.order)}
+            return
+
+        step = self.steps[depth]
+        for candidate, edge_attrs in graph.adjacent_edges(hosts[step.parent]):
+            if candidate in used or edge_attrs.kind != step.parent_edge_kind:
+                continue
+            if not self.__symmetry_broken(step, hosts, candidate, canonical_anchor):
+                continue
+            if not node_attrs_match(graph[candidate], step.attrs) or graph.degree(candidate) < step.degree:
+                continue
+            if not self.__edges_match(graph, step, hosts, candidate):
+                continue
+            if not self.__constraints_hold(graph, depth + 1, hosts, candidate, partial):
+                continue
+
+            hosts[depth + 1] = candidate
+            used.add(candidate)
+            yield from self.__extend(graph, depth + 1, hosts, used, canonical_anchor, partial)
+            used.discard(candidate)
+            if partial is not None:
+                del partial[self.order[depth + 1]]
+
+    def __symmetry_broken(self, step: SearchStep, hosts: list[NodeHandle], candidate: NodeHandle, canonical_anchor: bool) -> bool:
+        if canonical_anchor and step.greater_than_anchor and candidate < hosts[0]:
+            return False
+        for other in step.greater_than:
+            if candidate < hosts[other]:
+                return False
+        for other in step.less_than:
+            if candidate > hosts[other]:
+                return False
+        return True
+
+    def __constraints_hold(self, graph: Graph, position: int, hosts: list[NodeHandle], candidate: NodeHandle,
+                           partial: Optional[dict[NodeHandle, NodeHandle]]) -> bool:
+        """ Check constraints of binding `candidate` at given position; on success it is recorded in `partial`. """
+        if not self.node_predicates:
+            return True
+        predicate = self.node_predicates[position]
+        if predicate is not None and not predicate(graph, candidate):
+            return False
+        for other, predicate, candidate_first in self.edge_predicates[position]:
+            if not (predicate(graph, candidate, hosts[other]) if candidate_first else predicate(graph, hosts[other], candidate)):
+                return False
+        if partial is not None:
+            partial[self.order[position]] = candidate
+            if not self.partial_mapping_predicate(graph, partial):
+                del partial[self.order[position]]
+                return False
+        return True
+
+    def __edges_match(self, graph: Graph, step: SearchStep, hosts: list[NodeHandle], candidate: NodeHandle) -> bool:
+        for other, kind in step.checked_edges:
+            edge_attrs = graph.find_edge_attrs(hosts[other], candidate)
+            if edge_attrs is None or edge_attrs.kind != kind:
+                return False
+        if not self.monomorphic:
+            for other in step.non_adjacent:
+                if graph.find_edge_attrs(hosts[other], candidate) is not None:
+                    return False
+        return True
+
+
+class CompiledPattern:
+    """ Search plans of pattern graph (usually lhs of a production), one for every possible anchor, together with other
+    artefacts precomputed from the pattern: its label multiset, degree signature & eccentricity of the default anchor.
+
+    Hyperedge centres are possible anchors (or all nodes, if there are none). When all matches are requested, the plan
+    for the anchor with fewest candidates in the searched graph is used. Pattern that is not connected can not be
+    compiled, in such case the generic VF2 matcher is used. The pattern must not be modified after compilation,
+    it is best to `Graph.freeze` it.
+
+    Matches that differ only by an automorphism of the pattern map the same subgraph, thus (unless `deduplicate`
+    is False) only one of them - the canonical one - is generated. Constraints (see `MatchConstraints`) need not be
+    invariant under the automorphisms, so the matches are not deduplicated if there are any.
+    """
+    def __init__(self, pattern: Graph, monomorphic: bool = False, deduplicate: bool = True,
+                 constraints: Optional[MatchConstraints] = None) -> None:
+        self.pattern = pattern
+        self.monomorphic = monomorphic
+        self.constraints: Optional[MatchConstraints] = constraints if constraints is not None and not constraints.is_empty() else None
+        self.anchor: Optional[NodeHandle] = pattern.find_anchor()
+        self.plans: dict[NodeHandle, SearchPlan] = {}
+        self.automorphisms: Optional[list[dict[NodeHandle, NodeHandle]]] = None
+
+        nodes = list(pattern.nx_graph.nodes)
+        # Number of pattern nodes with given label & with given (label, flag), for the flags that are specified
+        self.label_counts: Counter[str] = Counter(pattern[handle].label for handle in nodes)
+        self.label_flag_counts: Counter[tuple[str, bool]] = Counter(
+            (pattern[handle].label, pattern[handle].flag) for handle in nodes if pattern[handle].flag is not None)
+        self.degree_signature: tuple[int, ...] = tuple(sorted((pattern.degree(handle) for handle in nodes), reverse=True))
+        self.radius: int = nx.eccentricity(pattern.nx_graph, self.anchor) if self.anchor is not None else 0
+
+        if len(nodes) == 0 or not nx.is_connected(pattern.nx_graph):
+            return
+
+        if deduplicate and self.constraints is None:
+            self.automorphisms = find_automorphisms(pattern)
+
+        anchors = [handle for handle in nodes if pattern[handle].label in HYPEREDGE_LABELS] or nodes
+        for anchor in anchors:
+            self.plans[anchor] = SearchPlan(pattern, anchor, monomorphic, self.automorphisms, self.constraints)
+        if self.anchor is None:
+            self.anchor = anchors[0]
+            self.radius = nx.eccentricity(pattern.nx_graph, self.anchor)
+
+    def is_compiled(self) -> bool:
+        return len(self.plans) > 0
+
+    def could_match(self, graph: Graph) -> bool:
+        """ Cheap necessary condition for the pattern to match in given graph: there must be enough nodes of every
+        label (and flag) the pattern has. O(number of labels).
+        """
+        for label, count in self.label_counts.items():
+            if len(graph.nodes_with_label(label)) < count:
+                return False
+        for (label, flag), count in self.label_flag_counts.items():
+            if len(graph.nodes_with_label_and_flag(label, flag)) + len(graph.nodes_with_label_and_flag(label, None)) < count:
+                return False
+        return True
+
+    def generate_mappings(self, graph: Graph) -> Iterator[GraphMapping]:
+        """ Generate all mappings (graph node -> pattern node) of the pattern in given graph. """
+        if not self.could_match(graph):
+            return
+        if not self.is_compiled():
+            if self.monomorphic:
+                mappings = graph.generate_subgraphs_monomorphic_with(self.pattern)
+            else:
+                mappings = graph.generate_subgraphs_isomorphic_with(self.pattern)
+            yield from self.constraints.filter(graph, mappings) if self.constraints is not None else mappings
+            return
+
+        plan = min(self.plans.values(), key=lambda plan: graph.count_nodes_matching(plan.anchor_attrs))
+        for candidate in list(graph.nodes_matching(plan.anchor_attrs)):
+            yield from plan.match_at(graph, candidate, canonical_anchor=True)
+
+    def generate_mappings_at(self, graph: Graph, host: NodeHandle, anchor: Optional[NodeHandle] = None,
+                             canonical_anchor: bool = False) -> Iterator[GraphMapping]:
+        """ Generate mappings of the pattern that send `host` to `anchor` (defaults to `Graph.find_anchor` of the pattern).
+        See `SearchPlan.match_at` for `canonical_anchor`.
+        """
+        anchor = anchor if anchor is not None else self.anchor
+        plan = self.plans.get(anchor)
+        if plan is None:
+            mappings = graph.generate_subgraphs_anchored_at(self.pattern, host, anchor, monomorphic=self.monomorphic)
+            yield from self.constraints.filter(graph, mappings) if self.constraints is not None else mappings
+        else:
+            yield from plan.match_at(graph, host, canonical_anchor)
+
+
+class IncrementalMatcher:
+    """ Maintains all matches of a pattern (usually lhs of a production) in a graph that is being rewritten.
+
+    Matches are cached per host node the pattern anchor (see `Graph.find_anchor`) is mapped to. After the graph
+    is mutated only candidates lying within k hops from nodes touched since the last update are re-matched, where k is
+    the eccentricity of the anchor in the pattern (at most pattern diameter). Any match that appeared, disappeared
+    or changed must contain a touched node, so its anchor lies inside this ball.
+
+    Pattern without anchor (no hyperedge centre / not connected) is matched from scratch on every update.
+    If `compiled` pattern is given, its search plan is used for matching instead of VF2. Mappings violating
+    `constraints` (those of the compiled pattern by default) are not generated.
+    """
+    def __init__(self, graph: Graph, pattern: Graph, monomorphic: bool = False, compiled: Optional[CompiledPattern] = None,
+                 constraints: Optional[MatchConstraints] = None) -> None:
+        self._graph = graph
+        self._pattern = pattern
+        self._monomorphic = monomorphic
+        if constraints is None and compiled is not None:
+            constraints = compiled.constraints
+        self._constraints = constraints if constraints is not None and not constraints.is_empty() else None
+        self._compiled = compiled if compiled is not None and compiled.is_compiled() else None
+        if self._compiled is not None:
+            self._anchor: Optional[NodeHandle] = self._compiled.anchor
+            self._radius: int = self._compiled.radius
+        else:
+            self._anchor = pattern.find_anchor()
+            self._radius = nx.eccentricity(pattern.nx_graph, self._anchor) if self._anchor is not None else 0
+        self._matches: dict[NodeHandle, list[GraphMapping]] = {}
+        self._journal = graph.create_journal()
+
+        if self._anchor is not None:
+            for candidate in graph.nodes_matching(pattern[self._anchor]):
+                self._rematch(candidate)
+
+    def close(self):
+        """ Stop tracking mutations of the graph. """
+        if self._journal is not None:
+            self._graph.detach_journal(self._journal)
+            self._journal = None
+
+    def update(self):
+        """ Bring cached matches up to date with the graph. Called implicitly by `mappings`. """
+        assert self._journal is not None, "Attempt to update closed matcher"
+        if self._anchor is None or self._journal.is_empty():
+            return
+
+        dirty = self._journal.dirty_nodes()
+        self._journal.checkpoint()
+
+        for handle in dirty:
+            if handle not in self._graph:
+                self._matches.pop(handle, None)
+
+        ball = self._graph.neighbourhood_of((handle for handle in dirty if handle in self._graph), self._radius)
+        for candidate in sorted(ball):
+            self._rematch(candidate)
+
+    def mappings(self) -> Iterator[GraphMapping]:
+        """ Generate current matches of the pattern, in the same format as `Graph.generate_subgraphs_*_with`. """
+        if self._anchor is None:
+            if self._monomorphic:
+                mappings = self._graph.generate_subgraphs_monomorphic_with(self._pattern)
+            else:
+                mappings = self._graph.generate_subgraphs_isomorphic_with(self._pattern)
+            yield from self._constraints.filter(self._graph, mappings) if self._constraints is not None else mappings
+            return
+
+        self.update()
+        # Snapshot, as consumers usually mutate the graph (and thus might trigger update) while iterating
+        for mappings in list(self._matches.values()):
+            yield from mappings
+
+    def __iter__(self) -> Iterator[GraphMapping]:
+        return self.mappings()
+
+    def _rematch(self, candidate: NodeHandle):
+        self._matches.pop(candidate, None)
+        if self._compiled is not None:
+            mappings = list(self._compiled.generate_mappings_at(self._graph, candidate, self._anchor, canonical_anchor=True))
+        else:
+            mappings = self._graph.generate_subgraphs_anchored_at(
+                self._pattern, candidate, self._anchor, self._radius, self._monomorphic)
+            mappings = list(self._constraints.filter(self._graph, mappings) if self._constraints is not None else mappings)
+        if len(mappings) > 0:
+            self._matches[candidate] = mappings
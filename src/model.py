@@ -63,5 +63,12 @@ class Edge:
         return EdgeEndpoints(self.u, self.v)
 
 
+class Hyperedge(NamedTuple):
+    """ Entry of the graph's hyperedge table; the hyperedge is identified by the handle of its centre node """
+    kind: Literal['q'] | Literal['p']
+    corners: tuple[NodeHandle, ...]
+    flag: bool
+
+
 GraphMapping = Dict[NodeHandle, NodeHandle]
 
@@ -1,16 +1,29 @@
 import itertools as it
-from copy import deepcopy
-import matplotlib.pyplot as plt
 import util
-from typing import Dict, Optional
+from typing import Dict, Optional, Iterable, Mapping
 from model import NodeAttrs, EdgeAttrs, NodeHandle, Edge, Node, GraphMapping
 from graph import Graph
+from matching import IncrementalMatcher, CompiledPattern, MatchConstraints, NodePredicate, EdgePredicate
 from pprint import pprint
 from util import verify_central_hyperedges
 from itertools import combinations
 
 class Production:
     """ Base class for all productions """
+
+    # Set to False (on the class, subclass or instance) to match lhs with generic VF2 matcher instead of
+    # compiled search plan, e.g. to validate the plans
+    use_search_plan: bool = True
+
+    # Compiled search plans generate just one of the mappings that differ only by an automorphism of the lhs (i.e. one
+    # per matched subgraph), see `matching.CompiledPattern`. That is correct only if `is_mapping_feasible` gives the same
+    # answer for all of them; set to False on the subclass if it does not, so that all the mappings are generated.
+    # Read when the lhs is compiled, once per production class, so it must not be changed on instances
+    deduplicate_matches: bool = True
+
+    # Lhs graphs (frozen) & their search plans, built once per production class & shared by all of its instances
+    _compiled_lhs: Dict[type, CompiledPattern] = {}
+
     def __init__(self) -> None:
         self.reset()
 
@@ -18,9 +31,41 @@ class Production:
         """ Reset state of the production so that it can be applied again. """
         self._rev_mapping = None
 
-    def get_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
+        """ Build the lhs graph of the production by overriding this method. It is called once per production class,
+        the result is frozen & shared by all instances of the class (see `get_lhs`), therefore it must not depend
+        on the production instance.
+        """
         raise NotImplementedError("This method must be overrided in subclasses")
 
+    def get_lhs(self) -> Graph:
+        """ Returns the shared, frozen lhs graph of the production. """
+        return self.get_compiled_lhs().pattern
+
+    @property
+    def lhs(self) -> Graph:
+        return self.get_lhs()
+
+    def node_predicates(self) -> Dict[NodeHandle, NodePredicate]:
+        """ Override to constrain lhs nodes beyond label & flag (e.g. by coordinates): lhs node -> predicate(graph, host
+        node). Predicates are checked during the search, as soon as the node is bound, see `matching.MatchConstraints`.
+        Like the lhs, they are shared by all instances of the production class.
+        """
+        return {}
+
+    def edge_predicates(self) -> Dict[tuple[NodeHandle, NodeHandle], EdgePredicate]:
+        """ Override to constrain lhs edges beyond kind (e.g. by orientation): (u, v) lhs edge -> predicate(graph,
+        host of u, host of v). See `node_predicates`.
+        """
+        return {}
+
+    def is_partial_mapping_feasible(self, graph: Graph, partial: Mapping[NodeHandle, NodeHandle]) -> bool:
+        """ Override to prune the search for mappings early: called every time a lhs node gets bound, with mapping
+        lhs node -> host node of the nodes bound so far (note the direction, it is reversed compared to
+        `is_mapping_feasible`). Return False if the mapping can not be completed to a feasible one.
+        """
+        return True
+
     def is_mapping_feasible(self, graph: Graph, mapping: Dict[NodeHandle, NodeHandle]) -> bool:
         """ Checks whether the production can be applied on given mapping.
 
@@ -29,26 +74,130 @@ class Production:
         see https://networkx.org/documentation/stable/reference/algorithms/isomorphism.vf2.html#subgraph-isomorphism
         for details.
 
+        Mappings that differ only by an automorphism of the lhs (e.g. rotations of a square) must get the same answer,
+        as only one of them is generated, unless `deduplicate_matches` is False.
+
         :return: bool is the production can be successfully applied, false if not"""
         return True
         # raise NotImplementedError("This method must be overrided in subclasses")
 
     def apply(self, graph: Graph) -> bool:
         self.reset()
-        lhs = self.get_lhs()
+        return self.apply_first_feasible(graph, self.generate_mappings(graph))
+
+    def apply_at(self, graph: Graph, centre: NodeHandle) -> bool:
+        """ Apply the production on a mapping that sends given hyperedge centre to the anchor of the lhs (see
+        `Graph.find_anchor`). Only the neighbourhood of the hyperedge is searched.
+
+        :return: True if the production was applied, False if lhs does not match there or no mapping is feasible
+        """
+        self.reset()
+        return self.apply_first_feasible(graph, self.generate_mappings_at(graph, centre))
+
+    def apply_all(self, graph: Graph, mapping_gen: Optional[Iterable[GraphMapping]] = None) -> int:
+        """ Apply the production at once on maximal set of feasible mappings that do not share any node of `graph`.
+        Such applications do not interfere, so all of the mappings are selected first & then applied in one pass.
+        Every application still commits its own rewrite, reserving handles of its rhs nodes on its own (in O(1)).
+
+        Note that this is a single pass, not a closure: mappings sharing a node (e.g. a corner) with an already
+        selected one are skipped, so e.g. one pass of P1 over a 4x4 grid with all elements marked breaks only 4 of
+        them. Call it repeatedly until it returns 0 to rewrite all the matches.
+
+        :param mapping_gen: mappings to select from; all mappings of the production lhs by default
+        :return: number of applications
+        """
+        if mapping_gen is None:
+            mapping_gen = self.generate_mappings(graph)
+
+        selected: list[tuple[GraphMapping, GraphMapping]] = []
+        occupied: set[NodeHandle] = set()
+        for mapping in mapping_gen:
+            if any(handle in occupied for handle in mapping):
+                continue
+            self.reset()
+            self._rev_mapping = util.reverse_dict_mapping(mapping)
+            if self.is_mapping_feasible(graph, mapping):
+                selected.append((mapping, self._rev_mapping))
+                occupied.update(mapping)
+
+        for mapping, rev_mapping in selected:
+            self.reset()
+            self._rev_mapping = rev_mapping
+            self.apply_transactionally(graph, mapping)
+
+        return len(selected)
+
+    def generate_mappings(self, graph: Graph) -> Iterable[GraphMapping]:
+        """ Generate all mappings between subgraphs of `graph` & lhs of the production. """
+        compiled = self.get_compiled_lhs()
+        if self.use_search_plan:
+            return compiled.generate_mappings(graph)
 
         if self.requires_monomorphism():
-            mapping_gen = graph.generate_subgraphs_monomorphic_with(lhs)
+            mappings = graph.generate_subgraphs_monomorphic_with(compiled.pattern, anchored=True)
         else:
-            mapping_gen = graph.generate_subgraphs_isomorphic_with(lhs)
+            mappings = graph.generate_subgraphs_isomorphic_with(compiled.pattern, anchored=True)
+        return compiled.constraints.filter(graph, mappings) if compiled.constraints is not None else mappings
+
+    def generate_mappings_at(self, graph: Graph, centre: NodeHandle) -> Iterable[GraphMapping]:
+        """ Generate mappings between subgraphs of `graph` & lhs of the production that send `centre` to the anchor
+        of the lhs. Nothing is generated if there is no such node in the graph.
+        """
+        if centre not in graph:
+            return ()
+        compiled = self.get_compiled_lhs()
+        if self.use_search_plan:
+            return compiled.generate_mappings_at(graph, centre, compiled.anchor, canonical_anchor=True)
+        mappings = graph.generate_subgraphs_anchored_at(compiled.pattern, centre, compiled.anchor, compiled.radius,
+                                                        monomorphic=self.requires_monomorphism())
+        return compiled.constraints.filter(graph, mappings) if compiled.constraints is not None else mappings
+
+    def get_compiled_lhs(self) -> CompiledPattern:
+        """ Returns the production lhs together with its search plans. These are built on first use & shared by all
+        instances of the production class, therefore lhs must not depend on production instance.
+        """
+        compiled = Production._compiled_lhs.get(type(self))
+        if compiled is None:
+            lhs = self.create_lhs()
+            lhs.freeze()
+            compiled = CompiledPattern(lhs, monomorphic=self.requires_monomorphism(), deduplicate=self.deduplicate_matches,
+                                       constraints=self.__create_constraints())
+            Production._compiled_lhs[type(self)] = compiled
+        return compiled
+
+    def __create_constraints(self) -> MatchConstraints:
+        # The hook is passed only if overridden, so that plans of productions without it skip maintaining partial mappings
+        partial_hook_overridden = type(self).is_partial_mapping_feasible is not Production.is_partial_mapping_feasible
+        return MatchConstraints(self.node_predicates(), self.edge_predicates(),
+                                self.is_partial_mapping_feasible if partial_hook_overridden else None)
+
+    def create_matcher(self, graph: Graph) -> IncrementalMatcher:
+        """ Create matcher maintaining mappings of the production lhs in `graph` while it is being rewritten.
+        Pass its `mappings()` to `apply_first_feasible` instead of calling `apply`, see `Driver`.
+        """
+        compiled = self.get_compiled_lhs()
+        return IncrementalMatcher(graph, compiled.pattern, monomorphic=self.requires_monomorphism(),
+                                  compiled=compiled if self.use_search_plan else None, constraints=compiled.constraints)
+
+    def apply_first_feasible(self, graph: Graph, mapping_gen: Iterable[GraphMapping]) -> bool:
+        """ Apply the production on the first feasible of given mappings.
 
+        :return: True if the production was applied, False if none of the mappings was feasible
+        """
         for mapping in mapping_gen:
             self._rev_mapping = util.reverse_dict_mapping(mapping)
             if self.is_mapping_feasible(graph, mapping):
-                self.apply_with_mapping(graph, mapping)
+                self.apply_transactionally(graph, mapping)
                 return True
         return False
 
+    def apply_transactionally(self, graph: Graph, mapping: Dict[NodeHandle, NodeHandle]) -> None:
+        """ Run `apply_with_mapping` in a graph transaction (see `Graph.begin`), so that if it raises (e.g. fails
+        an assertion) half-way through the rewrite, the graph is left as it was before.
+        """
+        with graph.transaction():
+            self.apply_with_mapping(graph, mapping)
+
     def apply_with_mapping(self, graph: Graph, mapping: Dict[NodeHandle, NodeHandle]) -> None:
         """ Implement the production by overriding this method.
         This method should mutate the graph passed as argument.
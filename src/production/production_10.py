@@ -1,5 +1,4 @@
 import itertools as it
-import matplotlib.pyplot as plt
 import util
 import basic_graph
 from typing import Dict
@@ -9,19 +8,15 @@ from .model import Production
 
 class P10(Production):
     def __init__(self) -> None:
-        self.lhs: Graph = self.__create_lhs()
         self.rev_mapping: Dict[NodeHandle, NodeHandle] | None = None
 
-    def get_lhs(self) -> Graph:
-        return self.lhs
-
     def reset(self):
         self.rev_mapping = None
 
     def requires_monomorphism(self):
         return True
 
-    def __create_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
 #       graph = util.basic_pentagon(for_lhs=True, select_central=True)
         graph = basic_graph.basic_pentagon(for_lhs=True, select_central=True)
         # handle is 6 because the interior is 5
@@ -44,7 +39,8 @@ class P10(Production):
         # you must get edges attrs before you remove, now it is relevant
         edge = vertices[0].handle, node_h.handle
         is_boundary = graph.edge_attrs(edge).flag
-        node_h.attrs.flag = False
+        rewrite = graph.rewrite()
+        rewrite.update_node_flag(node_h.handle, False)
 
         # skip first pair because it already exists
         idx_nodes = [1, 4, 2, 3, 0]
@@ -56,24 +52,25 @@ class P10(Production):
             edge = (node_a.handle, node_b.handle)
             edge_attrs = graph.edge_attrs(edge)
             hanging = not edge_attrs.flag
-            new_node = graph.split_edge_with_vnode(edge, node_flag=hanging)
+            new_node = rewrite.split_edge_with_vnode(edge, node_flag=hanging)
             new_boundary.append(new_node)
 
-        graph.remove_p_hyperedge(node_p.handle)
+        rewrite.remove_p_hyperedge(node_p.handle)
 
         x = node_p.attrs.x
         y = node_p.attrs.y
         central = Node(NodeAttrs('v', x, y, flag=False), node_p.handle)
-        graph.add_node(central)
+        rewrite.add_node(central)
 
         for new_node in new_boundary:
             attr = EdgeAttrs('e', False)
             edge = Edge(new_node.handle, central.handle, attr)
-            graph.add_edge(edge)
+            rewrite.add_edge(edge)
 
         # connect new nodes on the boundry with inner nodes
         for vert, (node_a, node_b) in zip([vertices[0]] + nodes_shuffled, it.pairwise([new_boundary[-1]] + new_boundary)):
             node_attr = EdgeAttrs('q', False)
             nodes = (vert, node_a, node_b, node_p)
-            graph.add_q_hyperedge(nodes, node_attr)
+            rewrite.add_q_hyperedge(nodes, node_attr)
+        rewrite.commit()
 
@@ -1,5 +1,4 @@
 import itertools as it
-import matplotlib.pyplot as plt
 import util
 from typing import Dict
 import basic_graph
@@ -10,15 +9,11 @@ from .model import Production
 
 class P13(Production):
     def __init__(self) -> None:
-        self.lhs: Graph = self.__create_lhs()
         self.rev_mapping: Dict[NodeHandle, NodeHandle] | None = None
         # self.hanging_nodes: list[Node] | None = None
         # self.external_nodes: list[Node] | None = None
 
-    def get_lhs(self) -> Graph:
-        return self.lhs
-
-    def __create_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
         graph = Graph()
 
         # Not hanging nodes
@@ -51,31 +46,33 @@ class P13(Production):
         hanging_nodes = [graph.node_for_handle(rev_mapping[i]) for i in [5, 6, 7]]
 
         # change hanging value of hanging nodes
+        rewrite = graph.rewrite()
         for h_node in hanging_nodes:
-            h_node.attrs.flag = False
+            rewrite.update_node_flag(h_node.handle, False)
 
         # split two edges with new hanging nodes, preserving h = ~B
         edge_1_2_flag = graph.edge_for_handles(corner_nodes[1].handle, corner_nodes[2].handle).attrs.flag
         edge_2_3_flag = graph.edge_for_handles(corner_nodes[2].handle, corner_nodes[3].handle).attrs.flag
-        node_9 = graph.split_edge_with_vnode(((corner_nodes[1].handle, corner_nodes[2].handle)), not edge_1_2_flag)
-        node_10 = graph.split_edge_with_vnode(((corner_nodes[2].handle, corner_nodes[3].handle)), not edge_2_3_flag)
+        node_9 = rewrite.split_edge_with_vnode(((corner_nodes[1].handle, corner_nodes[2].handle)), not edge_1_2_flag)
+        node_10 = rewrite.split_edge_with_vnode(((corner_nodes[2].handle, corner_nodes[3].handle)), not edge_2_3_flag)
 
         # remove p-hyperedge...
         p_node = graph.node_for_handle(rev_mapping[8])
-        graph.remove_p_hyperedge(p_node.handle)
+        rewrite.remove_p_hyperedge(p_node.handle)
 
         # ...and replace it with central node
         central_node = Node(NodeAttrs('v', p_node.attrs.x, p_node.attrs.y, False))
-        graph.add_node(central_node)
+        rewrite.add_node(central_node)
 
         # reorganise hanging nodes list for easier quadrilaterals creation
         hanging_nodes = [hanging_nodes[0], node_9, node_10, hanging_nodes[1], hanging_nodes[2]]
 
         # create 5 e-edges
         for h_node in hanging_nodes:
-            graph.add_edge(Edge(h_node.handle, central_node.handle, EdgeAttrs('e', True)))
+            rewrite.add_edge(Edge(h_node.handle, central_node.handle, EdgeAttrs('e', True)))
 
         # create 5 q-edges
         for i in range(5):
             q_edge_nodes = [corner_nodes[i], hanging_nodes[i], central_node, hanging_nodes[(i - 1) % 5]]
-            graph.add_q_hyperedge(q_edge_nodes, EdgeAttrs('q', False))
+            rewrite.add_q_hyperedge(q_edge_nodes, EdgeAttrs('q', False))
+        rewrite.commit()
@@ -1,5 +1,4 @@
 import itertools as it
-import matplotlib.pyplot as plt
 import util
 from typing import Dict
 import basic_graph
@@ -10,13 +9,9 @@ from .model import Production
 
 class P15(Production):
     def __init__(self) -> None:
-        self.lhs: Graph = self.__create_lhs()
         self.rev_mapping: Dict[NodeHandle, NodeHandle] | None = None
 
-    def get_lhs(self) -> Graph:
-        return self.lhs
-
-    def __create_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
         graph = Graph()
 
         # Not hanging nodes
@@ -50,25 +45,27 @@ class P15(Production):
         hanging_nodes = [graph.node_for_handle(rev_mapping[i]) for i in [5, 6, 7, 8, 9]]
 
         # change hanging value of hanging nodes
+        rewrite = graph.rewrite()
         for h_node in hanging_nodes:
-            h_node.attrs.flag = False
+            rewrite.update_node_flag(h_node.handle, False)
 
         # remove p-hyperedge...
         p_node = graph.node_for_handle(rev_mapping[10])
-        graph.remove_p_hyperedge(p_node.handle)
+        rewrite.remove_p_hyperedge(p_node.handle)
 
         # ...and replace it with central node
         central_node = Node(NodeAttrs('v', p_node.attrs.x, p_node.attrs.y, False))
-        graph.add_node(central_node)
+        rewrite.add_node(central_node)
 
         # reorganize hanging nodes list for easier quadrilaterals creation
         hanging_nodes = [hanging_nodes[0], hanging_nodes[4], hanging_nodes[3], hanging_nodes[1], hanging_nodes[2]]
 
         # create 5 e-edges
         for h_node in hanging_nodes:
-            graph.add_edge(Edge(h_node.handle, central_node.handle, EdgeAttrs('e', True)))
+            rewrite.add_edge(Edge(h_node.handle, central_node.handle, EdgeAttrs('e', True)))
 
         # create 5 q-hyperedges
         for i in range(5):
             q_edge_nodes = [corner_nodes[i], hanging_nodes[i], central_node, hanging_nodes[(i - 1) % 5]]
-            graph.add_q_hyperedge(q_edge_nodes, EdgeAttrs('q', False))
+            rewrite.add_q_hyperedge(q_edge_nodes, EdgeAttrs('q', False))
+        rewrite.commit()
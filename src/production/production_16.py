@@ -1,5 +1,4 @@
 import itertools as it
-import matplotlib.pyplot as plt
 import util
 import basic_graph
 from typing import Dict
@@ -9,20 +8,16 @@ from .model import Production
 
 class P16(Production):
     def __init__(self, idx=None) -> None:
-        self.lhs: Graph = self.__create_lhs()
         self.rev_mapping: Dict[NodeHandle, NodeHandle] | None = None
         self.idx: NodeHandle = idx
 
-    def get_lhs(self) -> Graph:
-        return self.lhs
-
     def requires_monomorphism(self):
         return True
 
     def reset(self):
         self.rev_mapping = None
 
-    def __create_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
 #       graph, _ = util.basic_star5(for_lhs=True, select_central=False)
         graph, _ = basic_graph.basic_star5(for_lhs=True, select_central=False)
         return graph
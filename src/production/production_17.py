@@ -1,5 +1,4 @@
 import itertools as it
-import matplotlib.pyplot as plt
 import util
 from typing import Dict
 from model import NodeAttrs, EdgeAttrs, NodeHandle, Edge, Node
@@ -8,17 +7,13 @@ from .model import Production
 
 class P17(Production):
     def __init__(self) -> None:
-        self.lhs: Graph = self.__create_lhs()
         self.hanging_node: Node | None = None
         self.external_nodes: list[Node] | None = None
 
-    def get_lhs(self) -> Graph:
-        return self.lhs
-    
     def requires_monomorphism(self) -> bool:
         return True
 
-    def __create_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
         graph = Graph()
 
         node_1 = Node(NodeAttrs('v', 0, 0, None))
@@ -57,6 +52,8 @@ class P17(Production):
 
         # change hanging value of hanging node
         # we actualy have reference to this node, so we can modify it in place
-        graph.remove_p_hyperedge(node_p.handle)
+        rewrite = graph.rewrite()
+        rewrite.remove_p_hyperedge(node_p.handle)
 
-        graph.add_p_hyperedge(corner_nodes, EdgeAttrs('p', True), node_p.handle)
+        rewrite.add_p_hyperedge(corner_nodes, EdgeAttrs('p', True), node_p.handle)
+        rewrite.commit()
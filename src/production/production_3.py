@@ -1,5 +1,4 @@
 import itertools as it
-import matplotlib.pyplot as plt
 import util
 from typing import Dict
 from model import NodeAttrs, EdgeAttrs, NodeHandle, Edge, Node
@@ -9,14 +8,10 @@ from .model import Production
 
 class P3(Production):
     def __init__(self) -> None:
-        self.lhs: Graph = self.__create_lhs()
         self.hanging_node: Node | None = None
         self.external_nodes: list[Node] | None = None
 
-    def get_lhs(self) -> Graph:
-        return self.lhs
-
-    def __create_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
         graph = Graph()
 
         node_0 = Node(NodeAttrs('v', 0, 0, False), 0)
@@ -50,31 +45,25 @@ class P3(Production):
         q_node = graph.node_for_handle(rev_mapping[6])
 
         # change hanging value of hanging nodes
+        rewrite = graph.rewrite()
         for hanging_node in hanging_nodes:
-            hanging_node.attrs.flag = False
+            rewrite.update_node_flag(hanging_node.handle, False)
 
         new_border_nodes = []
         for node_a, node_b in ((in_order_nodes[2], in_order_nodes[3]), (in_order_nodes[3], in_order_nodes[0])):
-            x, y = util.avg_point_from_nodes((node_a, node_b))
-            edge_attrs = graph.edge_attrs((node_a.handle, node_b.handle))
-            h = not edge_attrs.flag
-            new_node = Node(NodeAttrs('v', x, y, h)) # has no handle, will be assigned when adding to graph
+            # new node is hanging unless the edge lies on the boundary
+            new_node = rewrite.split_edge_with_vnode((node_a.handle, node_b.handle))
             new_border_nodes.append(new_node)
 
-            graph.remove_edge(node_a.handle, node_b.handle)
-            graph.add_node(new_node)
-            graph.add_edge(Edge(u=node_a.handle, v=new_node.handle, attrs=EdgeAttrs('e', edge_attrs.flag)))
-            graph.add_edge(Edge(u=new_node.handle, v=node_b.handle, attrs=EdgeAttrs('e', edge_attrs.flag)))
-
         # the central node
         x, y = util.avg_point_from_nodes(corner_nodes)
         central_node = Node(NodeAttrs('v', x, y, flag=False))
-        graph.add_node(central_node)
+        rewrite.add_node(central_node)
 
         for node in new_border_nodes + hanging_nodes:
-            graph.add_edge(Edge(node.handle, central_node.handle, EdgeAttrs('e', False)))
+            rewrite.add_edge(Edge(node.handle, central_node.handle, EdgeAttrs('e', False)))
 
-        graph.remove_q_hyperedge(q_node.handle)
+        rewrite.remove_q_hyperedge(q_node.handle)
 
         # add Q edges
         assert len(new_border_nodes) == 2
@@ -82,7 +71,8 @@ class P3(Production):
         new_border_nodes.insert(1, hanging_nodes[0])
 
         for corner_node, new_nodes in zip(corner_nodes, it.pairwise([new_border_nodes[-1]] + new_border_nodes)):
-            graph.add_q_hyperedge((corner_node, *new_nodes, central_node), EdgeAttrs('q', False))
+            rewrite.add_q_hyperedge((corner_node, *new_nodes, central_node), EdgeAttrs('q', False))
+        rewrite.commit()
 
         # graph.display()
         # plt.show()
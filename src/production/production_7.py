@@ -1,5 +1,4 @@
 import itertools as it
-import matplotlib.pyplot as plt
 from typing import Dict
 from model import NodeAttrs, EdgeAttrs, NodeHandle, Edge, Node
 from graph import Graph
@@ -7,19 +6,15 @@ from .model import Production
 
 class P7(Production):
     def __init__(self) -> None:
-        self.lhs: Graph = self.__create_lhs()
         self.rev_mapping: Dict[NodeHandle, NodeHandle] | None = None
 
-    def get_lhs(self) -> Graph:
-        return self.lhs
-
     def requires_monomorphism(self):
         return True
 
     def reset(self):
         self.rev_mapping = None
 
-    def __create_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
         graph = Graph()
 
         node_0 = Node(NodeAttrs('v', 0, 0, False), 0)
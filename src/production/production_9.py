@@ -1,5 +1,4 @@
 import itertools as it
-import matplotlib.pyplot as plt
 import util
 import basic_graph
 from typing import Dict
@@ -9,19 +8,15 @@ from .model import Production
 
 class P9(Production):
     def __init__(self) -> None:
-        self.lhs: Graph = self.__create_lhs()
         self.rev_mapping: Dict[NodeHandle, NodeHandle] | None = None
 
-    def get_lhs(self) -> Graph:
-        return self.lhs
-
     def reset(self):
         self.rev_mapping = None
 
     def requires_monomorphism(self):
         return True
 
-    def __create_lhs(self) -> Graph:
+    def create_lhs(self) -> Graph:
 #       return util.basic_pentagon(for_lhs=True, select_central=True)
         return basic_graph.basic_pentagon(for_lhs=True, select_central=True)
 
@@ -39,30 +34,32 @@ class P9(Production):
         idx_nodes = [0, 1, 4, 2, 3, 0]
         nodes_shuffled = [vertices[idx] for idx in idx_nodes]
 
+        rewrite = graph.rewrite()
         new_boundary = []
         for node_a, node_b in it.pairwise(nodes_shuffled):
             edge = (node_a.handle, node_b.handle)
             edge_attrs = graph.edge_attrs(edge)
             hanging = not edge_attrs.flag
-            new_node = graph.split_edge_with_vnode(edge, node_flag=hanging)
+            new_node = rewrite.split_edge_with_vnode(edge, node_flag=hanging)
             new_boundary.append(new_node)
 
-        graph.remove_p_hyperedge(node_p.handle)
+        rewrite.remove_p_hyperedge(node_p.handle)
 
         x = node_p.attrs.x
         y = node_p.attrs.y
         central = Node(NodeAttrs('v', x, y, flag=False), node_p.handle)
-        graph.add_node(central)
+        rewrite.add_node(central)
 
         for new_node in new_boundary:
             attr = EdgeAttrs('e', False)
             edge = Edge(new_node.handle, central.handle, attr)
-            graph.add_edge(edge)
+            rewrite.add_edge(edge)
 
         # create inner nodes and connect new nodes on the boundry with inner nodes
         inner_nodes = []
         for vert, (node_a, node_b) in zip(nodes_shuffled, it.pairwise([new_boundary[-1]] + new_boundary)):
             nodes = (vert, node_a, node_b, central)
             attr = EdgeAttrs('q', False)
-            graph.add_q_hyperedge(nodes, edge_attrs=attr)
+            rewrite.add_q_hyperedge(nodes, edge_attrs=attr)
+        rewrite.commit()
 
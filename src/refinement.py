@@ -0,0 +1,61 @@
+from typing import Iterable, Optional, Callable
+from graph import Graph
+from model import NodeHandle
+from production import Production, P1, P2, P3, P4, P5, P6, P8, P9, P10, P11, P12, P13, P14, P15, P17
+from applicability import ApplicabilityIndex
+
+
+# Productions that mark neighbours of a marked element, so that breaking it does not leave double hanging nodes
+PROPAGATION_PRODUCTIONS: tuple[type[Production], ...] = (P8, P17)
+# Productions that break a marked element (with or without hanging nodes on its edges)
+BREAKING_PRODUCTIONS: tuple[type[Production], ...] = (P1, P2, P3, P4, P5, P6, P9, P10, P11, P12, P13, P14, P15)
+
+
+class RefinementEngine:
+    """ Applies propagation & breaking productions on a graph until none of them is applicable anymore, i.e. until
+    all marked elements are broken & the mesh is conforming again.
+
+    Applicable work is kept in `ApplicabilityIndex`es (one per stage), so after every application only the
+    neighbourhood of the rewritten element is re-matched. Stages are prioritized: an element is broken only when
+    there is nothing left to propagate, as breaking it first could create double hanging nodes.
+    """
+    def __init__(self, graph: Graph,
+                 stages: Iterable[Iterable[type[Production]]] = (PROPAGATION_PRODUCTIONS, BREAKING_PRODUCTIONS)) -> None:
+        """ :param stages: groups of productions, in order of decreasing priority """
+        self._graph = graph
+        self._indexes = [ApplicabilityIndex(graph, [production() for production in stage]) for stage in stages]
+
+    def close(self):
+        """ Stop tracking mutations of the graph. """
+        for index in self._indexes:
+            index.close()
+
+    def refine(self, marks: Iterable[NodeHandle] = (),
+               on_applied: Optional[Callable[[Production, Graph], None]] = None) -> int:
+        """ Mark given hyperedges for breaking & apply the productions until closure.
+
+        :param marks: handles of hyperedges to mark (hyperedges marked already are refined as well)
+        :param on_applied: called after every successful application
+        :return: number of applications
+        """
+        for handle in marks:
+            self._graph.update_hyperedge_flag(handle, True)
+
+        applications = 0
+        while True:
+            work = self.__pop_work()
+            if work is None:
+                return applications
+            _centre, production, mappings = work
+            production.reset()
+            if production.apply_first_feasible(self._graph, mappings):
+                applications += 1
+                if on_applied is not None:
+                    on_applied(production, self._graph)
+
+    def __pop_work(self):
+        for index in self._indexes:
+            work = index.pop()
+            if work is not None:
+                return work
+        return None
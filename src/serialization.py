@@ -0,0 +1,86 @@
+import json
+import struct
+from pathlib import Path
+from typing import Any, BinaryIO, Iterable, NamedTuple
+import numpy as np
+
+
+# Binary container graphs are saved in (see `Graph.save`). Layout of the file:
+#   header:  MAGIC, format version (uint16)
+#   chunks:  raw little-endian bytes of the arrays, one after another, each starting at offset aligned to ALIGNMENT,
+#            so that they can be memory-mapped & viewed in place
+#   table of contents: UTF-8 JSON with metadata & name, dtype, shape & offset of every array
+#   trailer: offset & length of the table of contents (uint64 each), MAGIC
+# Table of contents goes last, so the container is written in one pass, with no seeking & no array kept in memory
+# longer than it takes to write it.
+MAGIC = b'GGRAPH'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_HEADER = struct.Struct(f'<{len(MAGIC)}sH')
+_TRAILER = struct.Struct(f'<QQ{len(MAGIC)}s')
+
+
+class Container(NamedTuple):
+    version: int
+    meta: dict[str, Any]
+    # Read-only arrays; memory-mapped, if the container has been read from a file
+    arrays: dict[str, np.ndarray]
+
+
+def write_container(file: Path | str | BinaryIO, chunks: Iterable[tuple[str, np.ndarray]], meta: dict[str, Any]):
+    """ Write named arrays into the container, streaming them one by one as they are generated.
+
+    :param file: path or binary stream (it does not have to be seekable)
+    :param meta: JSON-serializable metadata
+    """
+    if isinstance(file, (str, Path)):
+        with open(file, 'wb') as stream:
+            write_container(stream, chunks, meta)
+        return
+
+    position = file.write(_HEADER.pack(MAGIC, FORMAT_VERSION))
+    toc = {}
+    for name, array in chunks:
+        assert name not in toc, f"Duplicate array {name}"
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+        padding = -position % ALIGNMENT
+        position += file.write(b'\0' * padding)
+        toc[name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': position}
+        position += file.write(array.data.cast('B') if array.size > 0 else b'')
+
+    encoded_toc = json.dumps({'meta': meta, 'arrays': toc}).encode('utf-8')
+    file.write(encoded_toc)
+    file.write(_TRAILER.pack(position, len(encoded_toc), MAGIC))
+
+
+def read_container(file: Path | str | BinaryIO, mmap: bool = True) -> Container:
+    """ Read the container written with `write_container`. Raises ValueError if the file is not a container or has been
+    written in newer version of the format.
+
+    :param mmap: whether the arrays should be memory-mapped rather than read, so that they are paged in only when
+                 accessed; applies only when reading from path
+    """
+    if isinstance(file, (str, Path)):
+        buffer = np.memmap(file, dtype=np.uint8, mode='r') if mmap else np.fromfile(file, dtype=np.uint8)
+    else:
+        buffer = np.frombuffer(file.read(), dtype=np.uint8)
+
+    if len(buffer) < _HEADER.size + _TRAILER.size:
+        raise ValueError("Not a graph container: file is too short")
+    magic, version = _HEADER.unpack(buffer[:_HEADER.size].tobytes())
+    toc_offset, toc_length, trailer_magic = _TRAILER.unpack(buffer[-_TRAILER.size:].tobytes())
+    if magic != MAGIC or trailer_magic != MAGIC:
+        raise ValueError("Not a graph container: bad magic bytes (or the file is truncated)")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported graph container version {version}, the newest supported one is {FORMAT_VERSION}")
+
+    toc = json.loads(buffer[toc_offset:toc_offset + toc_length].tobytes().decode('utf-8'))
+    arrays = {}
+    for name, entry in toc['arrays'].items():
+        dtype, shape = np.dtype(entry['dtype']), tuple(entry['shape'])
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        array = buffer[entry['offset']:entry['offset'] + nbytes].view(dtype).reshape(shape)
+        array.flags.writeable = False
+        arrays[name] = array
+    return Container(version, toc['meta'], arrays)
@@ -0,0 +1,157 @@
+import heapq
+import itertools as it
+from typing import Optional, Iterator, Callable
+from model import NodeHandle
+
+
+class _Quad:
+    __slots__ = (
+        'x_min', 'y_min', 'x_max', 'y_max',
+        'points',
+        'children',
+        'depth'
+    )
+
+    def __init__(self, x_min: float, y_min: float, x_max: float, y_max: float, depth: int) -> None:
+        self.x_min, self.y_min, self.x_max, self.y_max = x_min, y_min, x_max, y_max
+        self.points: Optional[dict[NodeHandle, tuple[float, float]]] = {}
+        self.children: Optional[list['_Quad']] = None
+        self.depth = depth
+
+    def contains(self, x: float, y: float) -> bool:
+        return self.x_min <= x <= self.x_max and self.y_min <= y <= self.y_max
+
+    def child_for(self, x: float, y: float) -> '_Quad':
+        x_mid = (self.x_min + self.x_max) / 2
+        y_mid = (self.y_min + self.y_max) / 2
+        return self.children[(x > x_mid) + 2 * (y > y_mid)]
+
+    def squared_distance(self, x: float, y: float) -> float:
+        dx = max(self.x_min - x, 0, x - self.x_max)
+        dy = max(self.y_min - y, 0, y - self.y_max)
+        return dx * dx + dy * dy
+
+
+class QuadTree:
+    """ Point-region quadtree of node handles, supporting incremental insertion, removal & moving of points.
+
+    Leaves are split once they hold more than `bucket_size` points (unless they are already `max_depth` deep, which
+    only happens for many coincident points) and the root grows to cover points inserted outside of it. Leaves emptied
+    by removals are not merged back.
+    """
+    def __init__(self, bucket_size: int = 16, max_depth: int = 32) -> None:
+        self.bucket_size = bucket_size
+        self.max_depth = max_depth
+        self._root: Optional[_Quad] = None
+        self._leaf_of: dict[NodeHandle, _Quad] = {}
+
+    def __len__(self) -> int:
+        return len(self._leaf_of)
+
+    def __contains__(self, handle: NodeHandle) -> bool:
+        return handle in self._leaf_of
+
+    def insert(self, handle: NodeHandle, x: float, y: float):
+        assert handle not in self._leaf_of, f"Point {handle} is already in the tree"
+        if self._root is None:
+            self._root = _Quad(x - 0.5, y - 0.5, x + 0.5, y + 0.5, 0)
+        while not self._root.contains(x, y):
+            self.__grow_root(x, y)
+
+        quad = self._root
+        while quad.children is not None:
+            quad = quad.child_for(x, y)
+        quad.points[handle] = (x, y)
+        self._leaf_of[handle] = quad
+        if len(quad.points) > self.bucket_size and quad.depth < self.max_depth:
+            self.__split(quad)
+
+    def remove(self, handle: NodeHandle):
+        """ Raises KeyError if there is no such point in the tree. """
+        quad = self._leaf_of.pop(handle)
+        del quad.points[handle]
+
+    def move(self, handle: NodeHandle, x: float, y: float):
+        quad = self._leaf_of[handle]
+        if quad.contains(x, y):
+            quad.points[handle] = (x, y)
+        else:
+            self.remove(handle)
+            self.insert(handle, x, y)
+
+    def in_bbox(self, x_min: float, y_min: float, x_max: float, y_max: float) -> Iterator[NodeHandle]:
+        """ Generate handles of all points lying in given (closed) box. """
+        if self._root is None:
+            return
+        stack = [self._root]
+        while stack:
+            quad = stack.pop()
+            if quad.x_min > x_max or quad.x_max < x_min or quad.y_min > y_max or quad.y_max < y_min:
+                continue
+            if quad.children is not None:
+                stack.extend(quad.children)
+                continue
+            for handle, (x, y) in quad.points.items():
+                if x_min <= x <= x_max and y_min <= y <= y_max:
+                    yield handle
+
+    def nearest(self, x: float, y: float, predicate: Callable[[NodeHandle], bool] = None) -> Iterator[tuple[float, NodeHandle]]:
+        """ Generate (squared distance, handle) pairs of points in order of increasing distance from (x, y).
+
+        :param predicate: if specified, only points satisfying it are generated
+        """
+        if self._root is None:
+            return
+        # Entries are (squared distance, tiebreak, quad or None, handle or None)
+        tiebreak = it.count()
+        heap = [(self._root.squared_distance(x, y), next(tiebreak), self._root, None)]
+        while heap:
+            distance, _, quad, handle = heapq.heappop(heap)
+            if quad is None:
+                yield distance, handle
+                continue
+            if quad.children is not None:
+                for child in quad.children:
+                    heapq.heappush(heap, (child.squared_distance(x, y), next(tiebreak), child, None))
+                continue
+            for point_handle, (px, py) in quad.points.items():
+                if predicate is None or predicate(point_handle):
+                    heapq.heappush(heap, ((px - x) ** 2 + (py - y) ** 2, next(tiebreak), None, point_handle))
+
+    def __grow_root(self, x: float, y: float):
+        # Double the root towards the point, keeping the old root as one of the children
+        old = self._root
+        width, height = old.x_max - old.x_min, old.y_max - old.y_min
+        x_min = old.x_min - width if x < old.x_min else old.x_min
+        y_min = old.y_min - height if y < old.y_min else old.y_min
+        root = _Quad(x_min, y_min, x_min + 2 * width, y_min + 2 * height, 0)
+        self.__split(root)
+        index = (old.x_min > x_min) + 2 * (old.y_min > y_min)
+        root.children[index] = old
+        self._root = root
+        self.__deepen(old)
+
+    def __deepen(self, quad: _Quad):
+        quad.depth += 1
+        if quad.children is not None:
+            for child in quad.children:
+                self.__deepen(child)
+
+    def __split(self, quad: _Quad):
+        x_mid = (quad.x_min + quad.x_max) / 2
+        y_mid = (quad.y_min + quad.y_max) / 2
+        depth = quad.depth + 1
+        quad.children = [
+            _Quad(quad.x_min, quad.y_min, x_mid, y_mid, depth),
+            _Quad(x_mid, quad.y_min, quad.x_max, y_mid, depth),
+            _Quad(quad.x_min, y_mid, x_mid, quad.y_max, depth),
+            _Quad(x_mid, y_mid, quad.x_max, quad.y_max, depth),
+        ]
+        points, quad.points = quad.points, None
+        for handle, (x, y) in points.items():
+            child = quad.child_for(x, y)
+            child.points[handle] = (x, y)
+            self._leaf_of[handle] = child
+        for child in quad.children:
+            if len(child.points) > self.bucket_size and child.depth < self.max_depth:
+                self.__split(child)
@@ -0,0 +1,938 @@
+import itertools as it
+import os
+import weakref
+import networkx as nx
+import numpy as np
+from collections.abc import Set
+from operator import attrgetter, itemgetter
+from typing import Optional, Iterable, Iterator, Callable, NamedTuple, AbstractSet, KeysView
+from model import NodeHandle, NodeAttrs, EdgeAttrs, EdgeEndpoints
+
+
+# Codes under which labels / kinds are kept in ArrayStorage & in columns (see `NodeColumns`); the index in the tuple is the code
+LABEL_CODES = ('v', 'q', 'p')
+KIND_CODES = ('e', 'q', 'p')
+# Flags are kept as int8: 0 - False, 1 - True, 2 - None
+FLAG_CODES = (False, True, None)
+NO_ELEMENT = -1
+
+
+def flag_code(flag: Optional[bool]) -> int:
+    return 2 if flag is None else int(flag)
+
+
+class NodeColumns(NamedTuple):
+    """ Nodes kept column-wise, one row per node; labels & flags are kept as codes (see `LABEL_CODES` & `FLAG_CODES`). """
+    handle: np.ndarray  # int64
+    label: np.ndarray  # int8
+    x: np.ndarray  # float64
+    y: np.ndarray  # float64
+    flag: np.ndarray  # int8
+
+
+class EdgeColumns(NamedTuple):
+    """ Edges kept column-wise, one row per edge; kinds & flags are kept as codes (see `KIND_CODES` & `FLAG_CODES`). """
+    u: np.ndarray  # int64
+    v: np.ndarray  # int64
+    kind: np.ndarray  # int8
+    flag: np.ndarray  # int8
+    handle: np.ndarray  # int64, `EdgeAttrs.handle`
+
+
+class AttrIndex:
+    """ Label & flag index of nodes and kind & flag index of edges, answering `Graph` queries like
+    `Graph.nodes_with_label`. `Graph` notifies the index about every element added or removed; an element that gets
+    its attrs changed is removed before the change & added back after it.
+
+    Queries return live, read-only set-like views.
+    """
+    def node_added(self, handle: NodeHandle, attrs: NodeAttrs):
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def node_removed(self, handle: NodeHandle, attrs: NodeAttrs):
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def edge_added(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def edge_removed(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def columns_added(self, nodes: NodeColumns, edges: EdgeColumns):
+        """ Bulk variant of `node_added` & `edge_added`, for elements added with `GraphStorage.add_node_columns` &
+        `GraphStorage.add_edge_columns`.
+        """
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def nodes_with_label(self, label: str) -> AbstractSet[NodeHandle]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def nodes_with_label_and_flag(self, label: str, flag: Optional[bool]) -> AbstractSet[NodeHandle]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def edges_with_kind(self, kind: str) -> AbstractSet[EdgeEndpoints]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def edges_with_kind_and_flag(self, kind: str, flag: bool) -> AbstractSet[EdgeEndpoints]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+
+class DictAttrIndex(AttrIndex):
+    """ Default index, kept in dicts used as insertion-ordered sets, so that queries can return `keys()` views in O(1). """
+    def __init__(self) -> None:
+        self._nodes_by_label: dict[str, dict[NodeHandle, None]] = {}
+        self._nodes_by_label_flag: dict[tuple[str, Optional[bool]], dict[NodeHandle, None]] = {}
+        self._edges_by_kind: dict[str, dict[EdgeEndpoints, None]] = {}
+        self._edges_by_kind_flag: dict[tuple[str, bool], dict[EdgeEndpoints, None]] = {}
+
+    def node_added(self, handle: NodeHandle, attrs: NodeAttrs):
+        self._nodes_by_label.setdefault(attrs.label, {})[handle] = None
+        self._nodes_by_label_flag.setdefault((attrs.label, attrs.flag), {})[handle] = None
+
+    def node_removed(self, handle: NodeHandle, attrs: NodeAttrs):
+        del self._nodes_by_label[attrs.label][handle]
+        del self._nodes_by_label_flag[(attrs.label, attrs.flag)][handle]
+
+    def edge_added(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        key = EdgeEndpoints(handle_1, handle_2) if handle_1 <= handle_2 else EdgeEndpoints(handle_2, handle_1)
+        self._edges_by_kind.setdefault(attrs.kind, {})[key] = None
+        self._edges_by_kind_flag.setdefault((attrs.kind, attrs.flag), {})[key] = None
+
+    def edge_removed(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        key = EdgeEndpoints(handle_1, handle_2) if handle_1 <= handle_2 else EdgeEndpoints(handle_2, handle_1)
+        del self._edges_by_kind[attrs.kind][key]
+        del self._edges_by_kind_flag[(attrs.kind, attrs.flag)][key]
+
+    def columns_added(self, nodes: NodeColumns, edges: EdgeColumns):
+        # Whole columns are grouped at once, which is much cheaper than adding the elements one by one
+        for code, label in enumerate(LABEL_CODES):
+            with_label = nodes.label == code
+            if not with_label.any():
+                continue
+            self._nodes_by_label.setdefault(label, {}).update(dict.fromkeys(nodes.handle[with_label].tolist()))
+            flags = nodes.flag[with_label]
+            for flag_value, flag in enumerate(FLAG_CODES):
+                with_flag = flags == flag_value
+                if with_flag.any():
+                    self._nodes_by_label_flag.setdefault((label, flag), {}).update(
+                        dict.fromkeys(nodes.handle[with_label][with_flag].tolist()))
+
+        lower, upper = np.minimum(edges.u, edges.v), np.maximum(edges.u, edges.v)
+        for code, kind in enumerate(KIND_CODES):
+            of_kind = edges.kind == code
+            if not of_kind.any():
+                continue
+            # `_make` is noticeably cheaper than the constructor of the named tuple
+            keys = list(map(EdgeEndpoints._make, zip(lower[of_kind].tolist(), upper[of_kind].tolist())))
+            self._edges_by_kind.setdefault(kind, {}).update(dict.fromkeys(keys))
+            flags = edges.flag[of_kind]
+            for flag_value, flag in enumerate(FLAG_CODES):
+                with_flag = flags == flag_value
+                if with_flag.any():
+                    self._edges_by_kind_flag.setdefault((kind, flag), {}).update(
+                        dict.fromkeys(it.compress(keys, with_flag.tolist())))
+
+    def nodes_with_label(self, label: str) -> KeysView[NodeHandle]:
+        return self._nodes_by_label.setdefault(label, {}).keys()
+
+    def nodes_with_label_and_flag(self, label: str, flag: Optional[bool]) -> KeysView[NodeHandle]:
+        return self._nodes_by_label_flag.setdefault((label, flag), {}).keys()
+
+    def edges_with_kind(self, kind: str) -> KeysView[EdgeEndpoints]:
+        return self._edges_by_kind.setdefault(kind, {}).keys()
+
+    def edges_with_kind_and_flag(self, kind: str, flag: bool) -> KeysView[EdgeEndpoints]:
+        return self._edges_by_kind_flag.setdefault((kind, flag), {}).keys()
+
+
+class GraphStorage:
+    """ Structure `Graph` keeps its nodes & edges in. `Graph` maintains indexes, journals etc. on top of it,
+    so the storage is responsible only for keeping & looking up the data.
+
+    Edges are undirected; adding edge between already adjacent nodes replaces its attrs.
+    """
+    def create_attr_index(self) -> AttrIndex:
+        """ Returns the label & kind index for `Graph` to keep on top of the storage; storages that can answer the
+        queries from their own data return an index that needs no upkeep.
+        """
+        return DictAttrIndex()
+
+    def has_node(self, handle: NodeHandle) -> bool:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def add_node(self, handle: NodeHandle, attrs: NodeAttrs):
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def add_nodes(self, nodes: Iterable[tuple[NodeHandle, NodeAttrs]]):
+        """ Bulk variant of `add_node`; none of the nodes may be present already. """
+        for handle, attrs in nodes:
+            self.add_node(handle, attrs)
+
+    def remove_node(self, handle: NodeHandle):
+        """ Removes the node together with all of its edges. """
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def node_attrs(self, handle: NodeHandle) -> NodeAttrs:
+        """ Raises KeyError if there is no such node. """
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def nodes(self) -> Iterator[NodeHandle]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def nodes_with_attrs(self) -> Iterator[tuple[NodeHandle, NodeAttrs]]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def number_of_nodes(self) -> int:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def has_edge(self, handle_1: NodeHandle, handle_2: NodeHandle) -> bool:
+        return self.find_edge_attrs(handle_1, handle_2) is not None
+
+    def add_edge(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def add_edges(self, edges: Iterable[tuple[NodeHandle, NodeHandle, EdgeAttrs]]):
+        """ Bulk variant of `add_edge`; none of the edges may be present already. """
+        for handle_1, handle_2, attrs in edges:
+            self.add_edge(handle_1, handle_2, attrs)
+
+    def remove_edge(self, handle_1: NodeHandle, handle_2: NodeHandle):
+        """ Raises KeyError if there is no such edge. """
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def find_edge_attrs(self, handle_1: NodeHandle, handle_2: NodeHandle) -> Optional[EdgeAttrs]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def adjacent_edges(self, handle: NodeHandle) -> Iterator[tuple[NodeHandle, EdgeAttrs]]:
+        """ Generate (neighbour handle, attrs of the edge leading to it) pairs for given node. """
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def neighbours(self, handle: NodeHandle) -> Iterator[NodeHandle]:
+        return (neigh_handle for neigh_handle, _ in self.adjacent_edges(handle))
+
+    def degree(self, handle: NodeHandle) -> int:
+        return sum(1 for _ in self.neighbours(handle))
+
+    def edges(self) -> Iterator[tuple[NodeHandle, NodeHandle, EdgeAttrs]]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def number_of_edges(self) -> int:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def node_columns(self) -> NodeColumns:
+        """ Returns all nodes column-wise, e.g. to serialize them. """
+        handles, attrs = list(self.nodes()), [attrs for _, attrs in self.nodes_with_attrs()]
+        label_codes = {label: code for code, label in enumerate(LABEL_CODES)}
+        flag_codes = {flag: code for code, flag in enumerate(FLAG_CODES)}
+        return NodeColumns(
+            np.fromiter(handles, dtype=np.int64, count=len(handles)),
+            np.fromiter(map(label_codes.__getitem__, map(attrgetter('label'), attrs)), dtype=np.int8, count=len(attrs)),
+            np.fromiter(map(attrgetter('x'), attrs), dtype=np.float64, count=len(attrs)),
+            np.fromiter(map(attrgetter('y'), attrs), dtype=np.float64, count=len(attrs)),
+            np.fromiter(map(flag_codes.__getitem__, map(attrgetter('flag'), attrs)), dtype=np.int8, count=len(attrs)),
+        )
+
+    def edge_columns(self) -> EdgeColumns:
+        """ Returns all edges column-wise, e.g. to serialize them. """
+        edges = list(self.edges())
+        attrs = list(map(itemgetter(2), edges))
+        kind_codes = {kind: code for code, kind in enumerate(KIND_CODES)}
+        flag_codes = {flag: code for code, flag in enumerate(FLAG_CODES)}
+        return EdgeColumns(
+            np.fromiter(map(itemgetter(0), edges), dtype=np.int64, count=len(edges)),
+            np.fromiter(map(itemgetter(1), edges), dtype=np.int64, count=len(edges)),
+            np.fromiter(map(kind_codes.__getitem__, map(attrgetter('kind'), attrs)), dtype=np.int8, count=len(attrs)),
+            np.fromiter(map(flag_codes.__getitem__, map(attrgetter('flag'), attrs)), dtype=np.int8, count=len(attrs)),
+            np.fromiter(map(attrgetter('handle'), attrs), dtype=np.int64, count=len(attrs)),
+        )
+
+    def add_node_columns(self, columns: NodeColumns):
+        """ Bulk variant of `add_node` taking the nodes column-wise; none of the nodes may be present already. """
+        labels = np.array(LABEL_CODES, dtype=object)[columns.label].tolist()
+        flags = np.array(FLAG_CODES, dtype=object)[columns.flag].tolist()
+        self.add_nodes(zip(columns.handle.tolist(), map(NodeAttrs, labels, columns.x.tolist(), columns.y.tolist(), flags)))
+
+    def add_edge_columns(self, columns: EdgeColumns):
+        """ Bulk variant of `add_edge` taking the edges column-wise; none of the edges may be present already. """
+        kinds = np.array(KIND_CODES, dtype=object)[columns.kind].tolist()
+        flags = np.array(FLAG_CODES, dtype=object)[columns.flag].tolist()
+        self.add_edges(zip(columns.u.tolist(), columns.v.tolist(), map(EdgeAttrs, kinds, flags, columns.handle.tolist())))
+
+    def to_networkx(self, handles: Optional[Iterable[NodeHandle]] = None) -> nx.Graph:
+        """ Returns networkx graph with 'payload' attribute set for all nodes & edges (as expected by the
+        `graph.node_equality` & `graph.edge_equality`). If handles are given, returns subgraph induced by them.
+        """
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+
+class NetworkxStorage(GraphStorage):
+    """ Default storage, keeping the graph in `nx.Graph`. """
+    def __init__(self) -> None:
+        self._graph = nx.Graph()
+
+    def has_node(self, handle: NodeHandle) -> bool:
+        return self._graph.has_node(handle)
+
+    def add_node(self, handle: NodeHandle, attrs: NodeAttrs):
+        self._graph.add_node(handle, payload=attrs)
+
+    def add_nodes(self, nodes: Iterable[tuple[NodeHandle, NodeAttrs]]):
+        self._graph.add_nodes_from((handle, {'payload': attrs}) for handle, attrs in nodes)
+
+    def remove_node(self, handle: NodeHandle):
+        self._graph.remove_node(handle)
+
+    def node_attrs(self, handle: NodeHandle) -> NodeAttrs:
+        return self._graph.nodes[handle]['payload']
+
+    def nodes(self) -> Iterator[NodeHandle]:
+        return iter(self._graph.nodes)
+
+    def nodes_with_attrs(self) -> Iterator[tuple[NodeHandle, NodeAttrs]]:
+        return iter(self._graph.nodes(data='payload'))
+
+    def number_of_nodes(self) -> int:
+        return self._graph.number_of_nodes()
+
+    def has_edge(self, handle_1: NodeHandle, handle_2: NodeHandle) -> bool:
+        return self._graph.has_edge(handle_1, handle_2)
+
+    def add_edge(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        self._graph.add_edge(u_of_edge=handle_1, v_of_edge=handle_2, payload=attrs)
+
+    def add_edges(self, edges: Iterable[tuple[NodeHandle, NodeHandle, EdgeAttrs]]):
+        self._graph.add_edges_from((handle_1, handle_2, {'payload': attrs}) for handle_1, handle_2, attrs in edges)
+
+    def remove_edge(self, handle_1: NodeHandle, handle_2: NodeHandle):
+        self._graph.remove_edge(handle_1, handle_2)
+
+    def find_edge_attrs(self, handle_1: NodeHandle, handle_2: NodeHandle) -> Optional[EdgeAttrs]:
+        data = self._graph[handle_1].get(handle_2)
+        return data['payload'] if data is not None else None
+
+    def adjacent_edges(self, handle: NodeHandle) -> Iterator[tuple[NodeHandle, EdgeAttrs]]:
+        for neigh_handle, data in self._graph[handle].items():
+            yield neigh_handle, data['payload']
+
+    def neighbours(self, handle: NodeHandle) -> Iterator[NodeHandle]:
+        return iter(self._graph[handle])
+
+    def degree(self, handle: NodeHandle) -> int:
+        return len(self._graph._adj[handle])
+
+    def edges(self) -> Iterator[tuple[NodeHandle, NodeHandle, EdgeAttrs]]:
+        return iter(self._graph.edges(data='payload'))
+
+    def number_of_edges(self) -> int:
+        return self._graph.number_of_edges()
+
+    def to_networkx(self, handles: Optional[Iterable[NodeHandle]] = None) -> nx.Graph:
+        # No copy here, the graph (or view) is live
+        if handles is None:
+            return self._graph
+        return self._graph.subgraph(handles)
+
+
+class ArrayNodeAttrs(NodeAttrs):
+    """ `NodeAttrs` reading & writing through to the arrays of `ArrayStorage`. Once the node is removed from
+    the storage, it keeps copy of the last values.
+    """
+    def __init__(self, storage: 'ArrayStorage', handle: NodeHandle) -> None:
+        object.__setattr__(self, '_storage', storage)
+        object.__setattr__(self, '_row', handle)
+        object.__setattr__(self, '_detached', None)
+
+    def _detach(self):
+        values = (self.label, self.x, self.y, self.flag)
+        object.__setattr__(self, '_detached', values)
+
+    def __get(self, index: int, array_name: str):
+        if self._detached is not None:
+            return self._detached[index]
+        return getattr(self._storage, array_name)[self._row]
+
+    def __set(self, index: int, array_name: str, value):
+        if self._detached is not None:
+            detached = list(self._detached)
+            detached[index] = value
+            object.__setattr__(self, '_detached', tuple(detached))
+        else:
+            self._storage._write_node(self._row, array_name, value)
+
+    @property
+    def label(self) -> str:
+        code = self.__get(0, '_label')
+        return code if self._detached is not None else LABEL_CODES[code]
+
+    @label.setter
+    def label(self, value: str):
+        self.__set(0, '_label', value if self._detached is not None else LABEL_CODES.index(value))
+
+    @property
+    def x(self) -> float:
+        return float(self.__get(1, '_x'))
+
+    @x.setter
+    def x(self, value: float):
+        self.__set(1, '_x', value)
+
+    @property
+    def y(self) -> float:
+        return float(self.__get(2, '_y'))
+
+    @y.setter
+    def y(self, value: float):
+        self.__set(2, '_y', value)
+
+    @property
+    def flag(self) -> Optional[bool]:
+        code = self.__get(3, '_flag')
+        return code if self._detached is not None else FLAG_CODES[code]
+
+    @flag.setter
+    def flag(self, value: Optional[bool]):
+        self.__set(3, '_flag', value if self._detached is not None else flag_code(value))
+
+
+class ArrayEdgeAttrs(EdgeAttrs):
+    """ `EdgeAttrs` reading & writing through to the arrays of `ArrayStorage`, see `ArrayNodeAttrs`. """
+    def __init__(self, storage: 'ArrayStorage', edge_id: int) -> None:
+        object.__setattr__(self, '_storage', storage)
+        object.__setattr__(self, '_row', edge_id)
+        object.__setattr__(self, '_detached', None)
+
+    def _detach(self):
+        values = (self.kind, self.flag, self.handle)
+        object.__setattr__(self, '_detached', values)
+
+    def __get(self, index: int, array_name: str):
+        if self._detached is not None:
+            return self._detached[index]
+        return getattr(self._storage, array_name)[self._row]
+
+    def __set(self, index: int, array_name: str, value):
+        if self._detached is not None:
+            detached = list(self._detached)
+            detached[index] = value
+            object.__setattr__(self, '_detached', tuple(detached))
+        else:
+            self._storage._write_edge(self._row, array_name, value)
+
+    @property
+    def kind(self) -> str:
+        code = self.__get(0, '_edge_kind')
+        return code if self._detached is not None else KIND_CODES[code]
+
+    @kind.setter
+    def kind(self, value: str):
+        self.__set(0, '_edge_kind', value if self._detached is not None else KIND_CODES.index(value))
+
+    @property
+    def flag(self) -> bool:
+        code = self.__get(1, '_edge_flag')
+        return code if self._detached is not None else FLAG_CODES[code]
+
+    @flag.setter
+    def flag(self, value: bool):
+        self.__set(1, '_edge_flag', value if self._detached is not None else flag_code(value))
+
+    @property
+    def handle(self) -> int:
+        return int(self.__get(2, '_edge_handle'))
+
+    @handle.setter
+    def handle(self, value: int):
+        self.__set(2, '_edge_handle', value)
+
+
+class ArrayNodeSet(Set):
+    """ Live, read-only set of handles of the nodes of `ArrayStorage` with given label (& flag, unless it is None),
+    read straight from its arrays. Length & membership are O(1), iteration scans the label & flag arrays & yields
+    handles in insertion order, as `DictAttrIndex` does.
+    """
+    def __init__(self, storage: 'ArrayStorage', label_code: int, flag_code: Optional[int]) -> None:
+        self._storage = storage
+        self._label_code = label_code
+        self._flag_code = flag_code
+
+    def __len__(self) -> int:
+        counts = self._storage._node_counts[self._label_code]
+        return int(counts.sum() if self._flag_code is None else counts[self._flag_code])
+
+    def __contains__(self, handle) -> bool:
+        storage = self._storage
+        return (isinstance(handle, int) and 0 <= handle < len(storage._label) and storage._label[handle] == self._label_code
+                and (self._flag_code is None or storage._flag[handle] == self._flag_code))
+
+    def __iter__(self) -> Iterator[NodeHandle]:
+        return iter(self.__handles())
+
+    def __reversed__(self) -> Iterator[NodeHandle]:
+        return reversed(self.__handles())
+
+    def __handles(self) -> list[NodeHandle]:
+        if len(self) == 0:
+            return []
+        storage = self._storage
+        matching = storage._label == self._label_code
+        if self._flag_code is not None:
+            matching &= storage._flag == self._flag_code
+        handles = np.flatnonzero(matching)
+        return handles[np.argsort(storage._node_ticks[handles])].tolist()
+
+
+class ArrayEdgeSet(Set):
+    """ Live, read-only set of endpoints (smaller handle first) of the edges of `ArrayStorage` with given kind (& flag,
+    unless it is None), see `ArrayNodeSet`. Membership costs as much as looking the edge up.
+    """
+    def __init__(self, storage: 'ArrayStorage', kind_code: int, flag_code: Optional[int]) -> None:
+        self._storage = storage
+        self._kind_code = kind_code
+        self._flag_code = flag_code
+
+    def __len__(self) -> int:
+        counts = self._storage._edge_counts[self._kind_code]
+        return int(counts.sum() if self._flag_code is None else counts[self._flag_code])
+
+    def __contains__(self, key) -> bool:
+        attrs = self._storage.find_edge_attrs(*key)
+        return (attrs is not None and attrs.kind == KIND_CODES[self._kind_code]
+                and (self._flag_code is None or attrs.flag == FLAG_CODES[self._flag_code]))
+
+    def __iter__(self) -> Iterator[EdgeEndpoints]:
+        return iter(self.__endpoints())
+
+    def __reversed__(self) -> Iterator[EdgeEndpoints]:
+        return reversed(self.__endpoints())
+
+    def __endpoints(self) -> list[EdgeEndpoints]:
+        if len(self) == 0:
+            return []
+        storage = self._storage
+        rows = storage._edge_rows
+        matching = storage._edge_kind[:rows] == self._kind_code
+        if self._flag_code is not None:
+            matching &= storage._edge_flag[:rows] == self._flag_code
+        edge_ids = np.flatnonzero(matching)
+        edge_ids = edge_ids[np.argsort(storage._edge_ticks[edge_ids])]
+        u, v = storage._edge_u[edge_ids], storage._edge_v[edge_ids]
+        # `_make` is noticeably cheaper than the constructor of the named tuple
+        return list(map(EdgeEndpoints._make, zip(np.minimum(u, v).tolist(), np.maximum(u, v).tolist())))
+
+
+class ArrayAttrIndex(AttrIndex):
+    """ Index of `ArrayStorage`, answering the queries straight from its label, kind & flag arrays (see `ArrayNodeSet`
+    & `ArrayEdgeSet`), so it takes no memory of its own & needs no upkeep.
+    """
+    def __init__(self, storage: 'ArrayStorage') -> None:
+        self._storage = storage
+
+    def node_added(self, handle: NodeHandle, attrs: NodeAttrs):
+        pass
+
+    def node_removed(self, handle: NodeHandle, attrs: NodeAttrs):
+        pass
+
+    def edge_added(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        pass
+
+    def edge_removed(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        pass
+
+    def columns_added(self, nodes: NodeColumns, edges: EdgeColumns):
+        pass
+
+    def nodes_with_label(self, label: str) -> ArrayNodeSet:
+        return ArrayNodeSet(self._storage, LABEL_CODES.index(label), None)
+
+    def nodes_with_label_and_flag(self, label: str, flag: Optional[bool]) -> ArrayNodeSet:
+        return ArrayNodeSet(self._storage, LABEL_CODES.index(label), flag_code(flag))
+
+    def edges_with_kind(self, kind: str) -> ArrayEdgeSet:
+        return ArrayEdgeSet(self._storage, KIND_CODES.index(kind), None)
+
+    def edges_with_kind_and_flag(self, kind: str, flag: bool) -> ArrayEdgeSet:
+        return ArrayEdgeSet(self._storage, KIND_CODES.index(kind), flag_code(flag))
+
+
+class ArrayStorage(GraphStorage):
+    """ Compact storage keeping the graph in integer-indexed NumPy arrays.
+
+    Node attributes are kept in arrays indexed directly by node handle (handles are expected to be rather dense,
+    which is the case for automatically generated ones). Edges are kept in arrays indexed by edge id; ids of removed
+    edges are reused. Adjacency is kept in CSR format (`_indptr`, `_csr_neighbours` & `_csr_edges` with ids of incident
+    edges), with removed entries tombstoned & newly added edges appended to per-node overflow lists. Once the overflow
+    & tombstones grow too big, the CSR is rebuilt.
+
+    Attrs returned from the storage are views (`ArrayNodeAttrs`, `ArrayEdgeAttrs`) onto the arrays, while attrs passed
+    in are copied.
+    """
+    def __init__(self, node_capacity: int = 64, edge_capacity: int = 128) -> None:
+        self._label = np.full(node_capacity, NO_ELEMENT, dtype=np.int8)
+        self._x = np.zeros(node_capacity, dtype=np.float64)
+        self._y = np.zeros(node_capacity, dtype=np.float64)
+        self._flag = np.zeros(node_capacity, dtype=np.int8)
+        self._node_count = 0
+
+        self._edge_u = np.zeros(edge_capacity, dtype=np.int64)
+        self._edge_v = np.zeros(edge_capacity, dtype=np.int64)
+        self._edge_kind = np.full(edge_capacity, NO_ELEMENT, dtype=np.int8)
+        self._edge_flag = np.zeros(edge_capacity, dtype=np.int8)
+        self._edge_handle = np.zeros(edge_capacity, dtype=np.int64)
+        self._edge_rows = 0  # high-water mark of used edge ids
+        self._free_edges: list[int] = []
+        self._edge_count = 0
+
+        # For `ArrayAttrIndex`: numbers of nodes by label & flag code and of edges by kind & flag code, and ticks of the
+        # last change of the codes of every element, so that the index can list the elements in insertion order
+        # (an element whose label, kind or flag changes goes to the end, as it does in `DictAttrIndex`)
+        self._node_counts = np.zeros((len(LABEL_CODES), len(FLAG_CODES)), dtype=np.int64)
+        self._edge_counts = np.zeros((len(KIND_CODES), len(FLAG_CODES)), dtype=np.int64)
+        self._node_ticks = np.zeros(node_capacity, dtype=np.int64)
+        self._edge_ticks = np.zeros(edge_capacity, dtype=np.int64)
+        self._tick = 0
+
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._csr_neighbours = np.zeros(0, dtype=np.int64)
+        self._csr_edges = np.zeros(0, dtype=np.int64)
+        # node -> flat list of neighbour, edge id, neighbour, edge id... of its edges added since the last compaction;
+        # flat rather than a list of pairs, as a tuple per entry would take several times more memory than the entry
+        self._overflow: dict[NodeHandle, list[int]] = {}
+        self._overflow_size = 0
+        self._tombstones = 0
+
+        # Views handed out, so that they can be detached once their element is removed
+        self._node_views: weakref.WeakValueDictionary[NodeHandle, ArrayNodeAttrs] = weakref.WeakValueDictionary()
+        self._edge_views: weakref.WeakValueDictionary[int, ArrayEdgeAttrs] = weakref.WeakValueDictionary()
+
+    def create_attr_index(self) -> AttrIndex:
+        return ArrayAttrIndex(self)
+
+    def has_node(self, handle: NodeHandle) -> bool:
+        return 0 <= handle < len(self._label) and self._label[handle] != NO_ELEMENT
+
+    def add_node(self, handle: NodeHandle, attrs: NodeAttrs):
+        assert handle >= 0, "Array storage supports only non-negative node handles"
+        if handle >= len(self._label):
+            self.__grow_nodes(handle + 1)
+        label, flag = LABEL_CODES.index(attrs.label), flag_code(attrs.flag)
+        self._label[handle] = label
+        self._x[handle] = attrs.x
+        self._y[handle] = attrs.y
+        self._flag[handle] = flag
+        self._node_count += 1
+        self._node_counts[label, flag] += 1
+        self._node_ticks[handle] = self.__next_tick()
+
+    def add_nodes(self, nodes: Iterable[tuple[NodeHandle, NodeAttrs]]):
+        nodes = list(nodes)
+        self.add_node_columns(NodeColumns(
+            np.fromiter((handle for handle, _ in nodes), dtype=np.int64, count=len(nodes)),
+            np.fromiter((LABEL_CODES.index(attrs.label) for _, attrs in nodes), dtype=np.int8, count=len(nodes)),
+            np.fromiter((attrs.x for _, attrs in nodes), dtype=np.float64, count=len(nodes)),
+            np.fromiter((attrs.y for _, attrs in nodes), dtype=np.float64, count=len(nodes)),
+            np.fromiter((flag_code(attrs.flag) for _, attrs in nodes), dtype=np.int8, count=len(nodes)),
+        ))
+
+    def add_node_columns(self, columns: NodeColumns):
+        handles = columns.handle
+        if len(handles) == 0:
+            return
+        assert handles.min() >= 0, "Array storage supports only non-negative node handles"
+        if handles.max() >= len(self._label):
+            self.__grow_nodes(int(handles.max()) + 1)
+        self._label[handles] = columns.label
+        self._x[handles] = columns.x
+        self._y[handles] = columns.y
+        self._flag[handles] = columns.flag
+        self._node_count += len(handles)
+        np.add.at(self._node_counts, (columns.label, columns.flag), 1)
+        self._node_ticks[handles] = np.arange(self._tick, self._tick + len(handles))
+        self._tick += len(handles)
+
+    def remove_node(self, handle: NodeHandle):
+        if not self.has_node(handle):
+            raise KeyError(handle)
+        for _, edge_id in list(self.__incident_edges(handle)):
+            self.__remove_edge_id(edge_id)
+        self._overflow.pop(handle, None)
+        view = self._node_views.pop(handle, None)
+        if view is not None:
+            view._detach()
+        self._node_counts[self._label[handle], self._flag[handle]] -= 1
+        self._label[handle] = NO_ELEMENT
+        self._node_count -= 1
+
+    def node_attrs(self, handle: NodeHandle) -> NodeAttrs:
+        if not self.has_node(handle):
+            raise KeyError(handle)
+        view = self._node_views.get(handle)
+        if view is None:
+            view = ArrayNodeAttrs(self, handle)
+            self._node_views[handle] = view
+        return view
+
+    def nodes(self) -> Iterator[NodeHandle]:
+        return iter(np.flatnonzero(self._label != NO_ELEMENT).tolist())
+
+    def nodes_with_attrs(self) -> Iterator[tuple[NodeHandle, NodeAttrs]]:
+        return ((handle, self.node_attrs(handle)) for handle in self.nodes())
+
+    def number_of_nodes(self) -> int:
+        return self._node_count
+
+    def add_edge(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        assert self.has_node(handle_1) and self.has_node(handle_2), f"Attempt to add edge ({handle_1}, {handle_2}) between nonexistent nodes"
+        edge_id = self.__find_edge_id(handle_1, handle_2)
+        if edge_id is None:
+            self.__append_edge(handle_1, handle_2, attrs)
+            self.__compact_if_needed()
+        else:
+            self.__set_edge_payload(edge_id, attrs)
+
+    def add_edges(self, edges: Iterable[tuple[NodeHandle, NodeHandle, EdgeAttrs]]):
+        for handle_1, handle_2, attrs in edges:
+            assert self.has_node(handle_1) and self.has_node(handle_2), f"Attempt to add edge ({handle_1}, {handle_2}) between nonexistent nodes"
+            self.__append_edge(handle_1, handle_2, attrs)
+        self.__compact_if_needed()
+
+    def add_edge_columns(self, columns: EdgeColumns):
+        count = len(columns.u)
+        if count == 0:
+            return
+        endpoints = np.concatenate((columns.u, columns.v))
+        assert endpoints.min() >= 0 and endpoints.max() < len(self._label) and np.all(self._label[endpoints] != NO_ELEMENT), \
+            "Attempt to add edges between nonexistent nodes"
+        # Ids of removed edges are not reused here, the edges get consecutive ids past the high-water mark instead
+        start, end = self._edge_rows, self._edge_rows + count
+        if end > len(self._edge_kind):
+            self.__grow_edges(max(end, 2 * len(self._edge_kind)))
+        self._edge_u[start:end] = columns.u
+        self._edge_v[start:end] = columns.v
+        self._edge_kind[start:end] = columns.kind
+        self._edge_flag[start:end] = columns.flag
+        self._edge_handle[start:end] = columns.handle
+        self._edge_rows = end
+        self._edge_count += count
+        np.add.at(self._edge_counts, (columns.kind, columns.flag), 1)
+        self._edge_ticks[start:end] = np.arange(self._tick, self._tick + count)
+        self._tick += count
+        self.compact()
+
+    def remove_edge(self, handle_1: NodeHandle, handle_2: NodeHandle):
+        edge_id = self.__find_edge_id(handle_1, handle_2)
+        if edge_id is None:
+            raise KeyError((handle_1, handle_2))
+        self.__remove_edge_id(edge_id)
+        self.__compact_if_needed()
+
+    def find_edge_attrs(self, handle_1: NodeHandle, handle_2: NodeHandle) -> Optional[EdgeAttrs]:
+        edge_id = self.__find_edge_id(handle_1, handle_2)
+        return self.__edge_view(edge_id) if edge_id is not None else None
+
+    def adjacent_edges(self, handle: NodeHandle) -> Iterator[tuple[NodeHandle, EdgeAttrs]]:
+        for neigh_handle, edge_id in list(self.__incident_edges(handle)):
+            yield neigh_handle, self.__edge_view(edge_id)
+
+    def neighbours(self, handle: NodeHandle) -> Iterator[NodeHandle]:
+        return iter([neigh_handle for neigh_handle, _ in self.__incident_edges(handle)])
+
+    def degree(self, handle: NodeHandle) -> int:
+        return len(self.__incident_edges(handle))
+
+    def edges(self) -> Iterator[tuple[NodeHandle, NodeHandle, EdgeAttrs]]:
+        present = np.flatnonzero(self._edge_kind[:self._edge_rows] != NO_ELEMENT).tolist()
+        return ((int(self._edge_u[edge_id]), int(self._edge_v[edge_id]), self.__edge_view(edge_id)) for edge_id in present)
+
+    def number_of_edges(self) -> int:
+        return self._edge_count
+
+    def to_networkx(self, handles: Optional[Iterable[NodeHandle]] = None) -> nx.Graph:
+        graph = nx.Graph()
+        if handles is None:
+            graph.add_nodes_from((handle, {'payload': attrs}) for handle, attrs in self.nodes_with_attrs())
+            graph.add_edges_from((u, v, {'payload': attrs}) for u, v, attrs in self.edges())
+            return graph
+
+        handles = set(handles)
+        graph.add_nodes_from((handle, {'payload': self.node_attrs(handle)}) for handle in handles)
+        for handle in handles:
+            for neigh_handle, attrs in self.adjacent_edges(handle):
+                if neigh_handle in handles:
+                    graph.add_edge(handle, neigh_handle, payload=attrs)
+        return graph
+
+    def compact(self):
+        """ Rebuild the CSR adjacency, so that it contains all the edges & no tombstones. """
+        edge_ids = np.flatnonzero(self._edge_kind[:self._edge_rows] != NO_ELEMENT)
+        endpoints = np.concatenate((self._edge_u[edge_ids], self._edge_v[edge_ids]))
+        neighbours = np.concatenate((self._edge_v[edge_ids], self._edge_u[edge_ids]))
+        incident = np.concatenate((edge_ids, edge_ids))
+        order = np.argsort(endpoints, kind='stable')
+
+        counts = np.bincount(endpoints, minlength=len(self._label))
+        self._indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._indptr[1:])
+        self._csr_neighbours = neighbours[order].astype(np.int64)
+        self._csr_edges = incident[order].astype(np.int64)
+        self._overflow.clear()
+        self._overflow_size = 0
+        self._tombstones = 0
+
+    def node_columns(self) -> NodeColumns:
+        handles = np.flatnonzero(self._label != NO_ELEMENT)
+        return NodeColumns(handles.astype(np.int64), self._label[handles], self._x[handles], self._y[handles], self._flag[handles])
+
+    def edge_columns(self) -> EdgeColumns:
+        edge_ids = np.flatnonzero(self._edge_kind[:self._edge_rows] != NO_ELEMENT)
+        return EdgeColumns(self._edge_u[edge_ids], self._edge_v[edge_ids], self._edge_kind[edge_ids],
+                           self._edge_flag[edge_ids], self._edge_handle[edge_ids])
+
+    def _write_node(self, handle: NodeHandle, array_name: str, value):
+        """ Write through from `ArrayNodeAttrs`, keeping the data of `ArrayAttrIndex` up to date. """
+        if array_name not in ('_label', '_flag'):
+            getattr(self, array_name)[handle] = value
+            return
+        self._node_counts[self._label[handle], self._flag[handle]] -= 1
+        getattr(self, array_name)[handle] = value
+        self._node_counts[self._label[handle], self._flag[handle]] += 1
+        self._node_ticks[handle] = self.__next_tick()
+
+    def _write_edge(self, edge_id: int, array_name: str, value):
+        """ Write through from `ArrayEdgeAttrs`, keeping the data of `ArrayAttrIndex` up to date. """
+        if array_name not in ('_edge_kind', '_edge_flag'):
+            getattr(self, array_name)[edge_id] = value
+            return
+        self._edge_counts[self._edge_kind[edge_id], self._edge_flag[edge_id]] -= 1
+        getattr(self, array_name)[edge_id] = value
+        self._edge_counts[self._edge_kind[edge_id], self._edge_flag[edge_id]] += 1
+        self._edge_ticks[edge_id] = self.__next_tick()
+
+    def nbytes(self) -> int:
+        """ Returns number of bytes occupied by the arrays. """
+        arrays = (self._label, self._x, self._y, self._flag, self._edge_u, self._edge_v, self._edge_kind,
+                  self._edge_flag, self._edge_handle, self._indptr, self._csr_neighbours, self._csr_edges,
+                  self._node_ticks, self._edge_ticks)
+        return sum(array.nbytes for array in arrays)
+
+    def __append_edge(self, handle_1: NodeHandle, handle_2: NodeHandle, attrs: EdgeAttrs):
+        edge_id = self.__allocate_edge_id()
+        self._edge_u[edge_id] = handle_1
+        self._edge_v[edge_id] = handle_2
+        self._overflow.setdefault(handle_1, []).extend((handle_2, edge_id))
+        self._overflow.setdefault(handle_2, []).extend((handle_1, edge_id))
+        self._overflow_size += 2
+        self._edge_count += 1
+        self.__set_edge_payload(edge_id, attrs)
+
+    def __set_edge_payload(self, edge_id: int, attrs: EdgeAttrs):
+        if self._edge_kind[edge_id] != NO_ELEMENT:
+            self._edge_counts[self._edge_kind[edge_id], self._edge_flag[edge_id]] -= 1
+        kind, flag = KIND_CODES.index(attrs.kind), flag_code(attrs.flag)
+        self._edge_kind[edge_id] = kind
+        self._edge_flag[edge_id] = flag
+        self._edge_handle[edge_id] = attrs.handle
+        self._edge_counts[kind, flag] += 1
+        self._edge_ticks[edge_id] = self.__next_tick()
+
+    def __compact_if_needed(self):
+        # Rebuilding only once the overflow outgrows the edges count keeps the cost amortized O(1) per mutation
+        if self._overflow_size + self._tombstones > max(1024, self._edge_count):
+            self.compact()
+
+    def __incident_edges(self, handle: NodeHandle) -> list[tuple[NodeHandle, int]]:
+        """ Returns (neighbour, edge id) pairs for all edges of given node. """
+        overflow = self._overflow.get(handle, [])
+        incident = list(zip(overflow[::2], overflow[1::2]))
+        if handle + 1 < len(self._indptr):
+            start, end = self._indptr[handle], self._indptr[handle + 1]
+            if start != end:
+                csr = [pair for pair in zip(self._csr_neighbours[start:end].tolist(), self._csr_edges[start:end].tolist())
+                       if pair[1] != NO_ELEMENT]
+                return csr + incident
+        return incident
+
+    def __find_edge_id(self, handle_1: NodeHandle, handle_2: NodeHandle) -> Optional[int]:
+        if not self.has_node(handle_1):
+            return None
+        for neigh_handle, edge_id in self.__incident_edges(handle_1):
+            if neigh_handle == handle_2:
+                return edge_id
+        return None
+
+    def __edge_view(self, edge_id: int) -> ArrayEdgeAttrs:
+        view = self._edge_views.get(edge_id)
+        if view is None:
+            view = ArrayEdgeAttrs(self, edge_id)
+            self._edge_views[edge_id] = view
+        return view
+
+    def __remove_edge_id(self, edge_id: int):
+        for handle in (int(self._edge_u[edge_id]), int(self._edge_v[edge_id])):
+            overflow = self._overflow.get(handle)
+            position = next((i for i in range(1, len(overflow), 2) if overflow[i] == edge_id), None) if overflow else None
+            if position is not None:
+                del overflow[position - 1:position + 1]
+                self._overflow_size -= 1
+                continue
+            # Must be in the CSR then
+            start, end = self._indptr[handle], self._indptr[handle + 1]
+            position = start + int(np.flatnonzero(self._csr_edges[start:end] == edge_id)[0])
+            self._csr_edges[position] = NO_ELEMENT
+            self._tombstones += 1
+
+        view = self._edge_views.pop(edge_id, None)
+        if view is not None:
+            view._detach()
+        self._edge_counts[self._edge_kind[edge_id], self._edge_flag[edge_id]] -= 1
+        self._edge_kind[edge_id] = NO_ELEMENT
+        self._free_edges.append(edge_id)
+        self._edge_count -= 1
+
+    def __next_tick(self) -> int:
+        self._tick += 1
+        return self._tick - 1
+
+    def __allocate_edge_id(self) -> int:
+        if len(self._free_edges) > 0:
+            return self._free_edges.pop()
+        if self._edge_rows == len(self._edge_kind):
+            self.__grow_edges(2 * self._edge_rows)
+        self._edge_rows += 1
+        return self._edge_rows - 1
+
+    def __grow_nodes(self, min_capacity: int):
+        capacity = max(min_capacity, 2 * len(self._label))
+        self._label = self.__grown(self._label, capacity, NO_ELEMENT)
+        self._x = self.__grown(self._x, capacity, 0)
+        self._y = self.__grown(self._y, capacity, 0)
+        self._flag = self.__grown(self._flag, capacity, 0)
+        self._node_ticks = self.__grown(self._node_ticks, capacity, 0)
+
+    def __grow_edges(self, capacity: int):
+        self._edge_u = self.__grown(self._edge_u, capacity, 0)
+        self._edge_v = self.__grown(self._edge_v, capacity, 0)
+        self._edge_kind = self.__grown(self._edge_kind, capacity, NO_ELEMENT)
+        self._edge_flag = self.__grown(self._edge_flag, capacity, 0)
+        self._edge_handle = self.__grown(self._edge_handle, capacity, 0)
+        self._edge_ticks = self.__grown(self._edge_ticks, capacity, 0)
+
+    @staticmethod
+    def __grown(array: np.ndarray, capacity: int, fill_value) -> np.ndarray:
+        grown = np.full(capacity, fill_value, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+
+STORAGE_FACTORIES: dict[str, Callable[[], GraphStorage]] = {
+    'networkx': NetworkxStorage,
+    'array': ArrayStorage,
+}
+
+# Storage used by graphs created without explicitly specified one; can be selected with GRAPH_STORAGE env variable,
+# e.g. to run whole test suite against the array storage
+default_storage_factory: Callable[[], GraphStorage] = STORAGE_FACTORIES[os.environ.get('GRAPH_STORAGE', 'networkx')]
+
+
+def create_default_storage() -> GraphStorage:
+    return default_storage_factory()
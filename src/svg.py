@@ -0,0 +1,113 @@
+import math
+from pathlib import Path
+from typing import Iterator, Optional, TextIO
+from xml.sax.saxutils import escape
+from graph import Graph, HYPEREDGE_LABELS
+from model import NodeHandle
+from driver import FrameDriverDelegate
+
+
+# Streaming SVG writer; unlike `visualisation` it needs no plotting stack & keeps only a few numbers in memory
+# (besides the graph itself), whatever the size of the mesh
+
+# Node markers by label, centred at the origin, as in `visualisation.draw` with `newstyle`
+MARKERS = {
+    'v': '<circle id="v" r="4"/>',
+    'q': '<path id="q" d="M0,-5L4.33,2.5L-4.33,2.5Z"/>',
+    'p': '<path id="p" d="M0,5L4.33,-2.5L-4.33,-2.5Z"/>',
+}
+MARKED_COLOR = '#66bb6a'
+UNMARKED_COLOR = '#bdbdbd'
+
+
+class SvgCanvas:
+    """ Maps graph coordinates onto the SVG ones: (0, 0) is the top-left corner & y grows downwards. """
+    def __init__(self, graph: Graph, size: float, margin: float) -> None:
+        x_min = y_min = math.inf
+        x_max = y_max = -math.inf
+        for _, attrs in graph.storage.nodes_with_attrs():
+            x_min, x_max = min(x_min, attrs.x), max(x_max, attrs.x)
+            y_min, y_max = min(y_min, attrs.y), max(y_max, attrs.y)
+        if x_min > x_max:
+            x_min = x_max = y_min = y_max = 0.0
+
+        extent = max(x_max - x_min, y_max - y_min)
+        self.scale = size / extent if extent > 0 else 1.0
+        self.x_min, self.y_max, self.margin = x_min, y_max, margin
+        self.width = (x_max - x_min) * self.scale + 2 * margin
+        self.height = (y_max - y_min) * self.scale + 2 * margin
+
+    def point(self, graph: Graph, handle: NodeHandle) -> tuple[str, str]:
+        attrs = graph[handle]
+        return f'{(attrs.x - self.x_min) * self.scale + self.margin:.2f}', f'{(self.y_max - attrs.y) * self.scale + self.margin:.2f}'
+
+    def segment(self, graph: Graph, u: NodeHandle, v: NodeHandle) -> str:
+        return 'M{},{}L{},{}'.format(*self.point(graph, u), *self.point(graph, v))
+
+
+def svg_frame(graph: Graph, title: Optional[str] = None, size: float = 1000, margin: float = 20,
+              node_labels: bool = False) -> Iterator[str]:
+    """ Generate SVG document with the graph piece by piece: 'e' edges solid, edges of hyperedges dotted & nodes
+    marked with shape by label & colour by flag. The graph is traversed twice (once for the bounding box), nothing
+    but the current element is kept in memory.
+
+    :param size: length (in px) of the longer side of the drawing
+    :param node_labels: whether to write handles next to the nodes; off by default, as it bloats big meshes
+    """
+    canvas = SvgCanvas(graph, size, margin)
+    yield (f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+           f'width="{canvas.width:.0f}" height="{canvas.height:.0f}" viewBox="0 0 {canvas.width:.2f} {canvas.height:.2f}">\n')
+    yield f'<defs>{"".join(MARKERS.values())}</defs>\n'
+    if title is not None:
+        yield f'<title>{escape(title)}</title>\n'
+
+    yield '<g stroke="#000000" stroke-width="1" fill="none">\n'
+    for u, v in graph.edges_with_kind('e'):
+        yield f'<path d="{canvas.segment(graph, u, v)}"/>\n'
+    yield '</g>\n<g stroke="#000000" stroke-width="1" stroke-dasharray="1,3" fill="none">\n'
+    for kind in HYPEREDGE_LABELS:
+        for u, v in graph.edges_with_kind(kind):
+            yield f'<path d="{canvas.segment(graph, u, v)}"/>\n'
+    yield '</g>\n'
+
+    for label in MARKERS:
+        for flag in (True, False, None):
+            handles = graph.nodes_with_label_and_flag(label, flag)
+            if len(handles) == 0:
+                continue
+            yield f'<g fill="{MARKED_COLOR if flag == True else UNMARKED_COLOR}">\n'
+            for handle in handles:
+                x, y = canvas.point(graph, handle)
+                yield f'<use xlink:href="#{label}" x="{x}" y="{y}"/>\n'
+            yield '</g>\n'
+
+    if node_labels:
+        yield '<g font-family="sans-serif" font-size="10" text-anchor="middle" dominant-baseline="central">\n'
+        for handle in graph.storage.nodes():
+            x, y = canvas.point(graph, handle)
+            yield f'<text x="{x}" y="{y}">{handle}</text>\n'
+        yield '</g>\n'
+    yield '</svg>\n'
+
+
+def write_svg(graph: Graph, file: Path | str | TextIO, title: Optional[str] = None, **kwargs):
+    """ Write the graph into given SVG file (or text stream), see `svg_frame` for the options. """
+    if isinstance(file, (str, Path)):
+        with open(file, 'w', encoding='utf-8') as stream:
+            stream.writelines(svg_frame(graph, title, **kwargs))
+    else:
+        file.writelines(svg_frame(graph, title, **kwargs))
+
+
+class SvgDriverDelegate(FrameDriverDelegate):
+    """ Saves the same frames as `visualisation.DrawingDriverDelegate`, but as SVG files written straight from the
+    graph, see `svg_frame`.
+    """
+    def __init__(self, savedir: Path, **svg_options) -> None:
+        """ :param svg_options: passed to `svg_frame` """
+        super().__init__()
+        self.savedir = savedir
+        self.svg_options = svg_options
+
+    def _draw_frame(self, graph: Graph, title: str, name: str):
+        write_svg(graph, self.savedir.joinpath(f'{name}.svg'), title, **self.svg_options)
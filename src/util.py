@@ -1,3 +1,5 @@
+import gc
+from contextlib import contextmanager
 from typing import Dict, Iterable
 import itertools as it
 from model import Node, NodeAttrs
@@ -40,3 +42,17 @@ def avg_point_from_node_attrs(node_attrs: Iterable[NodeAttrs]) -> tuple[float, f
     x = sum(map(lambda attrs: attrs.x, node_attrs)) / count
     y = sum(map(lambda attrs: attrs.y, node_attrs)) / count
     return (x, y)
+
+
+@contextmanager
+def gc_paused():
+    """ Suspend the cyclic garbage collector, e.g. while building millions of objects, none of which is garbage;
+    otherwise the collector would traverse all of them again & again as they are allocated.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
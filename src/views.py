@@ -0,0 +1,101 @@
+import itertools as it
+from collections.abc import Sequence
+from typing import Iterator, Sized, TYPE_CHECKING
+from model import Node, NodeHandle, Edge, EdgeEndpoints
+
+if TYPE_CHECKING:
+    from graph import Graph
+
+
+# Marks views not filtered by flag, as None is a valid flag value
+ANY_FLAG = object()
+
+
+class _IndexView(Sequence):
+    """ Live, read-only sequence of graph elements backed by the graph indexes; elements are materialized only when
+    accessed. Length & membership are O(1). Access by index goes through a list of the keys, built on the first access
+    after every mutation of the graph (see `Graph.generation`): O(1) as long as the graph does not change, but O(n)
+    if it is interleaved with mutations.
+    """
+    def __init__(self, graph: 'Graph', keys: tuple[str, ...], flag) -> None:
+        self._graph = graph
+        self._keys = keys
+        self._flag = flag
+        self._key_list: list = []
+        self._key_list_generation = None
+
+    def _buckets(self) -> list[Sized]:
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def _materialize(self, key):
+        raise NotImplementedError("This method must be overrided in subclasses")
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._buckets())
+
+    def __iter__(self) -> Iterator:
+        return map(self._materialize, it.chain.from_iterable(self._buckets()))
+
+    def __reversed__(self) -> Iterator:
+        return map(self._materialize, it.chain.from_iterable(reversed(bucket) for bucket in reversed(self._buckets())))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("view index out of range")
+        return self._materialize(self.__key_list()[index])
+
+    def __key_list(self) -> list:
+        if self._key_list_generation != self._graph.generation:
+            self._key_list = list(it.chain.from_iterable(self._buckets()))
+            self._key_list_generation = self._graph.generation
+        return self._key_list
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self._keys}, {len(self)} elements)'
+
+
+class NodeView(_IndexView):
+    """ View of the graph nodes with given labels (and flag), see `Graph.nodes_view`. Yields `Node` objects;
+    `handles` gives just the handles. Membership can be tested both for `Node` objects and for handles.
+    """
+    def _buckets(self) -> list[Sized]:
+        if self._flag is ANY_FLAG:
+            return [self._graph.nodes_with_label(label) for label in self._keys]
+        return [self._graph.nodes_with_label_and_flag(label, self._flag) for label in self._keys]
+
+    def _materialize(self, handle: NodeHandle) -> Node:
+        return Node(self._graph[handle], handle)
+
+    def handles(self) -> Iterator[NodeHandle]:
+        return it.chain.from_iterable(self._buckets())
+
+    def __contains__(self, item) -> bool:
+        handle = item.handle if isinstance(item, Node) else item
+        return any(handle in bucket for bucket in self._buckets())
+
+
+class EdgeView(_IndexView):
+    """ View of the graph edges of given kinds (and flag), see `Graph.edges_view`. Yields `Edge` objects with
+    endpoints ordered as in `edge_key`; `endpoints` gives just the keys. Membership can be tested both for `Edge`
+    objects and for (u, v) pairs, in any order.
+    """
+    def _buckets(self) -> list[Sized]:
+        if self._flag is ANY_FLAG:
+            return [self._graph.edges_with_kind(kind) for kind in self._keys]
+        return [self._graph.edges_with_kind_and_flag(kind, self._flag) for kind in self._keys]
+
+    def _materialize(self, key: EdgeEndpoints) -> Edge:
+        return Edge(key.u, key.v, self._graph.edge_attrs(key))
+
+    def endpoints(self) -> Iterator[EdgeEndpoints]:
+        return it.chain.from_iterable(self._buckets())
+
+    def __contains__(self, item) -> bool:
+        u, v = (item.u, item.v) if isinstance(item, Edge) else item
+        key = EdgeEndpoints(u, v) if u <= v else EdgeEndpoints(v, u)
+        return any(key in bucket for bucket in self._buckets())
@@ -0,0 +1,267 @@
+import itertools as it
+import math
+import matplotlib.pyplot as plt
+import networkx as nx
+import numpy as np
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from matplotlib.axes import Axes
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+from pathlib import Path
+from typing import Iterable, Optional, NamedTuple
+from graph import Graph
+from model import NodeHandle
+from production import Production
+from driver import FrameDriverDelegate, InputProvider
+
+
+# Plotting code of the package; the core modules (graph, productions, driver) import it lazily, if at all,
+# so that they can be used without the plotting stack
+
+
+class DrawingData(NamedTuple):
+    """ Everything needed to draw a graph, detached from it (plain values only), so that it can be drawn later or
+    in another process, see `AsyncDrawingDriverDelegate`.
+    """
+    # (handle, label, x, y, flag)
+    nodes: list[tuple[NodeHandle, str, float, float, Optional[bool]]]
+    # (u, v, kind, flag)
+    edges: list[tuple[NodeHandle, NodeHandle, str, bool]]
+
+    @staticmethod
+    def of(graph: Graph) -> 'DrawingData':
+        nodes = [(handle, attrs.label, attrs.x, attrs.y, attrs.flag) for handle, attrs in graph.storage.nodes_with_attrs()]
+        edges = [(u, v, attrs.kind, attrs.flag) for u, v, attrs in graph.storage.edges()]
+        return DrawingData(nodes, edges)
+
+
+def display_graph(graph: Graph, newstyle=False, **kwargs):
+    """ Draw the graph on the current matplotlib axes (or those passed as `ax`); see `Graph.display`. """
+    draw(DrawingData.of(graph), newstyle=newstyle, **kwargs)
+
+
+def draw(data: DrawingData, newstyle=False, **kwargs):
+    """ Draw the graph captured in `data`, see `display_graph`. """
+    nx_graph = nx.Graph()
+    nx_graph.add_nodes_from(handle for handle, *_ in data.nodes)
+    nx_graph.add_edges_from((u, v) for u, v, *_ in data.edges)
+    positions = {handle: (x, y) for handle, _, x, y, _ in data.nodes}
+    edge_labels = {(u, v): f'{flag}' for u, v, _, flag in data.edges}
+
+    if newstyle == True:
+        _draw_newstyle(data, nx_graph, positions, **kwargs)
+        return
+
+    node_labels = {handle: f'{label},{handle},{flag}' for handle, label, _, _, flag in data.nodes}
+    nx.draw_networkx(nx_graph, pos=positions, labels=node_labels, **kwargs)
+    nx.draw_networkx_edge_labels(nx_graph, pos=positions, edge_labels=edge_labels, **kwargs)
+
+
+def _draw_newstyle(data: DrawingData, nx_graph: nx.Graph, positions: dict, ax=None, **kwargs):
+    for node_type in 'vqp':
+        shape = 'o'
+        if node_type == 'q':
+            shape = '^'
+        elif node_type == 'p':
+            shape = 'v'
+
+        for flag_value in (True, False, None):
+            color = '#66bb6a' if flag_value == True else '#bdbdbd'
+            nodes_to_draw = [handle for handle, label, _, _, flag in data.nodes if label == node_type and flag == flag_value]
+            nx.draw_networkx_nodes(nx_graph, pos=positions, node_color=color, node_shape=shape, nodelist=nodes_to_draw, label=node_type, ax=ax)
+
+    nx.draw_networkx_labels(nx_graph, pos=positions, ax=ax)
+
+    e_edges = [(u, v) for u, v, kind, _ in data.edges if kind == 'e']
+    nx.draw_networkx_edges(nx_graph, pos=positions, edgelist=e_edges, ax=ax)
+
+    other_edges = [(u, v) for u, v, kind, _ in data.edges if kind in ('p', 'q')]
+    nx.draw_networkx_edges(nx_graph, pos=positions, edgelist=other_edges, style=':', ax=ax)
+
+
+def render(data: DrawingData, title: str, savefile: Path, newstyle: bool = True):
+    """ Draw the graph into an image file. Uses no pyplot state, so it is safe to call from worker threads & processes. """
+    fig = Figure()
+    plot = fig.subplots(nrows=1, ncols=1)
+    draw(data, newstyle=newstyle, ax=plot)
+    plot.set(title=title)
+    fig.tight_layout()
+    fig.savefig(savefile)
+
+
+class MeshData(NamedTuple):
+    """ Geometry of the mesh kept in arrays, for drawing big graphs with `draw_mesh`. Like `DrawingData` it is
+    detached from the graph.
+    """
+    # (number of 'e' edges, 2, 2) endpoint coordinates & (number of 'e' edges,) flags, i.e. whether edge is on boundary
+    segments: np.ndarray
+    segment_flags: np.ndarray
+    # Elements grouped by number of corners: (number of elements, corners, 2) coordinates of corners ordered around
+    # the centre & (number of elements,) flags, i.e. whether element is marked for breaking
+    polygons: list[np.ndarray]
+    polygon_flags: list[np.ndarray]
+
+    @staticmethod
+    def of(graph: Graph, max_edges: Optional[int] = None, max_elements: Optional[int] = None) -> 'MeshData':
+        """ :param max_edges: if there are more 'e' edges, only evenly spaced subset of that size (at most) is kept
+        :param max_elements: same as `max_edges`, but for the elements (hyperedges)
+        """
+        handles, coords = _node_coords(graph)
+
+        # Taking the edges from the flag index gives their flags without looking up attrs of every single one
+        boundary, inner = graph.edges_with_kind_and_flag('e', True), graph.edges_with_kind_and_flag('e', False)
+        flags = np.concatenate((np.ones(len(boundary), dtype=bool), np.zeros(len(inner), dtype=bool)))
+        endpoints = _int_array(it.chain(boundary, inner), 2)
+        kept = _decimated(len(endpoints), max_edges)
+        segments = coords[np.searchsorted(handles, endpoints[kept])]
+        segment_flags = flags[kept]
+
+        by_size: dict[int, list[tuple[NodeHandle, tuple[NodeHandle, ...], bool]]] = {}
+        centres = list(graph.hyperedges())
+        for centre in centres[_decimated(len(centres), max_elements)]:
+            hyperedge = graph.hyperedge(centre)
+            if len(hyperedge.corners) >= 3:
+                by_size.setdefault(len(hyperedge.corners), []).append((centre, hyperedge.corners, hyperedge.flag))
+
+        polygons, polygon_flags = [], []
+        for elements in by_size.values():
+            size = len(elements[0][1])
+            centres = coords[np.searchsorted(handles, np.fromiter((centre for centre, _, _ in elements), dtype=np.int64))]
+            corners = coords[np.searchsorted(handles, _int_array((corners for _, corners, _ in elements), size))]
+            # Elements are convex, so sorting corners by angle around the centre gives their boundary
+            angles = np.arctan2(corners[..., 1] - centres[:, None, 1], corners[..., 0] - centres[:, None, 0])
+            order = np.argsort(angles, axis=1)
+            polygons.append(np.take_along_axis(corners, order[..., None], axis=1))
+            polygon_flags.append(np.array([flag for _, _, flag in elements], dtype=bool))
+
+        return MeshData(segments, segment_flags, polygons, polygon_flags)
+
+
+def _node_coords(graph: Graph) -> tuple[np.ndarray, np.ndarray]:
+    """ Returns sorted handles of all nodes & (nodes, 2) array of their coordinates, in the same order. """
+    nodes = it.chain.from_iterable((handle, attrs.x, attrs.y) for handle, attrs in graph.storage.nodes_with_attrs())
+    array = np.fromiter(nodes, dtype=np.float64, count=3 * graph.storage.number_of_nodes()).reshape(-1, 3)
+    array = array[np.argsort(array[:, 0])]
+    return array[:, 0].astype(np.int64), array[:, 1:]
+
+
+def _int_array(rows: Iterable[tuple[int, ...]], width: int) -> np.ndarray:
+    """ Returns (rows, width) array of given tuples; much faster than `np.array` on a list of tuples. """
+    return np.fromiter(it.chain.from_iterable(rows), dtype=np.int64).reshape(-1, width)
+
+
+def _decimated(count: int, limit: Optional[int]) -> slice:
+    """ Returns slice selecting evenly spaced subset of at most `limit` out of `count` items. """
+    if limit is None or count <= limit:
+        return slice(None)
+    return slice(None, None, math.ceil(count / limit))
+
+
+def draw_mesh(mesh: MeshData, ax: Optional[Axes] = None):
+    """ Draw the mesh with a few artists only: elements as one collection of filled polygons per number of corners
+    (marked ones in green) & 'e' edges as one polyline per flag (boundary ones in black), its segments separated with
+    NaNs. There are no labels & no markers of nodes, so unlike `draw` it copes with meshes of millions of edges.
+    """
+    if ax is None:
+        ax = plt.gca()
+    for polygons, flags in zip(mesh.polygons, mesh.polygon_flags):
+        colors = np.where(flags[:, None], to_rgba('#66bb6a'), to_rgba('#eeeeee'))
+        ax.add_collection(PolyCollection(polygons, facecolors=colors, edgecolors='none'))
+    for flag, color in ((False, '#9e9e9e'), (True, '#000000')):
+        segments = mesh.segments[mesh.segment_flags == flag]
+        # Single path is drawn by far faster than a `LineCollection` of the same segments
+        points = np.full((len(segments), 3, 2), np.nan)
+        points[:, :2] = segments
+        ax.plot(points[..., 0].ravel(), points[..., 1].ravel(), color=color, linewidth=0.5)
+    ax.autoscale_view()
+    ax.set_aspect('equal')
+
+
+def display_mesh(graph: Graph, ax: Optional[Axes] = None, max_edges: Optional[int] = None, max_elements: Optional[int] = None):
+    """ Fast alternative of `display_graph` for big graphs, see `draw_mesh` & `MeshData.of`. """
+    draw_mesh(MeshData.of(graph, max_edges, max_elements), ax)
+
+
+class DrawingDriverDelegate(FrameDriverDelegate):
+    def __init__(self, savedir: Optional[Path], newstyleplot: bool = True) -> None:
+        super().__init__()
+        self.savedir = savedir
+        self.newstyle = newstyleplot
+
+    def on_production_success(self, prod: Production, graph: Graph):
+        print(f'Successfully applied {prod}')
+        super().on_production_success(prod, graph)
+
+    def _draw_frame(self, graph: Graph, title: str, name: str):
+        """ Draw the graph; if `savedir` is set, save it there as png & close the figure. """
+        fig, plot = plt.subplots(nrows=1, ncols=1)
+        graph.display(newstyle=self.newstyle, ax=plot)
+        plot.set(title=title)
+        if self.savedir is not None:
+            fig.tight_layout()
+            fig.savefig(self.savedir.joinpath(f'{name}.png'))
+            plt.close(fig)
+
+
+class AsyncDrawingDriverDelegate(DrawingDriverDelegate):
+    """ Saves the same frames as `DrawingDriverDelegate`, but renders them in a process pool, so that rendering does not
+    slow the derivation down: the rewriting loop only captures the `DrawingData` of the graph.
+
+    At most `max_pending` frames are rendered or waiting for it at a time; once the limit is reached, the delegate
+    waits for the oldest frame before handing out another one, so that memory stays bounded if rendering can not
+    keep up. All frames are flushed at the end of the execution, rendering errors are re-raised then.
+
+    The process pool outlives the execution, so that the delegate can be reused; use the delegate as a context manager
+    (or call `close`) to shut it down.
+    """
+    def __init__(self, savedir: Path, newstyleplot: bool = True, max_pending: int = 8,
+                 executor: Optional[Executor] = None) -> None:
+        """ :param executor: executor to render frames in; by default a process pool is created on first use
+                         & shut down by `close`
+        """
+        assert savedir is not None, "Frames rendered in background must be saved"
+        assert max_pending >= 1
+        super().__init__(savedir, newstyleplot)
+        self.max_pending = max_pending
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._pending: deque[Future] = deque()
+
+    def on_execution_end(self, graph: Graph, callables: Iterable[Production | InputProvider]):
+        super().on_execution_end(graph, callables)
+        self.flush()
+
+    def flush(self):
+        """ Wait until all frames handed out so far are saved. """
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self):
+        """ Flush the frames & shut down the process pool, if the delegate created it. """
+        try:
+            self.flush()
+        finally:
+            if self._owns_executor and self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self) -> 'AsyncDrawingDriverDelegate':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        """ Number of frames handed out for rendering that have not been collected yet. """
+        return len(self._pending)
+
+    def _draw_frame(self, graph: Graph, title: str, name: str):
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor()
+        data = DrawingData.of(graph)
+        self._pending.append(self._executor.submit(render, data, title, self.savedir.joinpath(f'{name}.png'), self.newstyle))